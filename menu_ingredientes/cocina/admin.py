@@ -1,6 +1,6 @@
 # cocina/admin.py
 from django.contrib import admin
-from .models import PedidoCocina
+from .models import PedidoCocina, ResumenCocinaHora
 
 @admin.register(PedidoCocina)
 class PedidoCocinaAdmin(admin.ModelAdmin):
@@ -9,3 +9,18 @@ class PedidoCocinaAdmin(admin.ModelAdmin):
     search_fields = ('cliente', 'descripcion', 'id_modulo3')
     readonly_fields = ('fecha_creacion', 'fecha_actualizacion')
     ordering = ('-fecha_creacion',)
+
+
+@admin.register(ResumenCocinaHora)
+class ResumenCocinaHoraAdmin(admin.ModelAdmin):
+    list_display = ('hora', 'descripcion', 'creados', 'listos', 'cancelados')
+    list_filter = ('hora',)
+    search_fields = ('descripcion',)
+    ordering = ('-hora',)
+
+    # El rollup lo mantienen las señales de cocina
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
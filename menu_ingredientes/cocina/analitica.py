@@ -0,0 +1,221 @@
+"""
+Analítica de cocina: tiempos de preparación, tickets por hora y cola.
+
+Los PedidoCocina se eliminan al entregarse, así que los reportes no se
+calculan sobre esa tabla sino sobre ResumenCocinaHora: una fila por hora y
+plato (descripción) que las señales de cocina actualizan en la misma
+transacción que el cambio:
+
+- alta de un ticket: `creados` en la hora de creación;
+- primera salida de la cola a LISTO (o ENTREGADO): `listos` y el tiempo de
+  preparación (hora_listo - fecha_creacion) en la hora de salida;
+- baja de un ticket que seguía en la cola: `cancelados`.
+
+Los percentiles no se pueden sumar entre filas, así que cada fila guarda un
+histograma de tiempos por cubetas fijas (BORDES); p50/p90/p99 de cualquier
+rango se obtienen sumando histogramas e interpolando dentro de la cubeta. La
+profundidad de la cola al final de cada hora es la suma acumulada de
+creados - listos - cancelados. Un reporte de un mes lee ~720 filas por plato
+en vez de recorrer los tickets.
+"""
+from bisect import bisect_left
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ResumenCocinaHora
+
+
+# Estados en los que el ticket sigue en la cola de cocina
+EN_COLA = ('CREADO', 'URGENTE', 'EN_PREPARACION')
+
+# Bordes superiores (segundos) de las cubetas del histograma: por minuto
+# hasta una hora, cada 5 minutos hasta tres horas y una cubeta final abierta
+BORDES = tuple(range(60, 3601, 60)) + tuple(range(3900, 10801, 300))
+
+PERCENTILES = (50, 90, 99)
+
+
+def hora_de(momento):
+    """Inicio de la hora (UTC) de `momento`"""
+    return momento.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def descripcion_de(pedido):
+    return (pedido.descripcion or '').strip()[:200]
+
+
+def segundos_preparacion(pedido):
+    # Sin hora_listo (salida directa a ENTREGADO) vale la hora del cambio
+    fin = pedido.hora_listo or pedido.fecha_actualizacion
+    return fin, max(0, int((fin - pedido.fecha_creacion).total_seconds()))
+
+
+def agregar_al_histograma(histograma, segundos):
+    histograma = list(histograma or [])
+    cubeta = bisect_left(BORDES, segundos)
+    histograma += [0] * (cubeta + 1 - len(histograma))
+    histograma[cubeta] += 1
+    return histograma
+
+
+# ---------- Registro (desde las señales) ----------
+
+def _acumular(hora, descripcion, creados=0, listos=0, cancelados=0, segundos=None):
+    with transaction.atomic():
+        fila, _ = ResumenCocinaHora.objects.select_for_update().get_or_create(
+            hora=hora, descripcion=descripcion
+        )
+        fila.creados += creados
+        fila.listos += listos
+        fila.cancelados += cancelados
+        if segundos is not None:
+            fila.segundos_total += segundos
+            fila.segundos_min = segundos if fila.segundos_min is None else min(fila.segundos_min, segundos)
+            fila.segundos_max = segundos if fila.segundos_max is None else max(fila.segundos_max, segundos)
+            fila.histograma = agregar_al_histograma(fila.histograma, segundos)
+        fila.save()
+
+
+def registrar_alta(pedido):
+    _acumular(hora_de(pedido.fecha_creacion), descripcion_de(pedido), creados=1)
+
+
+def registrar_salida(pedido, estado_previo):
+    """Transición de un ticket guardado; solo cuenta la primera salida de la cola"""
+    if estado_previo not in EN_COLA or pedido.estado in EN_COLA:
+        return
+    fin, segundos = segundos_preparacion(pedido)
+    _acumular(hora_de(fin), descripcion_de(pedido), listos=1, segundos=segundos)
+
+
+def registrar_baja(pedido, estado):
+    if estado in EN_COLA:
+        _acumular(hora_de(timezone.now()), descripcion_de(pedido), cancelados=1)
+
+
+# ---------- Lectura ----------
+
+def percentil(histograma, p):
+    """Percentil `p` en minutos de un histograma de BORDES, o None si está vacío"""
+    total = sum(histograma)
+    if not total:
+        return None
+    objetivo = total * p / 100
+    acumulado = 0
+    for cubeta, cantidad in enumerate(histograma):
+        if cantidad and acumulado + cantidad >= objetivo:
+            inicio = BORDES[cubeta - 1] if cubeta else 0
+            fin = BORDES[cubeta] if cubeta < len(BORDES) else inicio
+            segundos = inicio + (fin - inicio) * (objetivo - acumulado) / cantidad
+            return round(segundos / 60, 2)
+        acumulado += cantidad
+    return round(BORDES[-1] / 60, 2)
+
+
+def _sumar_histogramas(destino, histograma):
+    if len(destino) < len(histograma):
+        destino += [0] * (len(histograma) - len(destino))
+    for cubeta, cantidad in enumerate(histograma):
+        destino[cubeta] += cantidad
+    return destino
+
+
+class _Grupo:
+    __slots__ = ('creados', 'listos', 'cancelados', 'segundos', 'minimo', 'maximo', 'histograma')
+
+    def __init__(self):
+        self.creados = self.listos = self.cancelados = self.segundos = 0
+        self.minimo = self.maximo = None
+        self.histograma = []
+
+    def agregar(self, creados, listos, cancelados, segundos, minimo, maximo, histograma):
+        self.creados += creados
+        self.listos += listos
+        self.cancelados += cancelados
+        self.segundos += segundos
+        if minimo is not None:
+            self.minimo = minimo if self.minimo is None else min(self.minimo, minimo)
+        if maximo is not None:
+            self.maximo = maximo if self.maximo is None else max(self.maximo, maximo)
+        _sumar_histogramas(self.histograma, histograma or [])
+
+    def resultado(self, horas):
+        minutos = lambda segundos: None if segundos is None else round(segundos / 60, 2)
+        datos = {
+            'tickets': self.creados,
+            'listos': self.listos,
+            'cancelados': self.cancelados,
+            'tickets_por_hora': round(self.listos / horas, 2) if horas else 0,
+            'promedio_minutos': minutos(self.segundos / self.listos) if self.listos else None,
+            'minimo_minutos': minutos(self.minimo),
+            'maximo_minutos': minutos(self.maximo),
+        }
+        for p in PERCENTILES:
+            datos[f'p{p}_minutos'] = percentil(self.histograma, p)
+        return datos
+
+
+def rango(desde, hasta):
+    """Inicio y fin (exclusivo) de las fechas locales `desde`..`hasta`"""
+    inicio = timezone.make_aware(datetime.combine(desde, time.min))
+    fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+    return inicio, fin
+
+
+def reporte(desde, hasta):
+    """
+    Reporte de las fechas locales `desde`..`hasta` (inclusive) en dos
+    queries sobre el rollup: totales, desglose por plato y por hora del día,
+    y tickets y cola al final de cada hora.
+    """
+    inicio, fin = rango(desde, hasta)
+    filas = (
+        ResumenCocinaHora.objects.filter(hora__gte=inicio, hora__lt=fin)
+        .order_by('hora')
+        .values_list('hora', 'descripcion', 'creados', 'listos', 'cancelados',
+                     'segundos_total', 'segundos_min', 'segundos_max', 'histograma')
+    )
+    # Cola al empezar el rango: todo lo que entró y no salió antes
+    previo = ResumenCocinaHora.objects.filter(hora__lt=inicio).aggregate(
+        creados=Sum('creados'), listos=Sum('listos'), cancelados=Sum('cancelados')
+    )
+    cola = (previo['creados'] or 0) - (previo['listos'] or 0) - (previo['cancelados'] or 0)
+
+    total, por_plato, por_hora_dia, por_hora = _Grupo(), {}, {}, {}
+    for hora, descripcion, *valores in filas:
+        total.agregar(*valores)
+        por_plato.setdefault(descripcion, _Grupo()).agregar(*valores)
+        por_hora_dia.setdefault(timezone.localtime(hora).hour, _Grupo()).agregar(*valores)
+        por_hora.setdefault(hora, _Grupo()).agregar(*valores)
+
+    horas = int((fin - inicio).total_seconds() // 3600)
+    dias = (hasta - desde).days + 1
+    linea_tiempo = []
+    for hora, grupo in por_hora.items():
+        cola += grupo.creados - grupo.listos - grupo.cancelados
+        linea_tiempo.append({
+            'hora': timezone.localtime(hora).isoformat(),
+            'tickets': grupo.creados,
+            'listos': grupo.listos,
+            'cola': cola,
+        })
+
+    return {
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'total': total.resultado(horas),
+        'por_plato': [
+            {'plato': descripcion, **grupo.resultado(horas)}
+            for descripcion, grupo in sorted(por_plato.items(), key=lambda item: -item[1].listos)
+        ],
+        # Cada hora del día ocurre una vez por día del rango
+        'por_hora_del_dia': [
+            {'hora': hora, **grupo.resultado(dias)}
+            for hora, grupo in sorted(por_hora_dia.items())
+        ],
+        'por_hora': linea_tiempo,
+    }
+
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class CocinaConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'cocina'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,147 @@
+# cocina/eventos.py
+"""
+Canal de eventos en memoria para el monitor de cocina (Server-Sent Events).
+
+Cada conexión SSE abierta se suscribe con una asyncio.Queue propia. Las
+señales de PedidoCocina y Pedido (ver signals.py) publican deltas compactos
+(creado / estado / actualizado / eliminado) al confirmar la transacción, y el
+canal los reparte a todas las pantallas conectadas sin volver a consultar la
+base.
+
+Cada proceso reparte a sus propias conexiones. Con varios workers (o con un
+cambio hecho desde un worker sin pantallas conectadas) los eventos se
+publican en Redis pub/sub si EVENTOS_REDIS_URL está definida (por defecto
+REDIS_URL): cada proceso con suscriptores escucha el canal de Redis en un
+hilo y reparte lo que llega. Sin Redis el canal queda dentro del proceso, lo
+que solo alcanza con un único worker.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+
+def _url_redis():
+    return getattr(settings, 'EVENTOS_REDIS_URL', '')
+
+
+@lru_cache(maxsize=None)
+def _cliente_redis(url):
+    import redis  # Opcional: solo se necesita con EVENTOS_REDIS_URL
+    return redis.Redis.from_url(url)
+
+
+class CanalEventos:
+    """`nombre` identifica el canal en Redis; sin nombre el canal es solo local"""
+
+    def __init__(self, nombre=None, max_pendientes=200):
+        self.nombre = nombre
+        self._suscriptores = {}  # cola -> event loop de la conexión
+        self._lock = threading.Lock()
+        self._escucha = None  # hilo que recibe de Redis
+        self.max_pendientes = max_pendientes
+
+    def _redis(self):
+        return _url_redis() if self.nombre else ''
+
+    def suscribir(self):
+        cola = asyncio.Queue(maxsize=self.max_pendientes)
+        with self._lock:
+            self._suscriptores[cola] = asyncio.get_running_loop()
+            if self._redis() and (self._escucha is None or not self._escucha.is_alive()):
+                self._escucha = threading.Thread(
+                    target=self._escuchar_redis, args=(self._redis(),),
+                    name=f'eventos-{self.nombre}', daemon=True,
+                )
+                self._escucha.start()
+        return cola
+
+    def desuscribir(self, cola):
+        with self._lock:
+            self._suscriptores.pop(cola, None)
+
+    def publicar(self, evento):
+        """Entrega `evento` a todas las conexiones de todos los procesos; se puede llamar desde cualquier hilo"""
+        url = self._redis()
+        if url:
+            try:
+                _cliente_redis(url).publish(f'eventos:{self.nombre}', json.dumps(evento))
+                return
+            except Exception:
+                logger.exception("No se pudo publicar el evento en Redis; se reparte solo en este proceso")
+        self.repartir(evento)
+
+    def _escuchar_redis(self, url):
+        """Hilo del proceso: reparte lo publicado en Redis a las conexiones locales"""
+        while True:
+            try:
+                self._reenviar_redis(url)
+            except Exception:
+                logger.exception("Se perdió la suscripción a Redis del canal %s", self.nombre)
+            # Lo publicado mientras no había suscripción se perdió: las pantallas recargan
+            self.repartir({'tipo': 'resync'})
+            time.sleep(1)
+
+    def _reenviar_redis(self, url):
+        pubsub = _cliente_redis(url).pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(f'eventos:{self.nombre}')
+        for mensaje in pubsub.listen():
+            self.repartir(json.loads(mensaje['data']))
+
+    def repartir(self, evento):
+        """Entrega `evento` a las conexiones de este proceso"""
+        with self._lock:
+            destinos = list(self._suscriptores.items())
+        for cola, loop in destinos:
+            try:
+                loop.call_soon_threadsafe(self._encolar, cola, evento)
+            except RuntimeError:
+                # El event loop de esa conexión ya se cerró
+                self.desuscribir(cola)
+
+    @staticmethod
+    def _encolar(cola, evento):
+        try:
+            cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Pantalla que no alcanza a leer: descartar lo pendiente y pedirle que recargue
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait({'tipo': 'resync'})
+
+
+canal = CanalEventos('cocina')
+
+
+def respuesta_sse(canal, latido=15):
+    """
+    StreamingHttpResponse que reenvía los eventos de `canal` a una conexión,
+    con un comentario de keep-alive cada `latido` segundos sin eventos.
+    """
+
+    async def stream():
+        cola = canal.suscribir()
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=latido)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {json.dumps(evento)}\n\n"
+        finally:
+            canal.desuscribir(cola)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
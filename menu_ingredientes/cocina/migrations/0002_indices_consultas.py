@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cocina', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedidococina',
+            index=models.Index(condition=models.Q(('estado', 'ENTREGADO'), _negated=True), fields=['-fecha_creacion'], name='cocina_activo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidococina',
+            index=models.Index(fields=['estado', '-fecha_creacion'], name='cocina_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidococina',
+            index=models.Index(fields=['fecha_creacion'], name='cocina_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:34
+
+from django.db import migrations, models
+
+
+def cargar_resumen(apps, schema_editor):
+    """Rollup inicial desde los tickets que todavía existen"""
+    from cocina.analitica import EN_COLA, agregar_al_histograma, descripcion_de, hora_de, segundos_preparacion
+
+    PedidoCocina = apps.get_model('cocina', 'PedidoCocina')
+    ResumenCocinaHora = apps.get_model('cocina', 'ResumenCocinaHora')
+    filas = {}
+
+    def fila(hora, descripcion):
+        clave = (hora, descripcion)
+        if clave not in filas:
+            filas[clave] = ResumenCocinaHora(hora=hora, descripcion=descripcion, histograma=[])
+        return filas[clave]
+
+    for pedido in PedidoCocina.objects.iterator():
+        fila(hora_de(pedido.fecha_creacion), descripcion_de(pedido)).creados += 1
+        if pedido.estado not in EN_COLA:
+            fin, segundos = segundos_preparacion(pedido)
+            resumen = fila(hora_de(fin), descripcion_de(pedido))
+            resumen.listos += 1
+            resumen.segundos_total += segundos
+            if resumen.segundos_min is None or segundos < resumen.segundos_min:
+                resumen.segundos_min = segundos
+            if resumen.segundos_max is None or segundos > resumen.segundos_max:
+                resumen.segundos_max = segundos
+            resumen.histograma = agregar_al_histograma(resumen.histograma, segundos)
+    ResumenCocinaHora.objects.bulk_create(filas.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cocina', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenCocinaHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('descripcion', models.CharField(max_length=200)),
+                ('creados', models.PositiveIntegerField(default=0)),
+                ('listos', models.PositiveIntegerField(default=0)),
+                ('cancelados', models.PositiveIntegerField(default=0)),
+                ('segundos_total', models.BigIntegerField(default=0)),
+                ('segundos_min', models.PositiveIntegerField(blank=True, null=True)),
+                ('segundos_max', models.PositiveIntegerField(blank=True, null=True)),
+                ('histograma', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'Resumen de cocina por hora',
+                'verbose_name_plural': 'Resúmenes de cocina por hora',
+                'constraints': [models.UniqueConstraint(fields=('hora', 'descripcion'), name='resumen_cocina_hora_unico')],
+            },
+        ),
+        migrations.RunPython(cargar_resumen, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,19 @@
 # cocina/models.py
-from django.db import models
+from datetime import datetime, time, timedelta
+
+from django.db import models, transaction
+from django.utils import timezone
+
+class PedidoCocinaQuerySet(models.QuerySet):
+    def activos(self):
+        """Pedidos que siguen en el monitor (los cancelados se eliminan)"""
+        return self.exclude(estado='ENTREGADO')
+
+    def del_dia(self, fecha):
+        """Creados en la fecha local indicada; rango en vez de __date para usar el índice"""
+        inicio = timezone.make_aware(datetime.combine(fecha, time.min))
+        return self.filter(fecha_creacion__gte=inicio, fecha_creacion__lt=inicio + timedelta(days=1))
+
 
 class PedidoCocina(models.Model):
     class EstadoPedido(models.TextChoices):
@@ -28,10 +42,60 @@ class PedidoCocina(models.Model):
     # Se guarda SOLO cuando llega a LISTO
     hora_listo = models.DateTimeField(null=True, blank=True)
 
+    objects = PedidoCocinaQuerySet.as_manager()
+
     class Meta:
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Monitor y dashboards: pedidos activos, los más nuevos primero
+            # (parcial: lo aprovecha PostgreSQL; SQLite recorre cocina_fecha_idx)
+            models.Index(fields=['-fecha_creacion'], condition=~models.Q(estado='ENTREGADO'),
+                         name='cocina_activo_fecha_idx'),
+            # Filtros por estado (filtrados, entregados, tiempos)
+            models.Index(fields=['estado', '-fecha_creacion'], name='cocina_estado_fecha_idx'),
+            # Historial y reportes del día
+            models.Index(fields=['fecha_creacion'], name='cocina_fecha_idx'),
+        ]
         verbose_name = 'Pedido Cocina'
         verbose_name_plural = 'Pedidos Cocina'
 
     def __str__(self):
         return f"Mesa {self.mesa} - {self.cliente} - {self.get_estado_display()}"
+
+    def save(self, *args, **kwargs):
+        # Atómico junto con las señales (registro de cambios y outbox hacia Módulo 3)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class ResumenCocinaHora(models.Model):
+    """
+    Rollup por hora y plato de los tickets de cocina (ver analitica.py).
+    Se actualiza con cada alta, salida a LISTO o baja de un PedidoCocina.
+    """
+    # Inicio de la hora (UTC)
+    hora = models.DateTimeField()
+    descripcion = models.CharField(max_length=200)
+
+    # Tickets que entraron a la cola en esta hora
+    creados = models.PositiveIntegerField(default=0)
+    # Tickets que llegaron a LISTO en esta hora, con su tiempo de preparación
+    listos = models.PositiveIntegerField(default=0)
+    # Tickets que salieron de la cola sin llegar a LISTO (eliminados)
+    cancelados = models.PositiveIntegerField(default=0)
+
+    segundos_total = models.BigIntegerField(default=0)
+    segundos_min = models.PositiveIntegerField(null=True, blank=True)
+    segundos_max = models.PositiveIntegerField(null=True, blank=True)
+    # Conteo de tiempos de preparación por cubeta de analitica.BORDES
+    histograma = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hora', 'descripcion'], name='resumen_cocina_hora_unico'),
+        ]
+        verbose_name = 'Resumen de cocina por hora'
+        verbose_name_plural = 'Resúmenes de cocina por hora'
+
+    def __str__(self):
+        return f"{self.hora:%Y-%m-%d %H}h {self.descripcion}: {self.listos} listos"
@@ -0,0 +1,113 @@
+# cocina/signals.py
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from pedidos.models import Pedido, CambioPedido, OutboxPedido
+from pedidos.sincronizacion import registrar_cambio
+from pedidos import transiciones
+from pedidos.outbox import encolar_estado, ESTADOS_HACIA_PEDIDO
+from .models import PedidoCocina
+from .eventos import canal
+from . import analitica
+from .analitica import EN_COLA
+
+
+def _publicar(evento):
+    # Solo cambios confirmados: si la transacción se revierte no se anuncia nada
+    transaction.on_commit(lambda: canal.publicar(evento))
+
+
+def evento_cocina(tipo, pedido, desde=None):
+    return {
+        'tipo': tipo,
+        'modelo': 'cocina',
+        'id': pedido.pk,
+        'ref': pedido.id_modulo3 or str(pedido.pk),
+        'mesa': pedido.mesa,
+        'cliente': pedido.cliente,
+        'descripcion': pedido.descripcion,
+        'estado': pedido.estado,
+        'desde': desde,
+        'fecha_creacion': pedido.fecha_creacion.isoformat() if pedido.fecha_creacion else None,
+    }
+
+
+def evento_pedido(tipo, pedido, desde=None):
+    return {
+        'tipo': tipo,
+        'modelo': 'pedido',
+        'id': str(pedido.pk),
+        'mesa': pedido.mesa,
+        'cliente': pedido.cliente,
+        'plato': pedido.plato,
+        'estado': pedido.estado,
+        'desde': desde,
+    }
+
+
+# ---------- Estado anterior sin consultar la base ----------
+
+@receiver(post_init, sender=PedidoCocina)
+def recordar_estado(sender, instance, **kwargs):
+    # __dict__ para no disparar una query si el campo viene diferido
+    instance._estado_original = instance.__dict__.get('estado')
+
+
+@receiver(pre_save, sender=PedidoCocina)
+def preparar_cambio_estado(sender, instance, **kwargs):
+    instance._estado_previo = instance._estado_original
+    instance._estado_original = instance.estado
+
+
+# ---------- PedidoCocina ----------
+
+@receiver(post_save, sender=PedidoCocina)
+def pedido_cocina_guardado(sender, instance, created, **kwargs):
+    desde = instance._estado_previo
+    if created:
+        tipo = 'creado'
+    elif desde != instance.estado:
+        tipo = 'estado'
+    else:
+        tipo = 'actualizado'
+    registrar_cambio(CambioPedido.Modelo.COCINA, instance.pk)
+    _publicar(evento_cocina(tipo, instance, desde if tipo == 'estado' else None))
+    if tipo != 'actualizado':
+        transiciones.registrar(CambioPedido.Modelo.COCINA, instance.id_modulo3 or instance.pk,
+                               desde if tipo == 'estado' else None, instance.estado)
+
+    # Rollup de analítica (altas y salidas de la cola)
+    if created:
+        analitica.registrar_alta(instance)
+    analitica.registrar_salida(instance, EN_COLA[0] if created else desde)
+
+    # Outbox hacia Módulo 3 (los cambios que vienen del propio outbox no se devuelven)
+    if tipo == 'estado' and instance.id_modulo3 and not getattr(instance, '_sincronizando', False) \
+            and instance.estado in ESTADOS_HACIA_PEDIDO:
+        encolar_estado(OutboxPedido.Destino.PEDIDO, instance.id_modulo3, instance.estado)
+
+
+@receiver(post_delete, sender=PedidoCocina)
+def pedido_cocina_eliminado(sender, instance, **kwargs):
+    registrar_cambio(CambioPedido.Modelo.COCINA, instance.pk, CambioPedido.Accion.DELETE)
+    _publicar(evento_cocina('eliminado', instance))
+    analitica.registrar_baja(instance, instance.estado)
+
+
+# ---------- Pedido (Módulo 3) ----------
+
+@receiver(post_save, sender=Pedido)
+def pedido_guardado(sender, instance, created, **kwargs):
+    if created:
+        _publicar(evento_pedido('creado', instance))
+
+
+@receiver(transiciones.estado_cambiado, sender=Pedido)
+def pedido_cambio_estado(sender, instance, desde, **kwargs):
+    _publicar(evento_pedido('estado', instance, desde))
+
+
+@receiver(post_delete, sender=Pedido)
+def pedido_eliminado(sender, instance, **kwargs):
+    _publicar(evento_pedido('eliminado', instance))
@@ -0,0 +1,217 @@
+// ============================
+// Monitor de Cocina - Eventos en tiempo real (SSE)
+// ============================
+// Aplica sobre la página ya renderizada los deltas que publica
+// /cocina/api/eventos/ (creado / estado / actualizado / eliminado),
+// sin recargar ni volver a consultar la API. Tras un corte vuelve a pedir
+// las columnas a /cocina/api/monitor/<columna>/ (304 si nada cambió).
+// El tiempo transcurrido se calcula aquí con la hora del servidor.
+
+(function () {
+  const raiz = document.getElementById("monitor-cocina");
+  if (!raiz || !window.EventSource) return;
+
+  const UUID_VACIO = "00000000-0000-0000-0000-000000000000";
+  const ES_UUID = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
+
+  // Diferencia entre el reloj del servidor y el del navegador
+  let desfase = Number(raiz.dataset.ahora || Date.now()) - Date.now();
+  const ahora = () => Date.now() + desfase;
+
+  const columnas = {
+    pendientes: document.getElementById("col-pendientes"),
+    preparacion: document.getElementById("col-preparacion"),
+    listos: document.getElementById("col-listos"),
+  };
+
+  function columnaDeEstado(estado) {
+    if (estado === "CREADO" || estado === "URGENTE") return "pendientes";
+    if (estado === "EN_PREPARACION") return "preparacion";
+    if (estado === "LISTO") return "listos";
+    return null; // ENTREGADO / CANCELADO salen del monitor
+  }
+
+  function urlAccion(nombre, ref) {
+    return raiz.dataset[nombre].replace(UUID_VACIO, ref);
+  }
+
+  function formatearCreado(iso) {
+    if (!iso) return "—";
+    const f = new Date(iso);
+    if (isNaN(f)) return "—";
+    const dd = String(f.getDate()).padStart(2, "0");
+    const mm = String(f.getMonth() + 1).padStart(2, "0");
+    return `${dd}/${mm} ${f.toLocaleTimeString([], { hour: "2-digit", minute: "2-digit", hour12: false })}`;
+  }
+
+  function tiempoTranscurrido(iso) {
+    const f = new Date(iso);
+    if (!iso || isNaN(f)) return "—";
+    const minutos = Math.max(0, Math.floor((ahora() - f) / 60000));
+    if (minutos < 60) return `${minutos} min`;
+    return `${Math.floor(minutos / 60)}h ${minutos % 60}m`;
+  }
+
+  function elemento(tag, clase, texto) {
+    const el = document.createElement(tag);
+    if (clase) el.className = clase;
+    if (texto !== undefined) el.textContent = texto;
+    return el;
+  }
+
+  function boton(texto, clase, href) {
+    const a = elemento("a", `btn ${clase} btn-sm`, texto);
+    a.href = href;
+    return a;
+  }
+
+  function tarjeta(p, columna) {
+    const esPendiente = columna === "pendientes";
+    const color = esPendiente ? "danger" : "info";
+
+    const card = elemento("div", `card border-${color} mb-3`);
+    card.dataset.ref = p.ref;
+
+    const header = elemento("div", `card-header bg-${color} text-white`);
+    header.appendChild(elemento("strong", "", `Mesa ${p.mesa || "N/A"}`));
+    const hora = elemento(
+      "span", "float-end text-sm",
+      esPendiente ? formatearCreado(p.fecha_creacion) : tiempoTranscurrido(p.fecha_creacion)
+    );
+    if (!esPendiente) hora.dataset.desde = p.fecha_creacion;
+    header.appendChild(hora);
+
+    const body = elemento("div", "card-body");
+    body.appendChild(elemento("h5", "card-title", p.descripcion));
+    const texto = elemento("p", "card-text");
+    texto.append(
+      elemento("strong", "", "Cantidad:"), " 1", document.createElement("br"),
+      elemento("strong", "", "Cliente:"), ` ${p.cliente || "-"}`, document.createElement("br"),
+      elemento("strong", "", "ID:"), " ", elemento("code", "", p.ref.slice(0, 7) + "…")
+    );
+    body.appendChild(texto);
+
+    if (ES_UUID.test(p.ref)) {
+      if (esPendiente) {
+        body.appendChild(boton("👨‍🍳 Preparar", "btn-warning", urlAccion("urlPreparar", p.ref)));
+      } else {
+        const grupo = elemento("div", "btn-group");
+        grupo.append(
+          boton("✅ Listo", "btn-success", urlAccion("urlListo", p.ref)),
+          boton("❌ Sin ingredientes", "btn-danger", urlAccion("urlSinIngredientes", p.ref))
+        );
+        body.appendChild(grupo);
+      }
+    }
+
+    card.append(header, body);
+    return card;
+  }
+
+  function filaListo(p) {
+    const tr = elemento("tr", "table-light");
+    tr.dataset.ref = p.ref;
+    const mesa = elemento("td");
+    mesa.appendChild(elemento("strong", "", p.mesa || "-"));
+    const id = elemento("td");
+    id.appendChild(elemento("small")).appendChild(elemento("code", "", p.ref.slice(0, 7) + "…"));
+    const acciones = elemento("td");
+    if (ES_UUID.test(p.ref)) {
+      acciones.appendChild(boton("🚀 Entregar", "btn-primary", urlAccion("urlEntregar", p.ref)));
+    }
+    tr.append(
+      mesa,
+      elemento("td", "", p.descripcion),
+      elemento("td", "", p.cliente || "-"),
+      elemento("td", "", formatearCreado(p.fecha_creacion)),
+      id,
+      acciones
+    );
+    return tr;
+  }
+
+  function actualizarTotales() {
+    const contar = (col) => columnas[col].querySelectorAll("[data-ref]").length;
+    document.getElementById("total-pendientes").textContent = contar("pendientes");
+    document.getElementById("total-preparacion").textContent = contar("preparacion");
+    document.getElementById("total-listos").textContent = contar("listos");
+    Object.values(columnas).forEach((col) => {
+      const vacio = col.querySelector(".vacio");
+      if (vacio) vacio.style.display = col.querySelector("[data-ref]") ? "none" : "";
+    });
+  }
+
+  function aplicar(p) {
+    const anterior = raiz.querySelector(`[data-ref="${CSS.escape(p.ref)}"]`);
+    if (anterior) anterior.remove();
+
+    const columna = p.tipo === "eliminado" ? null : columnaDeEstado(p.estado);
+    if (columna) {
+      const nodo = columna === "listos" ? filaListo(p) : tarjeta(p, columna);
+      // Igual que el render del servidor: más recientes primero
+      const siguiente = Array.from(columnas[columna].querySelectorAll("[data-ref]"))[0];
+      columnas[columna].insertBefore(nodo, siguiente || columnas[columna].firstChild);
+    }
+    actualizarTotales();
+  }
+
+  function actualizarTiempos() {
+    raiz.querySelectorAll("[data-desde]").forEach((el) => {
+      el.textContent = tiempoTranscurrido(el.dataset.desde);
+    });
+  }
+
+  async function recargarColumnas() {
+    // Revalida con ETag: si la columna no cambió el servidor responde 304
+    const respuestas = await Promise.all(Object.keys(columnas).map(async (nombre) => {
+      const url = raiz.dataset.columnaUrl.replace("pendientes", nombre);
+      const res = await fetch(url, { cache: "no-cache", headers: { Accept: "application/json" } });
+      if (!res.ok) throw new Error("HTTP " + res.status);
+      return [nombre, await res.json()];
+    }));
+    respuestas.forEach(([nombre, datos]) => {
+      desfase = datos.ahora - Date.now();
+      const columna = columnas[nombre];
+      columna.querySelectorAll("[data-ref]").forEach((el) => el.remove());
+      const vacio = columna.querySelector(".vacio");
+      datos.pedidos.forEach((p) => {
+        const nodo = nombre === "listos" ? filaListo(p) : tarjeta(p, nombre);
+        columna.insertBefore(nodo, vacio);
+      });
+    });
+    actualizarTotales();
+    actualizarTiempos();
+  }
+
+  function resincronizar() {
+    recargarColumnas().catch(() => window.location.reload());
+  }
+
+  actualizarTiempos();
+  setInterval(actualizarTiempos, 30000);
+
+  let desconectado = false;
+  const fuente = new EventSource(raiz.dataset.eventosUrl);
+
+  fuente.onmessage = (e) => {
+    const evento = JSON.parse(e.data);
+    if (evento.tipo === "resync") {
+      resincronizar();
+    } else if (evento.modelo === "cocina") {
+      aplicar(evento);
+    }
+  };
+
+  fuente.onerror = () => {
+    if (fuente.readyState === EventSource.CLOSED) return; // servidor sin ASGI (503)
+    desconectado = true;
+  };
+
+  fuente.onopen = () => {
+    // Tras un corte se pudieron perder eventos: volver a pedir las columnas
+    if (desconectado) {
+      desconectado = false;
+      resincronizar();
+    }
+  };
+})();
@@ -0,0 +1,253 @@
+import asyncio
+import threading
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from pedidos.models import Pedido
+from . import analitica
+from .eventos import CanalEventos, canal
+from .models import PedidoCocina
+
+
+class EventosCocinaTests(TestCase):
+    """
+    Tests para los deltas que alimentan el monitor en tiempo real
+    """
+
+    def capturar(self, accion):
+        publicados = []
+        with patch.object(canal, 'publicar', publicados.append):
+            with self.captureOnCommitCallbacks(execute=True):
+                accion()
+        return publicados
+
+    def test_deltas_de_pedido_cocina(self):
+        pedido = PedidoCocina(mesa=3, cliente="Ana", descripcion="Pizza")
+
+        creado, = self.capturar(pedido.save)
+        self.assertEqual(creado['tipo'], 'creado')
+        self.assertEqual(creado['estado'], 'CREADO')
+
+        pedido = PedidoCocina.objects.get(pk=pedido.pk)
+        pedido.estado = 'EN_PREPARACION'
+        cambio, = self.capturar(pedido.save)
+        self.assertEqual((cambio['tipo'], cambio['desde'], cambio['estado']),
+                         ('estado', 'CREADO', 'EN_PREPARACION'))
+
+        eliminado, = self.capturar(pedido.delete)
+        self.assertEqual(eliminado['tipo'], 'eliminado')
+        self.assertEqual(eliminado['ref'], str(creado['id']))
+
+    def test_pedido_sin_cambio_de_estado_no_publica(self):
+        pedido = Pedido.objects.create(mesa="4", cliente="Luis", plato="1")
+        pedido = Pedido.objects.get(pk=pedido.pk)
+        pedido.cliente = "Luis M."
+
+        self.assertEqual(self.capturar(pedido.save), [])
+
+        pedido.estado = Pedido.Estado.EN_PREPARACION
+        cambio, = self.capturar(pedido.save)
+        self.assertEqual((cambio['modelo'], cambio['desde']), ('pedido', 'CREADO'))
+
+    def test_sin_commit_no_publica(self):
+        publicados = []
+        with patch.object(canal, 'publicar', publicados.append):
+            with self.captureOnCommitCallbacks(execute=False):
+                PedidoCocina.objects.create(mesa=1, cliente="Eva", descripcion="Sopa")
+        self.assertEqual(publicados, [])
+
+    def test_canal_entrega_eventos_desde_otro_hilo(self):
+        canal_prueba = CanalEventos()
+
+        async def escuchar():
+            cola = canal_prueba.suscribir()
+            hilo = threading.Thread(target=canal_prueba.publicar, args=({'tipo': 'creado'},))
+            hilo.start()
+            evento = await asyncio.wait_for(cola.get(), timeout=1)
+            hilo.join()
+            canal_prueba.desuscribir(cola)
+            return evento
+
+        self.assertEqual(asyncio.run(escuchar()), {'tipo': 'creado'})
+
+    def test_canal_entre_procesos_via_redis(self):
+        class RedisFalso:
+            def __init__(self):
+                self.publicados = []
+
+            def publish(self, nombre, datos):
+                self.publicados.append((nombre, datos))
+
+            def pubsub(self, **kwargs):
+                return self
+
+            def subscribe(self, nombre):
+                pass
+
+            def listen(self):
+                for nombre, datos in self.publicados:
+                    yield {'channel': nombre, 'data': datos}
+
+        redis_falso = RedisFalso()
+        canal_prueba = CanalEventos('prueba')
+        local = []
+        with override_settings(EVENTOS_REDIS_URL='redis://falso'), \
+                patch('cocina.eventos._cliente_redis', return_value=redis_falso), \
+                patch.object(canal_prueba, 'repartir', local.append):
+            canal_prueba.publicar({'tipo': 'creado'})
+            # Se publica en Redis, no directamente en este proceso
+            self.assertEqual(redis_falso.publicados, [('eventos:prueba', '{"tipo": "creado"}')])
+            self.assertEqual(local, [])
+
+            # El hilo de escucha de cada proceso lo reparte a sus conexiones
+            canal_prueba._reenviar_redis('redis://falso')
+        self.assertEqual(local, [{'tipo': 'creado'}])
+
+    def test_stream_requiere_asgi(self):
+        response = self.client.get(reverse('cocina_eventos'))
+        self.assertEqual(response.status_code, 503)
+
+    async def test_stream_entrega_eventos(self):
+        response = await self.async_client.get(reverse('cocina_eventos'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+
+        # La suscripción se registra al empezar el stream
+        siguiente = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        canal.publicar({'tipo': 'eliminado', 'modelo': 'cocina'})
+        self.assertEqual(
+            await asyncio.wait_for(siguiente, timeout=1),
+            b'data: {"tipo": "eliminado", "modelo": "cocina"}\n\n'
+        )
+        await stream.aclose()
+
+
+class HistorialPedidosTests(TestCase):
+    """
+    Tests para la descarga del historial del día
+    """
+
+    def test_historial_en_csv(self):
+        PedidoCocina.objects.create(mesa=2, cliente="Eva", descripcion="Sopa")
+
+        response = self.client.get(reverse('cocina_historial_pedidos'), {'formato': 'csv'})
+
+        self.assertTrue(response.streaming)
+        lineas = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertIn('Eva', lineas[1])
+
+
+class MonitorCocinaTests(TestCase):
+    """
+    Tests para el monitor: una query por página y columnas JSON con ETag
+    """
+
+    def setUp(self):
+        cache.clear()
+        for i, estado in enumerate(['CREADO', 'URGENTE', 'EN_PREPARACION', 'LISTO', 'ENTREGADO']):
+            PedidoCocina.objects.create(mesa=i + 1, cliente=f"C{i}", descripcion=f"Plato {i}", estado=estado,
+                                        id_modulo3=str(uuid.uuid4()))
+
+    def test_monitor_en_una_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cocina_monitor'))
+
+        self.assertEqual([p['cliente'] for p in response.context['pedidos_pendientes']], ['C1', 'C0'])
+        self.assertEqual(len(response.context['pedidos_en_preparacion']), 1)
+        self.assertEqual(len(response.context['pedidos_listos']), 1)
+        self.assertContains(response, 'data-desde=')
+
+    def test_columna_json_con_etag(self):
+        url = reverse('cocina_monitor_columna', args=['pendientes'])
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual([p['descripcion'] for p in datos['pedidos']], ['Plato 1', 'Plato 0'])
+        self.assertIn('ahora', datos)
+
+        # Sin cambios: 304 con solo la query del cursor
+        with self.assertNumQueries(1):
+            no_modificado = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(no_modificado.status_code, 304)
+
+        PedidoCocina.objects.create(mesa=9, cliente="Nuevo", descripcion="Sopa")
+        cambiado = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cambiado.status_code, 200)
+        self.assertEqual(len(cambiado.json()['pedidos']), 3)
+
+    def test_columna_desconocida(self):
+        response = self.client.get(reverse('cocina_monitor_columna', args=['entregados']))
+        self.assertEqual(response.status_code, 404)
+
+
+class AnaliticaCocinaTests(TestCase):
+    """
+    Tests para el rollup por hora y los reportes de tiempos de preparación
+    """
+
+    def preparar(self, descripcion, minutos):
+        pedido = PedidoCocina.objects.create(mesa=1, cliente="Ana", descripcion=descripcion)
+        pedido = PedidoCocina.objects.get(pk=pedido.pk)
+        pedido.estado = 'EN_PREPARACION'
+        pedido.save()
+        pedido.estado = 'LISTO'
+        pedido.hora_listo = pedido.fecha_creacion + timedelta(minutes=minutos)
+        pedido.save()
+        return pedido
+
+    def test_percentiles_por_plato_incluyen_entregados(self):
+        for minutos in (5, 10, 15, 20):
+            self.preparar("Pizza", minutos)
+        entregado = self.preparar("Sopa", 30)
+        # Entregar y eliminar (como cocina_entregar) no borra el tiempo del rollup
+        entregado.estado = 'ENTREGADO'
+        entregado.save()
+        entregado.delete()
+
+        hoy = timezone.localdate()
+        with self.assertNumQueries(2):
+            reporte = analitica.reporte(hoy - timedelta(days=1), hoy + timedelta(days=1))
+
+        total = reporte['total']
+        self.assertEqual((total['tickets'], total['listos'], total['cancelados']), (5, 5, 0))
+        self.assertEqual(total['minimo_minutos'], 5)
+        self.assertEqual(total['maximo_minutos'], 30)
+        pizza, sopa = reporte['por_plato']
+        self.assertEqual((pizza['plato'], pizza['listos']), ('Pizza', 4))
+        self.assertTrue(9 <= pizza['p50_minutos'] <= 11)
+        self.assertTrue(19 <= pizza['p99_minutos'] <= 20)
+        # Precisión de una cubeta (un minuto)
+        self.assertTrue(29 <= sopa['p50_minutos'] <= 30)
+
+    def test_cola_por_hora(self):
+        PedidoCocina.objects.create(mesa=1, cliente="Ana", descripcion="Pizza")
+        PedidoCocina.objects.create(mesa=2, cliente="Luis", descripcion="Pizza")
+        cancelado = PedidoCocina.objects.create(mesa=3, cliente="Eva", descripcion="Sopa")
+        cancelado.delete()
+
+        hoy = timezone.localdate()
+        reporte = analitica.reporte(hoy, hoy)
+
+        self.assertEqual(reporte['total']['cancelados'], 1)
+        self.assertEqual(reporte['por_hora'][-1]['cola'], 2)
+
+    def test_endpoints(self):
+        self.preparar("Pizza", 12)
+
+        response = self.client.get(reverse('cocina_estadisticas_tiempos'))
+        self.assertEqual(response.json()['cantidad_pedidos'], 1)
+        self.assertEqual(response.json()['promedio_minutos'], 12)
+
+        response = self.client.get(reverse('cocina_analitica'), {'desde': timezone.localdate().isoformat()})
+        self.assertEqual(response.json()['por_plato'][0]['plato'], 'Pizza')
+        self.assertEqual(self.client.get(reverse('cocina_analitica'), {'desde': 'ayer'}).status_code, 400)
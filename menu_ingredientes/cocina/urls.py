@@ -10,7 +10,12 @@ urlpatterns = [
     # API endpoints
     path('api/', include(router.urls)),
     
+    # Eventos en tiempo real (SSE)
+    path('api/eventos/', views.eventos, name='cocina_eventos'),
+    path('api/monitor/<str:columna>/', views.monitor_columna, name='cocina_monitor_columna'),
+    
     # Estadísticas
+    path('api/estadisticas/', views.analitica_cocina, name='cocina_analitica'),
     path('api/estadisticas/tiempos/', views.estadisticas_tiempos, name='cocina_estadisticas_tiempos'),
     
     # Web views
@@ -1,7 +1,13 @@
 # cocina/views.py
+from django.core.handlers.asgi import ASGIRequest
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils import timezone
-from django.db.models import Q, Avg, Min, Max, F, ExpressionWrapper, DurationField
+from django.db.models import Q, Case, When, Value, CharField
+from django.db.models.functions import Cast, Coalesce
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django import forms
 
 from rest_framework import viewsets, status
@@ -10,82 +16,116 @@ from rest_framework.response import Response
 
 from .models import PedidoCocina
 from .serializers import PedidoCocinaSerializer
+from .eventos import canal, respuesta_sse
+from . import analitica
+from pedidos.models import CambioPedido
+from pedidos.sincronizacion import leer_since, respuesta_delta, cursor_actual, con_cursor
+from mainApp import exportaciones
+
+# Segundos entre comentarios de keep-alive en el stream SSE
+INTERVALO_LATIDO = 15
+
+# Segundos que las filas de una versión de columna quedan en la caché
+CACHE_COLUMNA = 60
+
+
+# Columnas del monitor y los estados que muestra cada una
+COLUMNAS_MONITOR = {
+    'pendientes': ('CREADO', 'URGENTE'),
+    'preparacion': ('EN_PREPARACION',),
+    'listos': ('LISTO',),
+}
+
+# Solo las columnas que se dibujan
+CAMPOS_MONITOR = ('ref', 'id_modulo3', 'mesa', 'cliente', 'descripcion', 'estado', 'fecha_creacion')
+
+
+def columnas_monitor(columnas=COLUMNAS_MONITOR):
+    """
+    Pedidos activos repartidos por columna, los más nuevos primero, en una
+    sola query que ya trae la columna de cada fila y solo los campos que se
+    muestran. Retorna {columna: [dict, ...]}.
+    """
+    columna = Case(
+        *[When(estado__in=estados, then=Value(nombre)) for nombre, estados in columnas.items()],
+        output_field=CharField(),
+    )
+    filas = (
+        PedidoCocina.objects.activos()
+        .filter(estado__in=[e for estados in columnas.values() for e in estados])
+        .annotate(ref=Coalesce('id_modulo3', Cast('id', CharField())), columna=columna)
+        .order_by('-fecha_creacion')
+        .values('columna', *CAMPOS_MONITOR)
+    )
+    resultado = {nombre: [] for nombre in columnas}
+    for fila in filas:
+        resultado[fila.pop('columna')].append(fila)
+    return resultado
+
+
+def _ahora_ms():
+    return int(timezone.now().timestamp() * 1000)
 
 
 def monitor(request):
-    """Vista principal del monitor de cocina"""
-    from django.utils.timezone import localtime
-    from mainApp.models import Plato
-    import datetime
-    
-    def _nombre_plato(codigo: str) -> str:
-        try:
-            p = Plato.objects.get(pk=codigo)
-            return p.nombre
-        except Exception:
-            return codigo or "-"
-    
-    def _fmt_hhmm(iso_dt):
-        if not iso_dt:
-            return "—"
-        try:
-            dt = localtime(iso_dt)
-            return dt.strftime("%d/%m %H:%M")
-        except Exception:
-            return str(iso_dt)
-    
-    def _tiempo_transcurrido(creado):
-        if not creado:
-            return "—"
-        try:
-            ahora = datetime.datetime.now(datetime.timezone.utc)
-            delta = ahora - creado
-            minutos = int(delta.total_seconds() / 60)
-            if minutos < 60:
-                return f"{minutos} min"
-            horas = minutos // 60
-            mins = minutos % 60
-            return f"{horas}h {mins}m"
-        except Exception:
-            return "—"
-    
-    # Obtener pedidos de PedidoCocina agrupados por estado (solo activos)
-    pedidos_todos = PedidoCocina.objects.exclude(
-        estado__in=['ENTREGADO', 'CANCELADO']
-    ).order_by('-fecha_creacion')
-    
-    pedidos_pendientes = []
-    pedidos_en_preparacion = []
-    pedidos_listos = []
-    
-    for p in pedidos_todos:
-        p_dict = {
-            'id': p.id_modulo3 or str(p.id),
-            'mesa': p.mesa,
-            'cliente': p.cliente,
-            'plato_nombre': p.descripcion,
-            'cantidad': 1,  # PedidoCocina no tiene cantidad, asumir 1
-            'creado_str': _fmt_hhmm(p.fecha_creacion),
-            'tiempo_preparacion': _tiempo_transcurrido(p.fecha_creacion),
-            'estado': p.estado,
-        }
-        
-        if p.estado in ['CREADO', 'URGENTE']:
-            pedidos_pendientes.append(p_dict)
-        elif p.estado == 'EN_PREPARACION':
-            pedidos_en_preparacion.append(p_dict)
-        elif p.estado == 'LISTO':
-            pedidos_listos.append(p_dict)
-    
+    """
+    Vista principal del monitor de cocina. El tiempo transcurrido lo calcula
+    el navegador a partir de `ahora` (hora del servidor), así que la página
+    no formatea nada por fila.
+    """
+    columnas = columnas_monitor()
     context = {
-        'pedidos_pendientes': pedidos_pendientes,
-        'pedidos_en_preparacion': pedidos_en_preparacion,
-        'pedidos_listos': pedidos_listos,
+        'pedidos_pendientes': columnas['pendientes'],
+        'pedidos_en_preparacion': columnas['preparacion'],
+        'pedidos_listos': columnas['listos'],
+        'ahora_ms': _ahora_ms(),
     }
-    
     return render(request, 'cocina/monitor.html', context)
 
 
+def monitor_columna(request, columna):
+    """
+    Una columna del monitor como JSON, para resincronizar sin recargar la
+    página. La versión es el cursor de CambioPedido: mientras ningún pedido
+    cambie el cliente recibe 304 y el servidor no vuelve a consultar los
+    pedidos (las filas quedan en la caché por versión).
+    """
+    if columna not in COLUMNAS_MONITOR:
+        raise Http404("Columna desconocida")
+
+    cursor = cursor_actual()
+    # Débil: `ahora` cambia en cada respuesta aunque las filas sean las mismas
+    etag = f'W/"monitor-{columna}-{cursor}"'
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        return no_modificado
+
+    pedidos = cache.get_or_set(
+        f'monitor_cocina:{columna}:{cursor}',
+        lambda: columnas_monitor({columna: COLUMNAS_MONITOR[columna]})[columna],
+        CACHE_COLUMNA,
+    )
+    response = JsonResponse({'columna': columna, 'cursor': cursor, 'ahora': _ahora_ms(), 'pedidos': pedidos})
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+async def eventos(request):
+    """
+    Stream Server-Sent Events con los cambios de pedidos (ver eventos.py).
+
+    Necesita un servidor ASGI (start.sh sirve la app con gunicorn + uvicorn):
+    bajo WSGI (runserver) una respuesta que no termina bloquearía un worker
+    completo, así que se responde 503 y el monitor sigue funcionando con
+    recargas manuales.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("El stream de eventos requiere un servidor ASGI", status=503)
+
+    return respuesta_sse(canal, INTERVALO_LATIDO)
+
+
 class PedidoCocinaViewSet(viewsets.ModelViewSet):
     """API ViewSet para gestionar pedidos en cocina"""
     queryset = PedidoCocina.objects.all().order_by('-fecha_creacion')
@@ -100,6 +140,18 @@ class PedidoCocinaViewSet(viewsets.ModelViewSet):
         "ENTREGADO": []
     }
 
+    def list(self, request, *args, **kwargs):
+        """Listado completo, o solo lo cambiado desde ?since=<cursor> (ver pedidos/sincronizacion.py)"""
+        since = leer_since(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if since is not None:
+            return respuesta_delta(
+                queryset, CambioPedido.Modelo.COCINA, since,
+                self.get_serializer_class(), self.get_serializer_context()
+            )
+        cursor = cursor_actual()
+        return con_cursor(super().list(request, *args, **kwargs), cursor)
+
     def update(self, request, *args, **kwargs):
         """Actualizar pedido con validación de transiciones de estado"""
         instance = self.get_object()
@@ -120,36 +172,10 @@ class PedidoCocinaViewSet(viewsets.ModelViewSet):
         if nuevo_estado == "LISTO" and instance.hora_listo is None:
             instance.hora_listo = timezone.now()
 
-        instance.save()
-
-        # Notificar al módulo 03 si es necesario
-        if nuevo_estado == "LISTO":
-            try:
-                self._notificar_modulo3_listo(instance)
-            except Exception as e:
-                return Response(
-                    {
-                        "pedido": PedidoCocinaSerializer(instance).data,
-                        "warning": f"Pedido pasó a LISTO pero no se pudo notificar a Módulo 03: {str(e)}"
-                    },
-                    status=status.HTTP_200_OK
-                )
+        instance.save()  # el outbox refleja el cambio en el pedido del módulo 03
 
         return Response(PedidoCocinaSerializer(instance).data)
 
-    def _notificar_modulo3_listo(self, pedido):
-        """Notifica al módulo 3 que el pedido está listo"""
-        # Importar aquí para evitar circular imports
-        from pedidos.models import Pedido as PedidoM3
-        
-        if pedido.id_modulo3:
-            try:
-                pedido_m3 = PedidoM3.objects.get(id=pedido.id_modulo3)
-                if pedido_m3.estado != PedidoM3.Estado.LISTO:
-                    pedido_m3.marcar_listo()
-            except PedidoM3.DoesNotExist:
-                pass
-
     @action(detail=False, methods=['get'])
     def filtrados(self, request):
         """Filtrar pedidos por estado"""
@@ -259,9 +285,16 @@ def editar_pedido(request, pedido_id):
 
 
 def historial_pedidos(request):
-    """Vista de historial de pedidos del día"""
+    """Vista de historial de pedidos del día; con ?formato=csv|ndjson lo descarga en streaming"""
     hoy = timezone.localdate()
-    pedidos = PedidoCocina.objects.filter(fecha_creacion__date=hoy).order_by('fecha_creacion')
+    formato = request.GET.get("formato")
+    if formato:
+        try:
+            return exportaciones.respuesta("cocina", formato, hoy, hoy)
+        except ValidationError as e:
+            return HttpResponseBadRequest(e.messages[0])
+
+    pedidos = PedidoCocina.objects.del_dia(hoy).order_by('fecha_creacion')
 
     registros = []
     for p in pedidos:
@@ -277,36 +310,48 @@ def historial_pedidos(request):
     return render(request, "cocina/historial_pedidos.html", contexto)
 
 
-@api_view(["GET"])
-def estadisticas_tiempos(request):
-    """Estadísticas de tiempos de preparación de pedidos"""
-    pedidos = PedidoCocina.objects.filter(estado="LISTO", fecha_actualizacion__isnull=False)
-
-    if not pedidos.exists():
-        return Response({
-            "promedio_minutos": 0,
-            "minimo_minutos": 0,
-            "maximo_minutos": 0,
-            "cantidad_pedidos": 0
-        }, status=status.HTTP_200_OK)
-
-    diff = ExpressionWrapper(
-        F("fecha_actualizacion") - F("fecha_creacion"),
-        output_field=DurationField()
-    )
-
-    datos = pedidos.aggregate(
-        promedio=Avg(diff),
-        minimo=Min(diff),
-        maximo=Max(diff),
-    )
+def _rango_fechas(request):
+    """?desde / ?hasta (YYYY-MM-DD, fechas locales); por defecto hoy"""
+    hoy = timezone.localdate()
+    desde = exportaciones.leer_fecha(request.query_params.get("desde"), "desde") or hoy
+    hasta = exportaciones.leer_fecha(request.query_params.get("hasta"), "hasta") or max(desde, hoy)
+    if desde > hasta:
+        raise ValidationError("desde no puede ser posterior a hasta")
+    return desde, hasta
 
-    def to_minutes(td):
-        return round(td.total_seconds() / 60, 2) if td else 0
 
+@api_view(["GET"])
+def estadisticas_tiempos(request):
+    """
+    Tiempos de preparación (creación → LISTO) de los tickets que salieron de
+    la cola en el rango ?desde..?hasta, incluidos los ya entregados
+    """
+    try:
+        desde, hasta = _rango_fechas(request)
+    except ValidationError as e:
+        return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+    total = analitica.reporte(desde, hasta)["total"]
     return Response({
-        "promedio_minutos": to_minutes(datos["promedio"]),
-        "minimo_minutos": to_minutes(datos["minimo"]),
-        "maximo_minutos": to_minutes(datos["maximo"]),
-        "cantidad_pedidos": pedidos.count(),
+        "promedio_minutos": total["promedio_minutos"] or 0,
+        "minimo_minutos": total["minimo_minutos"] or 0,
+        "maximo_minutos": total["maximo_minutos"] or 0,
+        "p50_minutos": total["p50_minutos"] or 0,
+        "p90_minutos": total["p90_minutos"] or 0,
+        "p99_minutos": total["p99_minutos"] or 0,
+        "cantidad_pedidos": total["listos"],
     }, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+def analitica_cocina(request):
+    """
+    Reporte de cocina sobre el rollup por hora (ver analitica.py): p50/p90/p99,
+    tickets por hora y cola, por plato y por hora del día
+    GET /cocina/api/estadisticas/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+    """
+    try:
+        desde, hasta = _rango_fechas(request)
+    except ValidationError as e:
+        return Response({"error": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(analitica.reporte(desde, hasta))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock, Perfil, Mesa, Reserva
+from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock, MovimientoStock, Perfil, Mesa, Reserva
 
 @admin.register(CategoriaMenu)
 class CategoriaMenuAdmin(admin.ModelAdmin):
@@ -34,6 +34,22 @@ class ReservaStockAdmin(admin.ModelAdmin):
     list_filter = ['estado', 'fecha_creacion']
     search_fields = ['plato__nombre', 'pedido_id']
 
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ['ingrediente', 'tipo', 'cantidad', 'referencia', 'creado_en']
+    list_filter = ['tipo', 'creado_en']
+    search_fields = ['ingrediente__nombre', 'referencia']
+
+    # El libro solo admite filas nuevas desde el código
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 
 # ==================== MÓDULO 2: CLIENTES Y MESAS ====================
 
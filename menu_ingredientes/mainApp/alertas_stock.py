@@ -0,0 +1,170 @@
+"""
+Alertas de stock bajo.
+
+El cruce del stock mínimo se detecta en el momento en que cambia el stock,
+no consultando la tabla: las señales de Stock e Ingrediente (formularios,
+admin y API) y StockService.descontar (reservas de pedidos, incluido
+crear_pedido_integrado) llaman a `registrar()` con el estado anterior y el
+nuevo de cada ingrediente.
+
+Un cruce hacia abajo agrega la fila del ingrediente a StockBajo (el conjunto
+"hoy bajo el mínimo", indexado por ingrediente) y un cruce hacia arriba la
+borra, dentro de la misma transacción que el cambio de stock. Al confirmar se
+emite una alerta `bajo` o `repuesto` a cada sink de ALERTA_STOCK_SINKS: el
+log, el canal SSE de administración (/stock/alertas/eventos/) y,
+opcionalmente, un webhook.
+
+Un ingrediente que oscila alrededor de su mínimo no inunda a los
+administradores: después de avisar un cruce, los cruces del mismo tipo se
+callan durante ALERTA_STOCK_DEBOUNCE segundos (marca en la caché, compartida
+entre workers si hay Redis). StockBajo siempre se actualiza; solo se omite el
+aviso.
+"""
+import json
+import logging
+import urllib.request
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from cocina.eventos import CanalEventos
+from .models import Ingrediente, Stock, StockBajo
+from . import contadores
+
+
+logger = logging.getLogger(__name__)
+
+# Pantallas de administración conectadas por SSE
+canal_alertas = CanalEventos('alertas_stock')
+
+SINKS_POR_DEFECTO = [
+    'mainApp.alertas_stock.sink_log',
+    'mainApp.alertas_stock.sink_sse',
+]
+
+
+def bajo_minimo(cantidad, minimo):
+    # La cantidad puede llegar como texto desde un formulario
+    return cantidad is not None and minimo is not None and Decimal(str(cantidad)) <= minimo
+
+
+def registrar(cambios):
+    """
+    Aplica los cruces de `cambios`, una lista de
+    (ingrediente_id, estaba_bajo, cantidad, minimo) con la cantidad y el
+    mínimo ya actualizados (cantidad None si se eliminó el stock). Debe
+    llamarse dentro de la transacción del cambio. Retorna (bajaron, repuestos)
+    como listas de ingrediente_id.
+    """
+    bajaron, repuestos, actuales = [], [], {}
+    for ingrediente_id, estaba_bajo, cantidad, minimo in cambios:
+        esta_bajo = bajo_minimo(cantidad, minimo)
+        if esta_bajo and not estaba_bajo:
+            bajaron.append(ingrediente_id)
+        elif estaba_bajo and not esta_bajo:
+            repuestos.append(ingrediente_id)
+        else:
+            continue
+        actuales[ingrediente_id] = (cantidad, minimo)
+
+    if not actuales:
+        return bajaron, repuestos
+
+    if bajaron:
+        StockBajo.objects.bulk_create(
+            [StockBajo(ingrediente_id=ingrediente_id) for ingrediente_id in bajaron],
+            ignore_conflicts=True,
+        )
+    if repuestos:
+        StockBajo.objects.filter(ingrediente_id__in=repuestos).delete()
+    contadores.sumar('stock', None, contadores.BAJO_MINIMO, len(bajaron) - len(repuestos))
+
+    alertas = [('bajo', ingrediente_id) for ingrediente_id in bajaron]
+    alertas += [('repuesto', ingrediente_id) for ingrediente_id in repuestos]
+    transaction.on_commit(lambda: emitir(alertas, actuales))
+    return bajaron, repuestos
+
+
+def emitir(alertas, actuales):
+    """Avisa los cruces confirmados que no estén dentro de la ventana de debounce"""
+    debounce = getattr(settings, 'ALERTA_STOCK_DEBOUNCE', 300)
+    alertas = [
+        (tipo, ingrediente_id) for tipo, ingrediente_id in alertas
+        if cache.add(f'alerta_stock:{tipo}:{ingrediente_id}', True, debounce)
+    ]
+    if not alertas:
+        return
+
+    nombres = dict(
+        Ingrediente.objects.filter(pk__in=[i for _, i in alertas]).values_list('id', 'nombre')
+    )
+    momento = timezone.now().isoformat()
+    for tipo, ingrediente_id in alertas:
+        cantidad, minimo = actuales[ingrediente_id]
+        alerta = {
+            'tipo': tipo,
+            'ingrediente_id': ingrediente_id,
+            'ingrediente': nombres.get(ingrediente_id, str(ingrediente_id)),
+            'cantidad': None if cantidad is None else str(cantidad),
+            'stock_minimo': minimo,
+            'momento': momento,
+        }
+        for sink in _sinks():
+            try:
+                sink(alerta)
+            except Exception:
+                # Un sink caído no debe impedir que avisen los demás
+                logger.exception("No se pudo entregar la alerta de stock a %s", sink)
+
+
+def _sinks():
+    rutas = list(getattr(settings, 'ALERTA_STOCK_SINKS', SINKS_POR_DEFECTO))
+    if getattr(settings, 'ALERTA_STOCK_WEBHOOK_URL', ''):
+        rutas.append('mainApp.alertas_stock.sink_webhook')
+    return [import_string(ruta) for ruta in rutas]
+
+
+# ---------- Sinks ----------
+
+def sink_log(alerta):
+    if alerta['tipo'] == 'bajo':
+        logger.warning("Stock bajo de %s: %s (mínimo %s)",
+                       alerta['ingrediente'], alerta['cantidad'], alerta['stock_minimo'])
+    else:
+        logger.info("Stock de %s repuesto: %s", alerta['ingrediente'], alerta['cantidad'])
+
+
+def sink_sse(alerta):
+    canal_alertas.publicar(alerta)
+
+
+def sink_webhook(alerta):
+    """POST JSON a ALERTA_STOCK_WEBHOOK_URL con timeout corto"""
+    solicitud = urllib.request.Request(
+        settings.ALERTA_STOCK_WEBHOOK_URL,
+        data=json.dumps(alerta).encode(),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    with urllib.request.urlopen(solicitud, timeout=3):
+        pass
+
+
+@transaction.atomic
+def reconstruir():
+    """Recalcula StockBajo desde Stock (para cambios hechos con SQL directo)"""
+    bajos = set(
+        Stock.objects.filter(cantidad_disponible__lte=F('ingrediente__stock_minimo'))
+        .values_list('ingrediente_id', flat=True)
+    )
+    StockBajo.objects.exclude(ingrediente_id__in=bajos).delete()
+    StockBajo.objects.bulk_create(
+        [StockBajo(ingrediente_id=ingrediente_id) for ingrediente_id in bajos],
+        ignore_conflicts=True,
+    )
+    return len(bajos)
@@ -0,0 +1,90 @@
+"""
+Caché versionada del menú público (/menu/ y /api/platos/).
+
+El menú cambia pocas veces al día, así que todo lo que se arma a partir de él
+se guarda en el caché de Django bajo una clave que incluye la versión actual
+del menú. La versión es un timestamp en milisegundos que las señales de Plato,
+CategoriaMenu, Receta e Ingrediente renuevan al confirmar la transacción (ver
+signals.py); las entradas de versiones anteriores simplemente dejan de leerse
+y expiran solas.
+
+La misma versión sirve de ETag y Last-Modified para que navegadores y la app
+móvil reciban 304. Con el caché local por proceso (sin REDIS_URL) las señales
+solo llegan al worker que hizo el cambio, por eso la versión expira cada
+MENU_CACHE_TTL segundos y se vuelve a generar: eso acota cuánto puede tardar
+otro worker en ver el menú nuevo.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+CLAVE_VERSION = 'menu:version'
+
+
+def _ttl():
+    return getattr(settings, 'MENU_CACHE_TTL', 300)
+
+
+def _ahora_ms():
+    return int(time.time() * 1000)
+
+
+def version_menu():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = _ahora_ms()
+        # Si otro request la inicializó primero, usar esa
+        if not cache.add(CLAVE_VERSION, version, _ttl()):
+            version = cache.get(CLAVE_VERSION, version)
+    return version
+
+
+def _publicar_version():
+    anterior = cache.get(CLAVE_VERSION) or 0
+    cache.set(CLAVE_VERSION, max(_ahora_ms(), anterior + 1), _ttl())
+
+
+def invalidar_menu():
+    """Publica una versión nueva cuando se confirme la transacción en curso"""
+    transaction.on_commit(_publicar_version)
+
+
+def _firma(partes):
+    return hashlib.sha1(':'.join(str(p) for p in partes).encode()).hexdigest()[:16]
+
+
+def clave(*partes):
+    """Clave de caché para `partes` en la versión actual del menú"""
+    return f'menu:{version_menu()}:{_firma(partes)}'
+
+
+def etag(*partes):
+    """ETag fuerte para `partes` en la versión actual del menú"""
+    return f'"{version_menu()}-{_firma(partes)}"'
+
+
+def ultima_modificacion():
+    """Last-Modified de la versión actual del menú"""
+    return datetime.fromtimestamp(version_menu() // 1000, tz=timezone.utc)
+
+
+def leer(clave_cache):
+    return cache.get(clave_cache)
+
+
+def guardar(clave_cache, valor):
+    cache.set(clave_cache, valor, _ttl())
+
+
+def obtener(clave_cache, construir):
+    """Valor cacheado en `clave_cache` o el resultado de construir(), que queda cacheado"""
+    valor = leer(clave_cache)
+    if valor is None:
+        valor = construir()
+        guardar(clave_cache, valor)
+    return valor
@@ -0,0 +1,154 @@
+"""
+Caché en memoria de la matriz de recetas (plato x ingrediente).
+
+Cada plato tiene un índice fijo y por índice se guardan dos arreglos
+compactos: los ids de ingrediente y las cantidades por porción. Así "¿cuánto
+necesita este plato de cada ingrediente?" es una búsqueda en memoria en vez
+de una query.
+
+La matriz se construye una vez por proceso y se invalida de forma
+incremental con las señales post_save/post_delete de Receta, Plato e
+Ingrediente (ver signals.py): solo los platos afectados se recargan en la
+siguiente lectura. Como las señales solo llegan al proceso que hizo el cambio,
+la matriz completa además se reconstruye cada RECETAS_CACHE_TTL segundos para
+acotar la desactualización entre workers de gunicorn.
+"""
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from django.conf import settings
+
+from .models import Plato, Receta, Ingrediente
+
+
+RecetaPlato = namedtuple('RecetaPlato', ['plato_id', 'nombre', 'ingredientes', 'cantidades'])
+
+
+class MatrizRecetas:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._limpiar()
+
+    def _limpiar(self):
+        self._indice = {}              # plato_id -> índice
+        self._platos = []              # índice -> (plato_id, nombre, activo) o None si se eliminó
+        self._ingredientes = []        # índice -> array('q') de ingrediente_id
+        self._cantidades = []          # índice -> tuple de Decimal por porción
+        self._nombres_ingredientes = {}
+        self._pendientes = set()
+        self._cargada = False
+        self._cargada_en = 0.0
+
+    # ---------- Carga ----------
+
+    def _asegurar_cargada(self):
+        ttl = getattr(settings, 'RECETAS_CACHE_TTL', 300)
+        if self._cargada and time.monotonic() - self._cargada_en < ttl and not self._pendientes:
+            return
+        with self._lock:
+            if not self._cargada or time.monotonic() - self._cargada_en >= ttl:
+                self._cargar_todo()
+            elif self._pendientes:
+                self._recargar(self._pendientes)
+                self._pendientes = set()
+
+    def _cargar_todo(self):
+        self._limpiar()
+        self._nombres_ingredientes = dict(Ingrediente.objects.values_list('id', 'nombre'))
+        platos = Plato.objects.values_list('id', 'nombre', 'activo').order_by('id')
+        for plato_id, nombre, activo in platos:
+            self._asignar(plato_id, nombre, activo, [], [])
+        self._cargar_recetas(self._indice)
+        self._cargada = True
+        self._cargada_en = time.monotonic()
+
+    def _recargar(self, plato_ids):
+        encontrados = set()
+        for plato_id, nombre, activo in Plato.objects.filter(id__in=plato_ids).values_list('id', 'nombre', 'activo'):
+            self._asignar(plato_id, nombre, activo, [], [])
+            encontrados.add(plato_id)
+        for plato_id in set(plato_ids) - encontrados:
+            indice = self._indice.pop(plato_id, None)
+            if indice is not None:
+                self._platos[indice] = None
+        self._cargar_recetas(encontrados)
+
+    def _cargar_recetas(self, plato_ids):
+        if not plato_ids:
+            return
+        filas = {}
+        recetas = Receta.objects.filter(plato_id__in=plato_ids).values_list(
+            'plato_id', 'ingrediente_id', 'ingrediente__nombre', 'cantidad'
+        ).order_by('plato_id', 'ingrediente_id')
+        for plato_id, ing_id, ing_nombre, cantidad in recetas:
+            ids, cantidades = filas.setdefault(plato_id, ([], []))
+            ids.append(ing_id)
+            cantidades.append(cantidad)
+            self._nombres_ingredientes[ing_id] = ing_nombre
+        for plato_id, (ids, cantidades) in filas.items():
+            indice = self._indice[plato_id]
+            self._ingredientes[indice] = array('q', ids)
+            self._cantidades[indice] = tuple(cantidades)
+
+    def _asignar(self, plato_id, nombre, activo, ids, cantidades):
+        indice = self._indice.get(plato_id)
+        if indice is None:
+            indice = len(self._platos)
+            self._indice[plato_id] = indice
+            self._platos.append(None)
+            self._ingredientes.append(None)
+            self._cantidades.append(None)
+        self._platos[indice] = (plato_id, nombre, activo)
+        self._ingredientes[indice] = array('q', ids)
+        self._cantidades[indice] = tuple(cantidades)
+
+    # ---------- Lectura ----------
+
+    def receta(self, plato_id, solo_activos=True):
+        """RecetaPlato del plato o None si no existe (o está inactivo)"""
+        try:
+            plato_id = int(plato_id)
+        except (TypeError, ValueError):
+            return None
+        self._asegurar_cargada()
+        indice = self._indice.get(plato_id)
+        if indice is None:
+            return None
+        _, nombre, activo = self._platos[indice]
+        if solo_activos and not activo:
+            return None
+        return RecetaPlato(plato_id, nombre, self._ingredientes[indice], self._cantidades[indice])
+
+    def platos_activos(self):
+        """Lista de RecetaPlato de todos los platos activos, en orden de índice"""
+        self._asegurar_cargada()
+        return [
+            RecetaPlato(plato[0], plato[1], self._ingredientes[indice], self._cantidades[indice])
+            for indice, plato in enumerate(self._platos)
+            if plato is not None and plato[2]
+        ]
+
+    def nombre_ingrediente(self, ingrediente_id):
+        self._asegurar_cargada()
+        return self._nombres_ingredientes.get(ingrediente_id, str(ingrediente_id))
+
+    # ---------- Invalidación ----------
+
+    def invalidar_plato(self, plato_id):
+        with self._lock:
+            if self._cargada:
+                self._pendientes.add(plato_id)
+
+    def actualizar_ingrediente(self, ingrediente_id, nombre):
+        with self._lock:
+            self._nombres_ingredientes[ingrediente_id] = nombre
+
+    def invalidar_todo(self):
+        with self._lock:
+            self._limpiar()
+
+
+matriz_recetas = MatrizRecetas()
@@ -0,0 +1,61 @@
+"""
+Caché de resultados caros con recálculo de un solo vuelo.
+
+`obtener_o_calcular(clave, calcular, ttl)` devuelve el valor guardado y, si
+expiró, deja que un único request lo recalcule mientras el resto espera el
+resultado en vez de repetir las mismas queries. Dentro de un proceso la
+exclusión es un lock por clave; entre workers (con Redis) es una marca
+`<clave>:calculando` creada con cache.add, que es atómico. Si quien calcula
+tarda más que ESPERA_MAXIMA los demás calculan por su cuenta: nunca se
+bloquea un request indefinidamente.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+
+ESPERA_MAXIMA = 5      # segundos que se espera el cálculo de otro worker
+INTERVALO_ESPERA = 0.05
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(clave):
+    with _locks_guard:
+        return _locks.setdefault(clave, threading.Lock())
+
+
+def _esperar(clave):
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while time.monotonic() < limite:
+        time.sleep(INTERVALO_ESPERA)
+        valor = cache.get(clave)
+        if valor is not None:
+            return valor
+    return None
+
+
+def obtener_o_calcular(clave, calcular, ttl):
+    valor = cache.get(clave)
+    if valor is not None:
+        return valor
+
+    with _lock(clave):
+        # Otro hilo pudo haberlo calculado mientras esperábamos el lock
+        valor = cache.get(clave)
+        if valor is not None:
+            return valor
+
+        marca = f'{clave}:calculando'
+        if not cache.add(marca, 1, ESPERA_MAXIMA):
+            valor = _esperar(clave)
+            if valor is not None:
+                return valor
+        try:
+            valor = calcular()
+            cache.set(clave, valor, ttl)
+        finally:
+            cache.delete(marca)
+        return valor
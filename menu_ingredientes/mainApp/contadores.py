@@ -0,0 +1,154 @@
+"""
+Contadores materializados para los dashboards.
+
+En vez de contar Pedido, PedidoCocina, Reserva, Mesa y Stock en cada
+request, cada cambio de estado ajusta una fila de Contador con
+UPDATE ... SET total = total + delta dentro de la misma transacción que el
+cambio (ver las señales en signals.py; el stock bajo lo ajusta
+alertas_stock.py). Leer un dashboard es entonces una sola query por índice
+único, sin importar cuántos pedidos o reservas haya.
+
+Cada transición se cuenta dos veces: en la fila del día (pedidos por fecha
+de creación, reservas por fecha de la reserva) y en la fila global
+(fecha SIN_FECHA), que responde "¿cuántos pedidos activos hay?" sin sumar
+días. Mesas y stock bajo el mínimo solo tienen fila global.
+
+Los cambios hechos con queryset.update() o SQL directo no pasan por las
+señales; `python manage.py reconstruir_contadores` recalcula todo desde
+cero.
+"""
+from datetime import date
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Contador
+
+
+# Fecha de las filas globales
+SIN_FECHA = date.min
+
+# Estado de la fila global de stock
+BAJO_MINIMO = 'bajo_minimo'
+
+
+def _sumar(modulo, fecha, estado, delta):
+    filtro = {'modulo': modulo, 'fecha': fecha, 'estado': estado}
+    if Contador.objects.filter(**filtro).update(total=F('total') + delta):
+        return
+    try:
+        with transaction.atomic():
+            Contador.objects.create(total=delta, **filtro)
+    except IntegrityError:
+        # Otro request creó la fila entre el UPDATE y el INSERT
+        Contador.objects.filter(**filtro).update(total=F('total') + delta)
+
+
+def sumar(modulo, fecha, estado, delta=1):
+    """Ajusta el contador del día y el global"""
+    if not delta:
+        return
+    if fecha is not None:
+        _sumar(modulo, fecha, estado, delta)
+    _sumar(modulo, SIN_FECHA, estado, delta)
+
+
+def mover(modulo, antes, despues):
+    """
+    Registra una transición. `antes` y `despues` son (fecha, estado) o None
+    para un alta o una baja.
+    """
+    if antes == despues:
+        return
+    if antes is not None:
+        sumar(modulo, *antes, delta=-1)
+    if despues is not None:
+        sumar(modulo, *despues, delta=1)
+
+
+def dia_local(momento):
+    return timezone.localdate(momento) if momento else None
+
+
+def leer(fecha):
+    """
+    Contadores del día `fecha` y globales en una sola query:
+    ({modulo: {estado: total}}, {modulo: {estado: total}})
+    """
+    dia, globales = {}, {}
+    filas = Contador.objects.filter(fecha__in=[fecha, SIN_FECHA]).values_list(
+        'modulo', 'fecha', 'estado', 'total'
+    )
+    for modulo, fecha_fila, estado, total in filas:
+        destino = globales if fecha_fila == SIN_FECHA else dia
+        destino.setdefault(modulo, {})[estado] = total
+    return dia, globales
+
+
+def sin_ceros(conteos):
+    return {estado: total for estado, total in conteos.items() if total}
+
+
+def bajo_stock():
+    return (
+        Contador.objects.filter(modulo='stock', fecha=SIN_FECHA, estado=BAJO_MINIMO)
+        .values_list('total', flat=True).first() or 0
+    )
+
+
+def _por_dia_y_estado(modelo, modulo, filas):
+    """Filas (fecha, estado, total) de un GROUP BY → contadores del día y globales"""
+    globales = {}
+    contadores = []
+    for fecha, estado, total in filas:
+        contadores.append(modelo(modulo=modulo, fecha=fecha, estado=estado, total=total))
+        globales[estado] = globales.get(estado, 0) + total
+    contadores += [
+        modelo(modulo=modulo, fecha=SIN_FECHA, estado=estado, total=total)
+        for estado, total in globales.items()
+    ]
+    return contadores
+
+
+@transaction.atomic
+def reconstruir(apps=global_apps):
+    """
+    Recalcula todos los contadores desde las tablas de origen. La migración
+    que crea Contador lo llama con sus modelos históricos (`apps`).
+    """
+    Pedido = apps.get_model('pedidos', 'Pedido')
+    PedidoCocina = apps.get_model('cocina', 'PedidoCocina')
+    Reserva = apps.get_model('mainApp', 'Reserva')
+    Mesa = apps.get_model('mainApp', 'Mesa')
+    Stock = apps.get_model('mainApp', 'Stock')
+    Contador = apps.get_model('mainApp', 'Contador')
+
+    contadores = []
+    contadores += _por_dia_y_estado(Contador, 'pedido', (
+        Pedido.objects.annotate(dia=TruncDate('creado_en')).values('dia', 'estado')
+        .annotate(total=Count('pk')).values_list('dia', 'estado', 'total').order_by()
+    ))
+    contadores += _por_dia_y_estado(Contador, 'cocina', (
+        PedidoCocina.objects.annotate(dia=TruncDate('fecha_creacion')).values('dia', 'estado')
+        .annotate(total=Count('pk')).values_list('dia', 'estado', 'total').order_by()
+    ))
+    contadores += _por_dia_y_estado(Contador, 'reserva', (
+        Reserva.objects.values('fecha_reserva', 'estado')
+        .annotate(total=Count('pk')).values_list('fecha_reserva', 'estado', 'total').order_by()
+    ))
+    contadores += [
+        Contador(modulo='mesa', fecha=SIN_FECHA, estado=estado, total=total)
+        for estado, total in Mesa.objects.values('estado').annotate(total=Count('pk'))
+        .values_list('estado', 'total').order_by()
+    ]
+    contadores.append(Contador(
+        modulo='stock', fecha=SIN_FECHA, estado=BAJO_MINIMO,
+        total=Stock.objects.filter(cantidad_disponible__lte=F('ingrediente__stock_minimo')).count(),
+    ))
+
+    Contador.objects.all().delete()
+    Contador.objects.bulk_create(contadores)
+    return len(contadores)
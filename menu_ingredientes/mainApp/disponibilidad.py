@@ -0,0 +1,141 @@
+"""
+Motor de disponibilidad de mesas.
+
+Dos reservas de una misma mesa chocan si sus intervalos [inicio, fin) se
+solapan: `inicio_a < fin_b and fin_a > inicio_b`. Ese predicado vive solo
+aquí y se resuelve en SQL (apoyado en el índice compuesto
+mesa + fecha_reserva + estado + hora_inicio + hora_fin de Reserva), así que
+Reserva.clean, MesaViewSet.disponibles, ConsultaMesasView y
+verificar_disponibilidad responden exactamente lo mismo.
+
+Para consultas repetidas sobre un mismo día (grillas, locales grandes)
+AgendaDia carga las reservas del día con una sola query y responde
+"¿está libre la mesa X en [a, b)?" con búsqueda binaria.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime, time, timedelta
+
+from django.db.models import Exists, OuterRef
+
+from .models import Mesa, Reserva
+
+
+# Estados que ocupan la mesa
+ESTADOS_ACTIVOS = ('pendiente', 'confirmada')
+
+# Duración estándar de una reserva (las vistas calculan hora_fin así)
+DURACION_RESERVA = timedelta(hours=2)
+
+# Turnos que se ofrecen al reservar: 12:00 a 20:30 cada 30 minutos
+HORARIOS = tuple(time(h, m) for h in range(12, 21) for m in (0, 30))
+
+
+def intervalo_desde(hora, duracion=DURACION_RESERVA):
+    """Intervalo [hora, hora + duracion) sin pasar de medianoche"""
+    fin = datetime.combine(datetime.min, hora) + duracion
+    if fin.date() > datetime.min.date():
+        return hora, time.max
+    return hora, fin.time()
+
+
+def reservas_que_solapan(fecha, inicio, fin, mesa=None):
+    """Reservas activas de `fecha` que chocan con [inicio, fin)"""
+    reservas = Reserva.objects.filter(
+        fecha_reserva=fecha,
+        estado__in=ESTADOS_ACTIVOS,
+        hora_inicio__lt=fin,
+        hora_fin__gt=inicio,
+    )
+    if mesa is not None:
+        reservas = reservas.filter(mesa=mesa)
+    return reservas
+
+
+def mesas_libres(fecha, inicio, fin, personas=None, mesas=None):
+    """
+    Mesas sin reservas que choquen con [inicio, fin). El choque se evalúa
+    con un NOT EXISTS correlacionado, en la misma query que las mesas.
+    """
+    if mesas is None:
+        mesas = Mesa.objects.filter(estado='disponible')
+    if personas:
+        mesas = mesas.filter(capacidad__gte=personas)
+    ocupada = reservas_que_solapan(fecha, inicio, fin).filter(mesa=OuterRef('pk'))
+    return mesas.filter(~Exists(ocupada))
+
+
+def grilla_dia(fecha, personas=None, mesas=None):
+    """
+    Disponibilidad de todas las mesas en todos los turnos de `fecha`: una
+    query para las mesas y otra para las reservas del día. Retorna una lista
+    de (mesa, bits) donde bits tiene un '1' por cada turno de HORARIOS en el
+    que una reserva de DURACION_RESERVA entra libre.
+    """
+    if mesas is None:
+        mesas = Mesa.objects.filter(estado='disponible')
+    if personas:
+        mesas = mesas.filter(capacidad__gte=personas)
+    mesas = list(mesas.order_by('numero'))
+    agenda = AgendaDia(fecha)
+    intervalos = [intervalo_desde(hora) for hora in HORARIOS]
+    return [
+        (mesa, ''.join('1' if agenda.mesa_libre(mesa.id, inicio, fin) else '0'
+                       for inicio, fin in intervalos))
+        for mesa in mesas
+    ]
+
+
+class AgendaDia:
+    """
+    Reservas activas de un día, indexadas por mesa.
+
+    Por mesa se guardan los inicios ordenados, los fines en el mismo orden y
+    el máximo acumulado de los fines. Una mesa está ocupada en [a, b) si
+    alguna reserva con inicio < b termina después de a: la última con
+    inicio < b se ubica con bisect y el máximo acumulado hasta ella dice si
+    alguna termina después de a. Cada consulta es O(log n) aunque haya datos
+    viejos con reservas superpuestas.
+    """
+
+    def __init__(self, fecha, reservas=None):
+        self.fecha = fecha
+        self._inicios = {}
+        self._fines = {}
+        self._max_fin = {}
+        if reservas is None:
+            reservas = (
+                Reserva.objects
+                .filter(fecha_reserva=fecha, estado__in=ESTADOS_ACTIVOS)
+                .order_by('mesa_id', 'hora_inicio')
+                .values_list('mesa_id', 'hora_inicio', 'hora_fin')
+            )
+        por_mesa = {}
+        for mesa_id, inicio, fin in reservas:
+            por_mesa.setdefault(mesa_id, []).append((inicio, fin))
+        for mesa_id, intervalos in por_mesa.items():
+            self._indexar(mesa_id, sorted(intervalos))
+
+    def _indexar(self, mesa_id, intervalos):
+        self._inicios[mesa_id] = [inicio for inicio, _ in intervalos]
+        self._fines[mesa_id] = [fin for _, fin in intervalos]
+        maximos, actual = [], None
+        for fin in self._fines[mesa_id]:
+            actual = fin if actual is None or fin > actual else actual
+            maximos.append(actual)
+        self._max_fin[mesa_id] = maximos
+
+    def agregar(self, mesa_id, inicio, fin):
+        """Registra una reserva nueva sin volver a consultar la base"""
+        intervalos = list(zip(self._inicios.get(mesa_id, []), self._fines.get(mesa_id, [])))
+        insort(intervalos, (inicio, fin))
+        self._indexar(mesa_id, intervalos)
+
+    def mesa_libre(self, mesa_id, inicio, fin):
+        inicios = self._inicios.get(mesa_id)
+        if not inicios:
+            return True
+        i = bisect_left(inicios, fin) - 1
+        return i < 0 or self._max_fin[mesa_id][i] <= inicio
+
+    def mesas_libres(self, mesa_ids, inicio, fin):
+        return [mesa_id for mesa_id in mesa_ids if self.mesa_libre(mesa_id, inicio, fin)]
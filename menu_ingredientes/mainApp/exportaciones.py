@@ -0,0 +1,157 @@
+"""
+Exportaciones CSV / NDJSON para contabilidad.
+
+Cada exportación recorre un queryset con `.values_list(...).iterator()` y
+escribe las filas a medida que el cliente las lee (StreamingHttpResponse):
+no se instancian modelos ni se arma la lista completa en memoria, así que
+exportar un día o varios meses usa la misma memoria. En PostgreSQL el
+iterador usa un cursor del lado del servidor; en SQLite lee por bloques de
+TAMANO_BLOQUE filas.
+
+El rango de fechas (`desde` / `hasta`, ambos inclusive, en fecha local) se
+aplica como rango sobre la columna de fecha de cada modelo para usar su
+índice, igual que PedidoCocinaQuerySet.del_dia.
+"""
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db.models import DateTimeField
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from cocina.models import PedidoCocina
+from pedidos.models import Pedido
+from .models import Reserva, ReservaStock
+
+
+# Filas por bloque leído de la base
+TAMANO_BLOQUE = 2000
+
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# nombre: (queryset, columna de fecha, [(encabezado, campo)])
+EXPORTACIONES = {
+    'pedidos': (
+        lambda: Pedido.objects.all(), 'creado_en', [
+            ('id', 'id'), ('mesa', 'mesa'), ('cliente', 'cliente'), ('plato', 'plato'),
+            ('estado', 'estado'), ('creado_en', 'creado_en'),
+            ('actualizado_en', 'actualizado_en'), ('entregado_en', 'entregado_en'),
+        ],
+    ),
+    'cocina': (
+        lambda: PedidoCocina.objects.all(), 'fecha_creacion', [
+            ('id', 'id'), ('id_modulo3', 'id_modulo3'), ('mesa', 'mesa'), ('cliente', 'cliente'),
+            ('descripcion', 'descripcion'), ('estado', 'estado'), ('fecha_creacion', 'fecha_creacion'),
+            ('fecha_actualizacion', 'fecha_actualizacion'), ('hora_listo', 'hora_listo'),
+        ],
+    ),
+    'reservas': (
+        lambda: Reserva.objects.all(), 'fecha_reserva', [
+            ('id', 'id'), ('cliente', 'cliente__username'), ('mesa', 'mesa__numero'),
+            ('fecha_reserva', 'fecha_reserva'), ('hora_inicio', 'hora_inicio'), ('hora_fin', 'hora_fin'),
+            ('num_personas', 'num_personas'), ('estado', 'estado'), ('notas', 'notas'),
+            ('created_at', 'created_at'),
+        ],
+    ),
+    'reservas-stock': (
+        lambda: ReservaStock.objects.all(), 'fecha_creacion', [
+            ('id', 'id'), ('pedido_id', 'pedido_id'), ('plato_id', 'plato_id'),
+            ('plato', 'plato__nombre'), ('cantidad', 'cantidad'), ('estado', 'estado'),
+            ('fecha_creacion', 'fecha_creacion'),
+        ],
+    ),
+}
+
+
+def leer_fecha(valor, nombre):
+    if not valor:
+        return None
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise ValidationError(f"{nombre} debe tener formato YYYY-MM-DD")
+    return fecha
+
+
+def filas(recurso, desde=None, hasta=None):
+    """Encabezados y un iterador de tuplas de `recurso` entre `desde` y `hasta`"""
+    if recurso not in EXPORTACIONES:
+        raise ValidationError(f"Exportación desconocida: {recurso}")
+    consulta, columna, columnas = EXPORTACIONES[recurso]
+    queryset = consulta()
+
+    # Las columnas DateTimeField se comparan contra la medianoche local
+    con_hora = isinstance(queryset.model._meta.get_field(columna), DateTimeField)
+    limite = lambda fecha: timezone.make_aware(datetime.combine(fecha, time.min)) if con_hora else fecha
+    if desde is not None:
+        queryset = queryset.filter(**{f'{columna}__gte': limite(desde)})
+    if hasta is not None:
+        queryset = queryset.filter(**{f'{columna}__lt': limite(hasta + timedelta(days=1))})
+
+    iterador = (
+        queryset.order_by(columna, 'pk')
+        .values_list(*[campo for _, campo in columnas])
+        .iterator(chunk_size=TAMANO_BLOQUE)
+    )
+    return [encabezado for encabezado, _ in columnas], iterador
+
+
+def _valor(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat()
+    if isinstance(valor, (date, time)):
+        return valor.isoformat()
+    if valor is None or isinstance(valor, (bool, int, float, str)):
+        return valor
+    return str(valor)
+
+
+def _celda_csv(valor):
+    valor = _valor(valor)
+    if valor is None:
+        return ''
+    # Evita que una planilla interprete un texto como fórmula
+    if isinstance(valor, str) and valor[:1] in ('=', '+', '-', '@', '\t', '\r'):
+        return "'" + valor
+    return valor
+
+
+class _Linea:
+    """Destino de csv.writer que devuelve la línea escrita en vez de guardarla"""
+
+    def write(self, texto):
+        return texto
+
+
+def _csv(encabezados, iterador):
+    escritor = csv.writer(_Linea())
+    # BOM para que Excel lea el UTF-8
+    yield '\ufeff' + escritor.writerow(encabezados)
+    for fila in iterador:
+        yield escritor.writerow([_celda_csv(valor) for valor in fila])
+
+
+def _ndjson(encabezados, iterador):
+    for fila in iterador:
+        yield json.dumps(dict(zip(encabezados, map(_valor, fila))), ensure_ascii=False) + '\n'
+
+
+def respuesta(recurso, formato='csv', desde=None, hasta=None):
+    """StreamingHttpResponse con la exportación; ValidationError si los parámetros no sirven"""
+    if formato not in FORMATOS:
+        raise ValidationError("formato debe ser csv o ndjson")
+    if desde and hasta and desde > hasta:
+        raise ValidationError("desde no puede ser posterior a hasta")
+    encabezados, iterador = filas(recurso, desde, hasta)
+
+    generador = _csv if formato == 'csv' else _ndjson
+    response = StreamingHttpResponse(generador(encabezados, iterador), content_type=FORMATOS[formato])
+    rango = '_'.join(fecha.isoformat() for fecha in (desde, hasta) if fecha)
+    nombre = f'{recurso}_{rango}' if rango else recurso
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.{formato}"'
+    return response
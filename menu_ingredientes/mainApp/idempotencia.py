@@ -0,0 +1,167 @@
+"""
+Idempotency-Key para los endpoints que crean pedidos o reservan stock.
+
+Una tablet que reintenta un POST manda el mismo header `Idempotency-Key` (o
+el campo `idempotency_key` en los formularios HTML). El primer request
+reclama la clave insertando una fila en ClaveIdempotencia: la clave primaria
+es el sha256 de alcance + usuario + key, así que dos workers de gunicorn que
+reciben el mismo reintento a la vez no pueden ejecutar la vista dos veces.
+Al terminar, la respuesta se guarda en la fila y en la caché; los reintentos
+la reciben tal cual (header `Idempotent-Replayed: true`) sin volver a
+descontar stock. Con la caché compartida (Redis) un reintento no toca la
+base.
+
+- Reintento mientras el original sigue en curso: 409 con Retry-After.
+- Misma key con otro cuerpo: 422.
+- Respuestas 5xx o excepciones no se guardan: el reintento vuelve a ejecutar.
+- Las claves vencen a los IDEMPOTENCIA_TTL segundos; una reclamada por un
+  worker que murió queda libre a los PROCESO_MAXIMO segundos.
+  `python manage.py purgar_idempotencia` borra las vencidas.
+
+Sin el header los endpoints se comportan como siempre.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import ClaveIdempotencia
+
+
+HEADER = 'Idempotency-Key'
+CAMPO_FORMULARIO = 'idempotency_key'
+
+# Segundos que una clave puede quedar reclamada sin respuesta
+PROCESO_MAXIMO = 60
+
+# Campos que no forman parte de la huella del cuerpo
+_IGNORADOS = {CAMPO_FORMULARIO, 'csrfmiddlewaretoken'}
+
+
+def _ttl():
+    return getattr(settings, 'IDEMPOTENCIA_TTL', 24 * 3600)
+
+
+def clave_de(alcance, usuario, key):
+    return hashlib.sha256(f'{alcance}\0{usuario}\0{key}'.encode()).hexdigest()
+
+
+def _huella(request):
+    datos = request.data if hasattr(request, 'data') else request.POST
+    if hasattr(datos, 'lists'):
+        datos = dict(datos.lists())
+    datos = {k: v for k, v in datos.items() if k not in _IGNORADOS} if isinstance(datos, dict) else datos
+    return hashlib.sha256(json.dumps(datos, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _serializar(response):
+    if isinstance(response, Response):
+        return json.dumps({'data': response.data}, cls=JSONEncoder)
+    cabeceras = {h: response[h] for h in ('Location', 'Content-Type') if response.has_header(h)}
+    return json.dumps({'contenido': response.content.decode(response.charset), 'cabeceras': cabeceras})
+
+
+def _repetir(estado_http, respuesta):
+    guardada = json.loads(respuesta)
+    if 'data' in guardada:
+        response = Response(guardada['data'], status=estado_http)
+    elif 'Location' in guardada['cabeceras']:
+        response = HttpResponseRedirect(guardada['cabeceras']['Location'])
+        response.status_code = estado_http
+    else:
+        response = HttpResponse(guardada['contenido'], status=estado_http)
+        for cabecera, valor in guardada['cabeceras'].items():
+            response[cabecera] = valor
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _error(request, mensaje, estado_http):
+    if hasattr(request, 'data'):
+        return Response({'error': mensaje}, status=estado_http)
+    return JsonResponse({'error': mensaje}, status=estado_http)
+
+
+def _reclamar(clave, huella):
+    """Inserta la fila de la clave. Retorna None si se reclamó o la fila existente"""
+    ahora = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                ClaveIdempotencia.objects.create(
+                    clave=clave, huella=huella,
+                    expira_en=ahora + timedelta(seconds=PROCESO_MAXIMO),
+                )
+            return None
+        except IntegrityError:
+            existente = ClaveIdempotencia.objects.filter(clave=clave).first()
+            if existente is not None and existente.expira_en > ahora:
+                return existente
+            # Vencida (o recién borrada): se libera y se vuelve a intentar una vez
+            ClaveIdempotencia.objects.filter(clave=clave, expira_en__lte=ahora).delete()
+    return ClaveIdempotencia.objects.filter(clave=clave).first()
+
+
+def idempotente(alcance):
+    """
+    Decorador para vistas de función, @api_view o acciones de ViewSet.
+    `alcance` separa las claves de distintos endpoints.
+    """
+
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            request = args[0] if hasattr(args[0], 'META') else args[1]
+            key = request.headers.get(HEADER) or request.POST.get(CAMPO_FORMULARIO)
+            if not key:
+                return vista(*args, **kwargs)
+            if len(key) > 255:
+                return _error(request, f'{HEADER} no puede superar 255 caracteres', 400)
+
+            usuario = request.user.pk if request.user.is_authenticated else ''
+            clave = clave_de(alcance, usuario, key)
+            huella = _huella(request)
+
+            guardada = cache.get(f'idempotencia:{clave}')
+            if guardada is None:
+                existente = _reclamar(clave, huella)
+                if existente is not None:
+                    guardada = (existente.huella, existente.estado_http, existente.respuesta)
+            if guardada is not None:
+                huella_original, estado_http, respuesta = guardada
+                if huella_original != huella:
+                    return _error(request, f'{HEADER} ya se usó con otro cuerpo', 422)
+                if estado_http is None:
+                    response = _error(request, 'El request original todavía se está procesando', 409)
+                    response['Retry-After'] = '1'
+                    return response
+                return _repetir(estado_http, respuesta)
+
+            try:
+                response = vista(*args, **kwargs)
+            except Exception:
+                ClaveIdempotencia.objects.filter(clave=clave).delete()
+                raise
+            if response.status_code >= 500:
+                ClaveIdempotencia.objects.filter(clave=clave).delete()
+                return response
+
+            respuesta = _serializar(response)
+            ClaveIdempotencia.objects.filter(clave=clave).update(
+                estado_http=response.status_code, respuesta=respuesta,
+                expira_en=timezone.now() + timedelta(seconds=_ttl()),
+            )
+            cache.set(f'idempotencia:{clave}', (huella, response.status_code, respuesta), _ttl())
+            return response
+
+        return envoltura
+
+    return decorador
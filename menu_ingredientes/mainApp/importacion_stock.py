@@ -0,0 +1,135 @@
+"""
+Importación masiva de stock: recepción de un proveedor o conteo de inventario.
+
+Las líneas llegan como CSV (columnas `ingrediente,cantidad`, con el
+ingrediente por id o por nombre) o como lista JSON de
+{ingrediente | ingrediente_id, cantidad}. Todas se validan antes de tocar
+nada; si alguna falla no se aplica ninguna y el reporte indica cuál. Si todas
+son válidas StockService.importar aplica el lote completo en una transacción
+con bulk_update / bulk_create y un INSERT de movimientos.
+
+- Modo `ingreso`: la cantidad se suma al stock (líneas repetidas se suman).
+- Modo `conteo`: la cantidad contada reemplaza al stock y la diferencia queda
+  en el libro como ajuste (un ingrediente no puede repetirse).
+"""
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+
+from .models import Ingrediente
+from .services import StockService
+from . import movimientos
+
+
+MODOS = {'ingreso': movimientos.INGRESO, 'conteo': movimientos.AJUSTE}
+
+# Límite de líneas por request
+MAX_LINEAS = 2000
+
+
+def leer_csv(texto):
+    """Filas {ingrediente, cantidad} de un CSV con encabezado"""
+    lector = csv.DictReader(io.StringIO(texto.lstrip('\ufeff')))
+    if not lector.fieldnames or not {'ingrediente', 'cantidad'} <= {c.strip() for c in lector.fieldnames}:
+        raise ValidationError("El CSV debe tener las columnas ingrediente y cantidad")
+    return [{k.strip(): (v or '').strip() for k, v in fila.items() if k} for fila in lector]
+
+
+def validar(filas, modo):
+    """
+    Valida todas las filas con una sola query de ingredientes.
+    Retorna (lineas, reporte) donde lineas es [(ingrediente_id, cantidad)] y
+    reporte tiene una entrada por fila con su error o None.
+    """
+    if modo not in MODOS:
+        raise ValidationError("modo debe ser ingreso o conteo")
+    if not filas:
+        raise ValidationError("Se requiere al menos una línea")
+    if len(filas) > MAX_LINEAS:
+        raise ValidationError(f"Máximo {MAX_LINEAS} líneas por importación")
+
+    por_id, por_nombre = {}, {}
+    for ing_id, nombre in Ingrediente.objects.values_list('id', 'nombre'):
+        por_id[ing_id] = nombre
+        por_nombre.setdefault(nombre.strip().lower(), []).append(ing_id)
+
+    lineas, reporte, vistos = [], [], set()
+    for numero, fila in enumerate(filas, start=1):
+        error, ing_id, cantidad = None, None, None
+        if not isinstance(fila, dict):
+            fila = {}
+        ingrediente = str(fila.get('ingrediente_id') or fila.get('ingrediente') or '').strip()
+
+        if ingrediente.isdigit():
+            ing_id = int(ingrediente)
+            if ing_id not in por_id:
+                error = "Ingrediente no encontrado"
+        elif ingrediente:
+            candidatos = por_nombre.get(ingrediente.lower(), [])
+            if len(candidatos) == 1:
+                ing_id = candidatos[0]
+            else:
+                error = "Ingrediente no encontrado" if not candidatos else "Nombre de ingrediente ambiguo, use el id"
+        else:
+            error = "Falta el ingrediente"
+
+        if error is None:
+            try:
+                cantidad = Decimal(str(fila.get('cantidad', '')).strip().replace(',', '.'))
+                if not cantidad.is_finite() or cantidad < 0:
+                    raise InvalidOperation
+                if cantidad != cantidad.quantize(Decimal('0.01')):
+                    error = "Máximo dos decimales"
+            except InvalidOperation:
+                error = "cantidad debe ser un número mayor o igual a 0"
+
+        if error is None and modo == 'conteo' and ing_id in vistos:
+            error = "Ingrediente repetido en el conteo"
+        if ing_id is not None:
+            vistos.add(ing_id)
+
+        reporte.append({
+            'linea': numero,
+            'ingrediente_id': ing_id,
+            'ingrediente': por_id.get(ing_id, ingrediente),
+            'cantidad': cantidad,
+            'error': error,
+        })
+        if error is None:
+            lineas.append((ing_id, cantidad))
+
+    return lineas, reporte
+
+
+def leer_request(datos, archivo=None):
+    """Filas de un request: archivo CSV subido, campo `csv` con el texto o lista `lineas`"""
+    if archivo is not None:
+        try:
+            return leer_csv(archivo.read().decode('utf-8'))
+        except UnicodeDecodeError:
+            raise ValidationError("El archivo debe estar en UTF-8")
+    if datos.get('csv'):
+        return leer_csv(datos['csv'])
+    lineas = datos.get('lineas')
+    if not isinstance(lineas, list):
+        raise ValidationError("Envíe un archivo CSV, el campo csv o una lista lineas")
+    return lineas
+
+
+def importar(filas, modo, referencia=''):
+    """
+    Valida y aplica. Retorna (aplicado, reporte); si alguna fila tiene error
+    no se aplica nada. En el reporte de un lote aplicado cada línea trae el
+    stock anterior y el nuevo de su ingrediente.
+    """
+    lineas, reporte = validar(filas, modo)
+    if any(fila['error'] for fila in reporte):
+        return False, reporte
+
+    cambios = StockService().importar(lineas, MODOS[modo], referencia)
+    for fila in reporte:
+        anterior, nuevo = cambios[fila['ingrediente_id']]
+        fila['anterior'], fila['nuevo'] = anterior, nuevo
+    return True, reporte
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mainApp.services import StockService
+
+
+class Command(BaseCommand):
+    help = "Devuelve al stock las reservas sin confirmar más viejas que RESERVA_STOCK_TTL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ttl", type=int, default=settings.RESERVA_STOCK_TTL,
+                            help="Antigüedad mínima en segundos")
+        parser.add_argument("--lote", type=int, default=500, help="Reservas por transacción")
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(seconds=options["ttl"])
+        liberadas = StockService().liberar_vencidas(antes_de, lote=options["lote"])
+        self.stdout.write(f"Reservas liberadas: {liberadas}")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mainApp.models import ClaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = "Elimina las claves de idempotencia vencidas"
+
+    def handle(self, *args, **options):
+        borradas, _ = ClaveIdempotencia.objects.filter(expira_en__lte=timezone.now()).delete()
+        self.stdout.write(f"Claves eliminadas: {borradas}")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from mainApp import alertas_stock, contadores
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero los contadores de los dashboards y el conjunto de stock bajo"
+
+    def handle(self, *args, **options):
+        filas = contadores.reconstruir()
+        bajos = alertas_stock.reconstruir()
+        self.stdout.write(f"Contadores reconstruidos: {filas}")
+        self.stdout.write(f"Ingredientes bajo el mínimo: {bajos}")
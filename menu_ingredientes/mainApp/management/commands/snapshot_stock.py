@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mainApp.movimientos import conciliar, tomar_snapshots
+
+
+class Command(BaseCommand):
+    help = "Guarda el saldo del libro de movimientos de cada ingrediente con movimientos nuevos"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--conciliar", action="store_true",
+            help="Además compara el libro con Stock y lista las diferencias",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Snapshots guardados: {tomar_snapshots()}")
+        if not options["conciliar"]:
+            return
+        diferencias = conciliar()
+        for fila in diferencias:
+            self.stdout.write(self.style.WARNING(
+                f"Ingrediente {fila['ingrediente_id']}: stock {fila['stock']}, libro {fila['libro']}"
+            ))
+        if not diferencias:
+            self.stdout.write("El libro coincide con el stock")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0002_mesa_perfil_reserva'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['mesa', 'fecha_reserva', 'estado', 'hora_inicio', 'hora_fin'], name='reserva_disponibilidad_idx'),
+        ),
+    ]
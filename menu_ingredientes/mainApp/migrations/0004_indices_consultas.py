@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0003_reserva_disponibilidad_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha_reserva', 'estado', 'hora_inicio'], name='reserva_dia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservastock',
+            index=models.Index(fields=['pedido_id', 'estado'], name='reservastock_pedido_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:12
+
+from django.db import migrations, models
+
+
+def cargar_contadores(apps, schema_editor):
+    from mainApp.contadores import reconstruir
+
+    reconstruir(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0004_indices_consultas'),
+        ('pedidos', '0005_indices_consultas'),
+        ('cocina', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contador',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modulo', models.CharField(choices=[('pedido', 'Pedidos'), ('cocina', 'Pedidos cocina'), ('reserva', 'Reservas'), ('mesa', 'Mesas'), ('stock', 'Stock')], max_length=10)),
+                ('fecha', models.DateField()),
+                ('estado', models.CharField(max_length=20)),
+                ('total', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Contador',
+                'verbose_name_plural': 'Contadores',
+                'constraints': [models.UniqueConstraint(fields=('modulo', 'fecha', 'estado'), name='contador_unico')],
+            },
+        ),
+        migrations.RunPython(cargar_contadores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def cargar_stock_bajo(apps, schema_editor):
+    Stock = apps.get_model('mainApp', 'Stock')
+    StockBajo = apps.get_model('mainApp', 'StockBajo')
+    StockBajo.objects.bulk_create([
+        StockBajo(ingrediente_id=ingrediente_id)
+        for ingrediente_id in Stock.objects.filter(
+            cantidad_disponible__lte=F('ingrediente__stock_minimo')
+        ).values_list('ingrediente_id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0005_contador'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockBajo',
+            fields=[
+                ('ingrediente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock_bajo', serialize=False, to='mainApp.ingrediente')),
+                ('desde', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(cargar_stock_bajo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def snapshot_inicial(apps, schema_editor):
+    # El stock existente no tiene movimientos: queda como punto de partida del libro
+    Stock = apps.get_model('mainApp', 'Stock')
+    SnapshotStock = apps.get_model('mainApp', 'SnapshotStock')
+    SnapshotStock.objects.bulk_create([
+        SnapshotStock(ingrediente_id=ingrediente_id, cantidad=cantidad)
+        for ingrediente_id, cantidad in Stock.objects.values_list('ingrediente_id', 'cantidad_disponible')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0006_stock_bajo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('reserva', 'Reserva'), ('liberacion', 'Liberación'), ('consumo', 'Consumo'), ('ajuste', 'Ajuste manual'), ('ingreso', 'Ingreso')], max_length=10)),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('referencia', models.CharField(blank=True, max_length=100)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='mainApp.ingrediente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ingrediente', 'id'], name='movimiento_ingrediente_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SnapshotStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('movimiento_id', models.BigIntegerField(default=0)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ingrediente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='mainApp.ingrediente')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ingrediente', 'creado_en'], name='snapshot_ingrediente_idx')],
+            },
+        ),
+        migrations.RunPython(snapshot_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0007_movimientos_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservastock',
+            index=models.Index(fields=['estado', 'fecha_creacion'], name='reservastock_vencida_idx'),
+        ),
+    ]
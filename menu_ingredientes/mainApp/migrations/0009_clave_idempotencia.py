@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0008_reservastock_vencida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('clave', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('huella', models.CharField(max_length=64)),
+                ('estado_http', models.PositiveSmallIntegerField(null=True)),
+                ('respuesta', models.TextField(blank=True)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0009_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservastock',
+            index=models.Index(fields=['fecha_creacion'], name='reservastock_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainApp', '0010_reservastock_fecha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservastock',
+            name='consumo',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
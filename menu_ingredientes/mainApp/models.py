@@ -25,6 +25,13 @@ class Ingrediente(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.unidad_medida})"
 
+class PlatoQuerySet(models.QuerySet):
+    def con_recetas(self):
+        """Categoría y recetas con su ingrediente en queries fijas (sin N+1 al serializar)"""
+        return self.select_related('categoria').prefetch_related(
+            models.Prefetch('recetas', queryset=Receta.objects.select_related('ingrediente'))
+        )
+
 class Plato(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField()
@@ -32,6 +39,8 @@ class Plato(models.Model):
     categoria = models.ForeignKey(CategoriaMenu, on_delete=models.CASCADE)
     activo = models.BooleanField(default=True)
     
+    objects = PlatoQuerySet.as_manager()
+    
     def __str__(self):
         return self.nombre
 
@@ -50,6 +59,69 @@ class Stock(models.Model):
     def __str__(self):
         return f"Stock {self.ingrediente.nombre}: {self.cantidad_disponible}"
 
+class StockBajo(models.Model):
+    """
+    Ingredientes que hoy están en o bajo su stock mínimo. La fila se crea
+    cuando el stock cruza el mínimo hacia abajo y se borra cuando se repone
+    (ver alertas_stock.py).
+    """
+    ingrediente = models.OneToOneField(
+        Ingrediente, on_delete=models.CASCADE, primary_key=True, related_name='stock_bajo'
+    )
+    desde = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Stock bajo {self.ingrediente_id} desde {self.desde}"
+
+class MovimientoStock(models.Model):
+    """
+    Libro de movimientos de Stock: solo se agregan filas (ver movimientos.py).
+    `cantidad` es el delta con signo: negativo para reservas y consumos,
+    positivo para liberaciones e ingresos; los ajustes manuales van en
+    cualquier sentido.
+    """
+    TIPOS = [
+        ('reserva', 'Reserva'),
+        ('liberacion', 'Liberación'),
+        ('consumo', 'Consumo'),
+        ('ajuste', 'Ajuste manual'),
+        ('ingreso', 'Ingreso'),
+    ]
+    
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='movimientos')
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2)
+    referencia = models.CharField(max_length=100, blank=True)  # pedido_id u origen del ajuste
+    creado_en = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.ingrediente_id}: {self.cantidad}"
+    
+    class Meta:
+        indexes = [
+            # Movimientos de un ingrediente posteriores a su último snapshot
+            models.Index(fields=['ingrediente', 'id'], name='movimiento_ingrediente_idx'),
+        ]
+
+class SnapshotStock(models.Model):
+    """
+    Saldo de un ingrediente según el libro, incluyendo todos los movimientos
+    hasta `movimiento_id` (0 = ninguno). Lo escribe el comando snapshot_stock.
+    """
+    ingrediente = models.ForeignKey(Ingrediente, on_delete=models.CASCADE, related_name='snapshots')
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2)
+    movimiento_id = models.BigIntegerField(default=0)
+    creado_en = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Snapshot {self.ingrediente_id} {self.creado_en}: {self.cantidad}"
+    
+    class Meta:
+        indexes = [
+            # Último snapshot de un ingrediente antes de un momento dado
+            models.Index(fields=['ingrediente', 'creado_en'], name='snapshot_ingrediente_idx'),
+        ]
+
 class ReservaStock(models.Model):
     ESTADOS = [
         ('reservado', 'Reservado'),
@@ -62,9 +134,22 @@ class ReservaStock(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADOS, default='reservado')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     pedido_id = models.CharField(max_length=100)
+    # {ingrediente_id: cantidad} descontado al reservar, para liberar lo mismo
+    # aunque la receta cambie después (None en reservas anteriores al campo)
+    consumo = models.JSONField(null=True, blank=True)
     
     def __str__(self):
         return f"Reserva {self.plato.nombre} - {self.estado}"
+    
+    class Meta:
+        indexes = [
+            # Reservas de stock de un pedido (confirmar / liberar)
+            models.Index(fields=['pedido_id', 'estado'], name='reservastock_pedido_idx'),
+            # Reservas vencidas sin confirmar (liberar_reservas_vencidas)
+            models.Index(fields=['estado', 'fecha_creacion'], name='reservastock_vencida_idx'),
+            # Exportación por rango de fechas
+            models.Index(fields=['fecha_creacion'], name='reservastock_fecha_idx'),
+        ]
 
 
 # ==================== MÓDULO 2: CLIENTES Y MESAS ====================
@@ -146,19 +231,19 @@ class Reserva(models.Model):
         
         # Validar que no haya otra reserva activa en la misma mesa y horario
         if self.mesa and self.fecha_reserva and self.hora_inicio and self.hora_fin:
-            # Buscar reservas que se solapen en tiempo
-            reservas_existentes = Reserva.objects.filter(
-                mesa=self.mesa,
-                fecha_reserva=self.fecha_reserva,
-                estado__in=['pendiente', 'confirmada']  # Solo considerar reservas activas
-            ).exclude(pk=self.pk)  # Excluir la reserva actual si estamos editando
-            
-            for reserva in reservas_existentes:
-                # Verificar si hay solapamiento de horarios
-                if (self.hora_inicio < reserva.hora_fin and self.hora_fin > reserva.hora_inicio):
-                    raise ValidationError({
-                        'mesa': f'La mesa {self.mesa.numero} ya está reservada de {reserva.hora_inicio.strftime("%H:%M")} a {reserva.hora_fin.strftime("%H:%M")} en esta fecha.'
-                    })
+            # Importar aquí para evitar circular imports
+            from .disponibilidad import reservas_que_solapan
+            # El solapamiento se resuelve en SQL; basta con el primer choque
+            reserva = (
+                reservas_que_solapan(self.fecha_reserva, self.hora_inicio, self.hora_fin, mesa=self.mesa)
+                .exclude(pk=self.pk)  # Excluir la reserva actual si estamos editando
+                .order_by('hora_inicio')
+                .first()
+            )
+            if reserva:
+                raise ValidationError({
+                    'mesa': f'La mesa {self.mesa.numero} ya está reservada de {reserva.hora_inicio.strftime("%H:%M")} a {reserva.hora_fin.strftime("%H:%M")} en esta fecha.'
+                })
     
     def __str__(self):
         return f"Reserva {self.id} - {self.cliente.username} - Mesa {self.mesa.numero} ({self.fecha_reserva})"
@@ -166,4 +251,58 @@ class Reserva(models.Model):
     class Meta:
         verbose_name = "Reserva"
         verbose_name_plural = "Reservas"
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Búsqueda de choques de horario (ver disponibilidad.py)
+            models.Index(
+                fields=['mesa', 'fecha_reserva', 'estado', 'hora_inicio', 'hora_fin'],
+                name='reserva_disponibilidad_idx',
+            ),
+            # Reservas del día en dashboards y grilla (sin mesa fija)
+            models.Index(fields=['fecha_reserva', 'estado', 'hora_inicio'], name='reserva_dia_idx'),
+        ]
+
+# ==================== CONTADORES DE DASHBOARDS ====================
+
+class Contador(models.Model):
+    """
+    Conteos materializados por módulo, día y estado (ver contadores.py).
+    Las filas con fecha SIN_FECHA guardan los totales globales: pedidos
+    activos de cualquier día, mesas por estado y stock bajo el mínimo.
+    """
+    MODULOS = [
+        ('pedido', 'Pedidos'),
+        ('cocina', 'Pedidos cocina'),
+        ('reserva', 'Reservas'),
+        ('mesa', 'Mesas'),
+        ('stock', 'Stock'),
+    ]
+    
+    modulo = models.CharField(max_length=10, choices=MODULOS)
+    fecha = models.DateField()
+    estado = models.CharField(max_length=20)
+    total = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.modulo} {self.fecha} {self.estado}: {self.total}"
+    
+    class Meta:
+        verbose_name = "Contador"
+        verbose_name_plural = "Contadores"
+        constraints = [
+            models.UniqueConstraint(fields=['modulo', 'fecha', 'estado'], name='contador_unico'),
+        ]
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de un POST con Idempotency-Key (ver idempotencia.py).
+    Mientras el request original se procesa `estado_http` es NULL.
+    """
+    clave = models.CharField(max_length=64, primary_key=True)  # sha256(alcance, usuario, key)
+    huella = models.CharField(max_length=64)  # sha256 del cuerpo del request
+    estado_http = models.PositiveSmallIntegerField(null=True)
+    respuesta = models.TextField(blank=True)
+    expira_en = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.clave[:12]} ({self.estado_http or 'en curso'})"
@@ -0,0 +1,143 @@
+"""
+Libro de movimientos de stock.
+
+Stock.cantidad_disponible guarda el saldo actual; MovimientoStock guarda por
+qué cambió: cada reserva, liberación, consumo, ajuste manual o ingreso agrega
+una fila con el delta, en el mismo bulk_create y la misma transacción que el
+UPDATE del stock (StockService) o el save() (señales de Stock). Las filas
+nunca se modifican.
+
+Para no sumar toda la historia, el comando `snapshot_stock` (pensado para
+correr periódicamente, por ejemplo cada noche) guarda en SnapshotStock el
+saldo de cada ingrediente que tuvo movimientos. El stock en un momento dado
+es entonces el último snapshot anterior a ese momento más los movimientos
+posteriores a él: un rango acotado del índice ingrediente + id, sin importar
+cuántos millones de filas tenga el libro.
+
+`conciliar()` compara el saldo del libro con Stock y reporta diferencias
+(cambios hechos con queryset.update() o SQL directo que no pasaron por aquí).
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Ingrediente, MovimientoStock, SnapshotStock, Stock
+
+
+RESERVA = 'reserva'
+LIBERACION = 'liberacion'
+CONSUMO = 'consumo'
+AJUSTE = 'ajuste'
+INGRESO = 'ingreso'
+
+
+def registrar(deltas, tipo, referencia=''):
+    """Agrega un movimiento por ingrediente de `deltas` ({ingrediente_id: delta}) en un INSERT"""
+    ahora = timezone.now()
+    MovimientoStock.objects.bulk_create([
+        MovimientoStock(
+            ingrediente_id=ingrediente_id, tipo=tipo, cantidad=delta,
+            referencia=str(referencia)[:100], creado_en=ahora,
+        )
+        for ingrediente_id, delta in sorted(deltas.items())
+        if delta
+    ])
+
+
+def stock_en(ingrediente_id, momento=None):
+    """Saldo del libro para `ingrediente_id` en `momento` (por defecto ahora)"""
+    momento = momento or timezone.now()
+    cantidad, desde = (
+        SnapshotStock.objects.filter(ingrediente_id=ingrediente_id, creado_en__lte=momento)
+        .order_by('-creado_en', '-id')
+        .values_list('cantidad', 'movimiento_id')
+        .first()
+    ) or (Decimal('0'), 0)
+    delta = MovimientoStock.objects.filter(
+        ingrediente_id=ingrediente_id, id__gt=desde, creado_en__lte=momento
+    ).aggregate(total=Sum('cantidad'))['total']
+    return cantidad + (delta or 0)
+
+
+def _ultimo_snapshot(ingrediente):
+    return SnapshotStock.objects.filter(ingrediente=ingrediente).order_by('-creado_en', '-id')
+
+
+def _saldos(tope=None):
+    """
+    Saldo del libro de cada ingrediente con snapshot o movimientos, con los
+    movimientos hasta `tope`. Retorna ({ingrediente_id: saldo}, ids con
+    movimientos posteriores a su último snapshot).
+    """
+    ultimo = _ultimo_snapshot(OuterRef('pk'))
+    bases = {
+        ingrediente_id: cantidad
+        for ingrediente_id, cantidad in Ingrediente.objects.annotate(
+            base=Subquery(ultimo.values('cantidad')[:1])
+        ).filter(base__isnull=False).values_list('pk', 'base')
+    }
+
+    movimientos = MovimientoStock.objects.annotate(
+        desde=Coalesce(Subquery(_ultimo_snapshot(OuterRef('ingrediente')).values('movimiento_id')[:1]), 0)
+    ).filter(id__gt=F('desde'))
+    if tope is not None:
+        movimientos = movimientos.filter(id__lte=tope)
+    deltas = dict(
+        movimientos.values('ingrediente').annotate(delta=Sum('cantidad'))
+        .values_list('ingrediente', 'delta').order_by()
+    )
+
+    saldos = dict(bases)
+    for ingrediente_id, delta in deltas.items():
+        saldos[ingrediente_id] = saldos.get(ingrediente_id, Decimal('0')) + delta
+    return saldos, set(deltas)
+
+
+def _bloquear_libro():
+    """
+    Espera a los que están escribiendo en el libro y frena a los nuevos hasta
+    confirmar. En PostgreSQL un id menor al Max(id) leído puede seguir sin
+    confirmar: quedaría fuera del snapshot y, como los saldos solo suman
+    id > movimiento_id, fuera de todo saldo posterior. SQLite tiene un solo
+    escritor, así que no hace falta.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'LOCK TABLE {connection.ops.quote_name(MovimientoStock._meta.db_table)} IN SHARE MODE'
+            )
+
+
+@transaction.atomic
+def tomar_snapshots():
+    """Guarda un snapshot de cada ingrediente con movimientos nuevos. Retorna cuántos"""
+    _bloquear_libro()
+    tope = MovimientoStock.objects.aggregate(tope=Max('id'))['tope']
+    if tope is None:
+        return 0
+    saldos, con_movimientos = _saldos(tope)
+    ahora = timezone.now()
+    SnapshotStock.objects.bulk_create([
+        SnapshotStock(ingrediente_id=ingrediente_id, cantidad=saldos[ingrediente_id],
+                      movimiento_id=tope, creado_en=ahora)
+        for ingrediente_id in sorted(con_movimientos)
+    ])
+    return len(con_movimientos)
+
+
+def conciliar():
+    """
+    Ingredientes cuyo Stock no coincide con el libro:
+    [{'ingrediente_id', 'stock', 'libro'}, ...]
+    """
+    saldos, _ = _saldos()
+    return [
+        {'ingrediente_id': ingrediente_id, 'stock': cantidad,
+         'libro': saldos.get(ingrediente_id, Decimal('0'))}
+        for ingrediente_id, cantidad in Stock.objects.order_by('ingrediente_id')
+        .values_list('ingrediente_id', 'cantidad_disponible')
+        if cantidad != saldos.get(ingrediente_id, Decimal('0'))
+    ]
@@ -1,22 +1,36 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
+from django.db import transaction
+from django.db.models import Q
 from django.utils.timezone import localtime
 import datetime
+import uuid
 
 from pedidos.models import Pedido
+from pedidos.outbox import encolar_alta_cocina
 from .models import Plato, Mesa
+from .services import porciones_disponibles
+from .cache_recetas import matriz_recetas
+from . import contadores
+from .idempotencia import idempotente
 
 
-ESTADOS_ACTIVOS = {"CREADO", "EN_PREPARACION", "LISTO", "ENTREGADO"}
+# Pedidos finalizados por página del historial
+TAMANO_HISTORIAL = 20
+
+# Campos que muestra el tablero
+CAMPOS_TABLERO = ('id', 'mesa', 'cliente', 'plato', 'estado', 'creado_en', 'actualizado_en')
+
+_EPOCA = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
 
 
 def _nombre_plato(codigo: str) -> str:
-    try:
-        p = Plato.objects.get(pk=codigo)
-        return p.nombre
-    except Exception:
-        return codigo or "-"
+    # Nombre desde la matriz de recetas en memoria: sin query por pedido
+    receta = matriz_recetas.receta(codigo, solo_activos=False)
+    if receta is not None:
+        return receta.nombre
+    return codigo or "-"
 
 
 def _fmt_hhmm(iso_dt):
@@ -30,55 +44,92 @@ def _fmt_hhmm(iso_dt):
 
 
 def _enriquecer_pedido(p):
+    """`p` es un dict de .values(*CAMPOS_TABLERO)"""
     p_dict = {
-        'id': str(p.id),
-        'mesa': p.mesa,
-        'cliente': p.cliente,
-        'plato': p.plato,
-        'plato_nombre': _nombre_plato(p.plato) if p.plato else '-',
-        'estado': p.estado,
-        'creado_en': p.creado_en,
-        'actualizado_en': p.actualizado_en,
-        'creado_str': _fmt_hhmm(p.creado_en),
-        'actu_str': _fmt_hhmm(p.actualizado_en),
+        'id': str(p['id']),
+        'mesa': p['mesa'],
+        'cliente': p['cliente'],
+        'plato': p['plato'],
+        'plato_nombre': _nombre_plato(p['plato']) if p['plato'] else '-',
+        'estado': p['estado'],
+        'creado_en': p['creado_en'],
+        'actualizado_en': p['actualizado_en'],
+        'creado_str': _fmt_hhmm(p['creado_en']),
+        'actu_str': _fmt_hhmm(p['actualizado_en']),
     }
     return p_dict
 
 
+def cursor_historial(creado_en, pedido_id):
+    """Cursor opaco (creado_en, id) para la página siguiente del historial"""
+    return f"{(creado_en - _EPOCA) // datetime.timedelta(microseconds=1)}.{uuid.UUID(str(pedido_id)).hex}"
+
+
+def _leer_cursor(valor):
+    try:
+        micros, pedido_id = valor.split('.', 1)
+        return _EPOCA + datetime.timedelta(microseconds=int(micros)), uuid.UUID(pedido_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def historial(antes=None, tamano=TAMANO_HISTORIAL):
+    """
+    Página de pedidos finalizados, los más nuevos primero, con paginación
+    por keyset sobre (creado_en, id): el costo no depende de cuántas páginas
+    haya antes. Retorna (pedidos, cursor de la página siguiente o None).
+    """
+    pedidos = Pedido.objects.finalizados()
+    cursor = _leer_cursor(antes) if antes else None
+    if cursor is not None:
+        creado_en, pedido_id = cursor
+        pedidos = pedidos.filter(Q(creado_en__lt=creado_en) | Q(creado_en=creado_en, id__lt=pedido_id))
+    pagina = list(pedidos.order_by('-creado_en', '-id').values(*CAMPOS_TABLERO)[:tamano + 1])
+    if len(pagina) <= tamano:
+        return pagina, None
+    ultimo = pagina[tamano - 1]
+    return pagina[:tamano], cursor_historial(ultimo['creado_en'], ultimo['id'])
+
+
 def mesero(request):
-    pedidos = Pedido.objects.all().order_by('-creado_en')
-    pedidos_ui = [_enriquecer_pedido(p) for p in pedidos]
-    
-    # Filtrar pedidos activos
-    pedidos_activos_obj = Pedido.objects.filter(estado__in=ESTADOS_ACTIVOS).order_by('-creado_en')
-    pedidos_activos_list = [_enriquecer_pedido(p) for p in pedidos_activos_obj]
-    
-    # Filtrar pedidos inactivos (CERRADO, CANCELADO)
-    pedidos_inactivos_obj = Pedido.objects.filter(
-        estado__in=['CERRADO', 'CANCELADO']
-    ).order_by('-actualizado_en')[:20]  # Últimos 20
-    pedidos_inactivos_list = [_enriquecer_pedido(p) for p in pedidos_inactivos_obj]
-    
-    # Agregar flag de modificación
+    # Activos: una query por índice, sin recorrer el historial
+    pedidos_activos_list = [
+        _enriquecer_pedido(p)
+        for p in Pedido.objects.activos().order_by('-creado_en').values(*CAMPOS_TABLERO)
+    ]
     for p in pedidos_activos_list:
         p['puede_modificarse'] = p['estado'] == 'CREADO'
-    
-    platos = Plato.objects.filter(activo=True)
+
+    antes = request.GET.get('antes')
+    pagina, siguiente = historial(antes)
+    pedidos_inactivos_list = [_enriquecer_pedido(p) for p in pagina]
+
+    # Total desde los contadores materializados en vez de COUNT(*) sobre Pedido
+    _, globales = contadores.leer(contadores.SIN_FECHA)
+
+    platos = list(Plato.objects.filter(activo=True))
+    porciones = porciones_disponibles()
+    for plato in platos:
+        plato.porciones = porciones.get(plato.id)
     mesas = Mesa.objects.all().order_by('numero')
     
     ctx = {
-        'pedidos': pedidos_ui,
         'pedidos_activos_list': pedidos_activos_list,
         'pedidos_inactivos_list': pedidos_inactivos_list,
+        'historial_siguiente': siguiente,
+        'historial_paginado': bool(antes),
         'pedidos_activos': len(pedidos_activos_list),
-        'total_pedidos': pedidos.count(),
+        'total_pedidos': sum(globales.get('pedido', {}).values()),
         'platos': platos,
-        'mesas': mesas
+        'mesas': mesas,
+        # Un reenvío del mismo formulario no crea un segundo pedido
+        'idempotency_key': uuid.uuid4().hex,
     }
     return render(request, 'mainApp/mesero.html', ctx)
 
 
 @require_http_methods(["POST"])
+@idempotente('crear_pedido')
 def crear_pedido(request):
     mesa = (request.POST.get('mesa') or '').strip()
     cliente = (request.POST.get('cliente') or '').strip()
@@ -98,28 +149,19 @@ def crear_pedido(request):
         return redirect('pedidos_mesero')
 
     # validar mesa
-    activos = Pedido.objects.exclude(estado__in=['CERRADO', 'CANCELADO'])
+    activos = Pedido.objects.activos()
     if activos.filter(mesa=mesa_num).exists():
         messages.error(request, f'La mesa {mesa_num} ya tiene un pedido activo.')
         return redirect('pedidos_mesero')
 
-    p = Pedido.objects.create(mesa=mesa_num, cliente=cliente, plato=plato)
-    
-    # Crear también en cocina (Módulo 4)
-    try:
-        from cocina.models import PedidoCocina
-        plato_obj = Plato.objects.filter(id=plato).first()
-        plato_nombre = plato_obj.nombre if plato_obj else f"Plato #{plato}"
-        PedidoCocina.objects.create(
-            id_modulo3=str(p.id),
-            mesa=mesa_num,
-            cliente=cliente,
-            descripcion=plato_nombre,
-            estado='CREADO'
-        )
-    except Exception as e:
-        pass  # No fallar si cocina no está disponible
-    
+    plato_obj = Plato.objects.filter(id=plato).first()
+    plato_nombre = plato_obj.nombre if plato_obj else f"Plato #{plato}"
+
+    # El alta en cocina (Módulo 4) viaja por el outbox junto con el pedido
+    with transaction.atomic():
+        p = Pedido.objects.create(mesa=mesa_num, cliente=cliente, plato=plato)
+        encolar_alta_cocina(p, plato_nombre, mesa_num)
+
     messages.success(request, f'Pedido para mesa {mesa_num} creado.')
     return redirect('pedidos_mesero')
 
@@ -132,25 +174,16 @@ def accion_confirmar(request, pedido_id):
             from mainApp.views import StockService
         except Exception:
             StockService = None
-        if StockService:
-            svc = StockService()
-            try:
-                svc.validar_y_reservar_stock(int(p.plato), 1, str(p.id))
-            except Exception as e:
-                messages.error(request, f'No se pudo reservar stock: {e}')
-                return redirect('pedidos_mesero')
-        p.confirmar()
-        
-        # Sincronizar con PedidoCocina
-        try:
-            from cocina.models import PedidoCocina
-            p_cocina = PedidoCocina.objects.filter(id_modulo3=str(pedido_id)).first()
-            if p_cocina:
-                p_cocina.estado = 'EN_PREPARACION'
-                p_cocina.save()
-        except Exception:
-            pass
-        
+        # La reserva se revierte si la transición pierde la carrera (ConflictoEstado)
+        with transaction.atomic():
+            if StockService:
+                svc = StockService()
+                try:
+                    svc.validar_y_reservar_stock(int(p.plato), 1, str(p.id))
+                except Exception as e:
+                    messages.error(request, f'No se pudo reservar stock: {e}')
+                    return redirect('pedidos_mesero')
+            p.confirmar()
         messages.success(request, 'Pedido confirmado (EN_PREPARACION).')
     except Exception as e:
         messages.error(request, f'No se pudo confirmar: {e}')
@@ -161,16 +194,6 @@ def accion_cancelar(request, pedido_id):
     try:
         p = Pedido.objects.get(pk=pedido_id)
         p.cancelar()
-        
-        # Eliminar de PedidoCocina
-        try:
-            from cocina.models import PedidoCocina
-            p_cocina = PedidoCocina.objects.filter(id_modulo3=str(pedido_id)).first()
-            if p_cocina:
-                p_cocina.delete()
-        except Exception:
-            pass
-        
         messages.info(request, 'Pedido cancelado (stock liberado).')
     except Exception as e:
         messages.error(request, f'No se pudo cancelar: {e}')
@@ -181,18 +204,6 @@ def accion_entregar(request, pedido_id):
     try:
         p = Pedido.objects.get(pk=pedido_id)
         p.entregar()
-        
-        # Sincronizar con PedidoCocina
-        try:
-            from cocina.models import PedidoCocina
-            from django.utils import timezone
-            p_cocina = PedidoCocina.objects.filter(id_modulo3=str(pedido_id)).first()
-            if p_cocina:
-                p_cocina.estado = 'ENTREGADO'
-                p_cocina.save()
-        except Exception:
-            pass
-        
         messages.success(request, 'Pedido marcado como ENTREGADO.')
     except Exception as e:
         messages.error(request, f'No se pudo entregar: {e}')
@@ -223,17 +234,7 @@ def cocina_en_preparacion(request, pedido_id):
         p_cocina = PedidoCocina.objects.filter(id_modulo3=str(pedido_id)).first()
         if p_cocina and p_cocina.estado in ['CREADO', 'URGENTE']:
             p_cocina.estado = 'EN_PREPARACION'
-            p_cocina.save()
-            
-            # Sincronizar con módulo 3
-            try:
-                p = Pedido.objects.get(pk=pedido_id)
-                if p.estado == 'CREADO':
-                    p.estado = 'EN_PREPARACION'
-                    p.save()
-            except Exception:
-                pass
-            
+            p_cocina.save()  # el outbox lo refleja en módulo 3
             messages.success(request, 'Pedido EN_PREPARACION.')
         else:
             messages.warning(request, 'El pedido no se puede preparar.')
@@ -245,12 +246,7 @@ def cocina_en_preparacion(request, pedido_id):
 def cocina_sin_ingredientes(request, pedido_id):
     """Cancelar pedido por falta de ingredientes"""
     try:
-        from cocina.models import PedidoCocina
-        # Cancelar en módulo 4
-        p_cocina = PedidoCocina.objects.filter(id_modulo3=str(pedido_id)).first()
-        if p_cocina:
-            p_cocina.delete()
-        # Cancelar en módulo 3
+        # Cancelar en módulo 3; el outbox lo quita de cocina
         p = Pedido.objects.get(pk=pedido_id)
         p.cancelar()
         messages.info(request, 'Cocina: sin ingredientes, pedido CANCELADO.')
@@ -269,16 +265,7 @@ def cocina_listo(request, pedido_id):
         if p_cocina and p_cocina.estado == 'EN_PREPARACION':
             p_cocina.estado = 'LISTO'
             p_cocina.hora_listo = timezone.now()
-            p_cocina.save()
-            
-            # Sincronizar con módulo 3
-            try:
-                p = Pedido.objects.get(pk=pedido_id)
-                p.estado = 'LISTO'
-                p.save()
-            except Exception:
-                pass
-            
+            p_cocina.save()  # el outbox lo refleja en módulo 3
             messages.success(request, 'Cocina: pedido LISTO para entregar.')
         else:
             messages.warning(request, 'El pedido no está en preparación.')
@@ -291,25 +278,15 @@ def cocina_entregar(request, pedido_id):
     """Entregar pedido al cliente"""
     try:
         from cocina.models import PedidoCocina
-        from django.utils import timezone
         # Actualizar en módulo 4
         p_cocina = PedidoCocina.objects.filter(id_modulo3=str(pedido_id)).first()
         if p_cocina and p_cocina.estado == 'LISTO':
-            p_cocina.estado = 'ENTREGADO'
-            p_cocina.save()
-            
-            # Sincronizar con módulo 3
-            try:
-                p = Pedido.objects.get(pk=pedido_id)
-                p.estado = 'ENTREGADO'
-                p.entregado_en = timezone.now()
-                p.save()
-            except Exception:
-                pass
-            
-            # Eliminar de cocina después de entregar
-            p_cocina.delete()
-            
+            with transaction.atomic():
+                p_cocina.estado = 'ENTREGADO'
+                p_cocina.save()  # el outbox lo refleja en módulo 3
+                # Eliminar de cocina después de entregar
+                p_cocina.delete()
+
             messages.success(request, 'Pedido ENTREGADO. Puede cerrarse desde la vista de pedidos.')
         else:
             messages.warning(request, 'El pedido no está listo.')
@@ -1 +1,421 @@
-Hola
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, When, F, Q, Value, DecimalField
+from django.core.exceptions import ValidationError
+
+from .models import Ingrediente, Stock, ReservaStock, Receta
+from .cache_recetas import matriz_recetas
+from . import alertas_stock, movimientos
+
+
+def stock_disponible(ingrediente_ids):
+    """{ingrediente_id: cantidad_disponible} en una sola query"""
+    return dict(
+        Stock.objects.filter(ingrediente_id__in=list(ingrediente_ids))
+        .values_list('ingrediente_id', 'cantidad_disponible')
+    )
+
+
+def porciones_disponibles():
+    """
+    Porciones que se pueden preparar de cada plato activo con el stock actual.
+
+    Arma la matriz receta (platos x ingredientes) desde cache_recetas.py y el
+    vector de stock en una sola query, y calcula min(stock / cantidad) por fila
+    con NumPy. Un ingrediente sin fila de Stock cuenta como 0. Retorna
+    {plato_id: porciones}, con None para platos sin receta (no consumen stock).
+    """
+    recetas = matriz_recetas.platos_activos()
+    ingredientes = sorted({ing_id for receta in recetas for ing_id in receta.ingredientes})
+    columnas = {ing_id: j for j, ing_id in enumerate(ingredientes)}
+    disponibles = stock_disponible(ingredientes)
+
+    stock = np.array([float(disponibles.get(ing_id, 0)) for ing_id in ingredientes])
+    matriz = np.zeros((len(recetas), len(ingredientes)))
+    filas = [i for i, receta in enumerate(recetas) for _ in receta.ingredientes]
+    cols = [columnas[ing_id] for receta in recetas for ing_id in receta.ingredientes]
+    matriz[filas, cols] = [float(cant) for receta in recetas for cant in receta.cantidades]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cocientes = np.where(matriz > 0, stock / matriz, np.inf)
+    # El epsilon evita que 0.3 / 0.1 = 2.999... quede en 2 por redondeo binario
+    porciones = np.floor(cocientes.min(axis=1, initial=np.inf) + 1e-9)
+
+    return {
+        receta.plato_id: None if np.isinf(p) else max(int(p), 0)
+        for receta, p in zip(recetas, porciones)
+    }
+
+
+class StockInsuficiente(ValidationError):
+    """ValidationError que además expone el detalle de ingredientes faltantes"""
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        self.lineas = []
+        primero = faltantes[0]
+        super().__init__(
+            f"Stock insuficiente de {primero['ingrediente']}. "
+            f"Necesario: {primero['necesario']}, Disponible: {primero['disponible']}"
+        )
+
+
+# SERVICIO DE STOCK
+class StockService:
+    """
+    Reserva de stock basada en conjuntos.
+
+    Cada reserva usa un número constante de sentencias sin importar cuántos
+    ingredientes tenga el plato: la receta sale de la matriz en memoria
+    (cache_recetas.py), luego un SELECT ... FOR UPDATE sobre todas las filas de
+    Stock afectadas (siempre en el mismo orden para evitar deadlocks entre
+    meseros) y un único UPDATE condicional que descuenta todo de una vez.
+    """
+
+    def obtener_recetas(self, plato_ids):
+        """
+        Vectores de receta de varios platos, leídos desde la matriz en memoria.
+
+        Retorna ({plato_id: nombre}, {plato_id: {ingrediente_id: cantidad}},
+        {ingrediente_id: nombre}).
+        """
+        platos, recetas, nombres = {}, {}, {}
+        for plato_id in set(plato_ids):
+            receta = matriz_recetas.receta(plato_id)
+            if receta is None:
+                raise ValidationError("Plato no encontrado o inactivo")
+            platos[receta.plato_id] = receta.nombre
+            recetas[receta.plato_id] = dict(zip(receta.ingredientes, receta.cantidades))
+            for ing_id in receta.ingredientes:
+                nombres[ing_id] = matriz_recetas.nombre_ingrediente(ing_id)
+        return platos, recetas, nombres
+
+    def verificar(self, plato_id, cantidad=1):
+        """
+        Verificación de solo lectura (sin bloquear ni descontar).
+
+        Retorna (receta, faltantes) donde faltantes tiene el mismo formato que
+        StockInsuficiente. Los ingredientes sin fila de Stock no se reportan,
+        igual que en las verificaciones históricas de la API. Retorna
+        (None, []) si el plato no existe o está inactivo.
+        """
+        receta = matriz_recetas.receta(plato_id)
+        if receta is None:
+            return None, []
+        disponibles = stock_disponible(receta.ingredientes)
+        faltantes = [
+            {
+                'ingrediente_id': ing_id,
+                'ingrediente': matriz_recetas.nombre_ingrediente(ing_id),
+                'necesario': cant * cantidad,
+                'disponible': disponibles[ing_id],
+            }
+            for ing_id, cant in zip(receta.ingredientes, receta.cantidades)
+            if ing_id in disponibles and disponibles[ing_id] < cant * cantidad
+        ]
+        return receta, faltantes
+
+    def _bloquear(self, ids, estricto=True):
+        """
+        SELECT ... FOR UPDATE de las filas de Stock de `ids` en orden de
+        ingrediente_id. Retorna ({ingrediente_id: disponible}, {ingrediente_id: mínimo}).
+        Con `estricto` falla si algún ingrediente no tiene fila de Stock.
+        """
+        filas = list(
+            Stock.objects.select_for_update(of=('self',))
+            .filter(ingrediente_id__in=ids)
+            .order_by('ingrediente_id')
+            .values_list('ingrediente_id', 'cantidad_disponible', 'ingrediente__stock_minimo')
+        )
+        if estricto and len(filas) != len(ids):
+            raise ValidationError("Error en configuración de stock")
+        return (
+            {ing_id: cantidad for ing_id, cantidad, _ in filas},
+            {ing_id: minimo for ing_id, _, minimo in filas},
+        )
+
+    def descontar(self, demanda, nombres, tipo=movimientos.RESERVA, referencia='', estricto=True):
+        """
+        Descuenta `demanda` ({ingrediente_id: cantidad}) del stock y retorna lo
+        descontado. Con `estricto` un ingrediente sin fila de Stock es un error
+        de configuración; si no, ese ingrediente no se controla y se omite.
+
+        Debe ejecutarse dentro de una transacción. Bloquea las filas de Stock en
+        orden de ingrediente_id, valida todo contra el vector de demanda y aplica
+        un UPDATE ... SET cantidad_disponible = cantidad_disponible - X
+        WHERE cantidad_disponible >= X para todas las filas a la vez. Los
+        movimientos del libro (`tipo`: reserva o consumo) se insertan en un
+        solo INSERT.
+        """
+        if not demanda:
+            return {}
+
+        ids = sorted(demanda)
+        disponibles, minimos = self._bloquear(ids, estricto=estricto)
+        ids = [ing_id for ing_id in ids if ing_id in disponibles]
+        if not ids:
+            return {}
+
+        faltantes = [
+            {
+                'ingrediente_id': ing_id,
+                'ingrediente': nombres[ing_id],
+                'necesario': demanda[ing_id],
+                'disponible': disponibles[ing_id],
+            }
+            for ing_id in ids
+            if disponibles[ing_id] < demanda[ing_id]
+        ]
+        if faltantes:
+            raise StockInsuficiente(faltantes)
+
+        condicion = Q()
+        for ing_id in ids:
+            condicion |= Q(ingrediente_id=ing_id, cantidad_disponible__gte=demanda[ing_id])
+
+        actualizados = Stock.objects.filter(condicion).update(
+            cantidad_disponible=Case(
+                *[
+                    When(ingrediente_id=ing_id, then=F('cantidad_disponible') - Value(demanda[ing_id]))
+                    for ing_id in ids
+                ],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+
+        # Con las filas bloqueadas esto no debería ocurrir, pero en motores sin
+        # SELECT ... FOR UPDATE (SQLite) el WHERE condicional es la última defensa
+        if actualizados != len(ids):
+            raise ValidationError("Stock insuficiente: el stock cambió durante la reserva")
+
+        movimientos.registrar({ing_id: -demanda[ing_id] for ing_id in ids}, tipo, referencia)
+
+        # El UPDATE masivo no dispara señales: los cruces del mínimo se registran aquí
+        alertas_stock.registrar([
+            (ing_id, disponibles[ing_id] <= minimos[ing_id],
+             disponibles[ing_id] - demanda[ing_id], minimos[ing_id])
+            for ing_id in ids
+        ])
+        return {ing_id: demanda[ing_id] for ing_id in ids}
+
+    @transaction.atomic
+    def reponer(self, cantidades, tipo=movimientos.INGRESO, referencia=''):
+        """
+        Suma `cantidades` ({ingrediente_id: cantidad}) al stock con un único
+        UPDATE y registra los movimientos (`tipo`: ingreso o liberación).
+        """
+        cantidades = {ing_id: cant for ing_id, cant in cantidades.items() if cant}
+        if not cantidades:
+            return
+        if any(cant < 0 for cant in cantidades.values()):
+            raise ValidationError("Las cantidades a reponer deben ser positivas")
+
+        ids = sorted(cantidades)
+        disponibles, minimos = self._bloquear(ids, estricto=tipo != movimientos.LIBERACION)
+        # Una liberación no debe impedir cancelar un pedido cuyo ingrediente ya no tiene Stock
+        ids = [ing_id for ing_id in ids if ing_id in disponibles]
+        cantidades = {ing_id: cantidades[ing_id] for ing_id in ids}
+        if not ids:
+            return
+
+        Stock.objects.filter(ingrediente_id__in=ids).update(
+            cantidad_disponible=Case(
+                *[
+                    When(ingrediente_id=ing_id, then=F('cantidad_disponible') + Value(cantidades[ing_id]))
+                    for ing_id in ids
+                ],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+        movimientos.registrar(cantidades, tipo, referencia)
+        alertas_stock.registrar([
+            (ing_id, disponibles[ing_id] <= minimos[ing_id],
+             disponibles[ing_id] + cantidades[ing_id], minimos[ing_id])
+            for ing_id in ids
+        ])
+
+    @transaction.atomic
+    def validar_y_reservar_lineas(self, lineas, pedido_id, estricto=True):
+        """
+        Reserva stock para todas las líneas de una comanda en una transacción.
+
+        `lineas` es una lista de (plato_id, cantidad). La demanda de cada
+        ingrediente se suma entre todas las líneas antes de validar, así que una
+        mesa completa cuesta las mismas sentencias que un solo plato.
+        Sin `estricto` los ingredientes sin fila de Stock no se controlan (ver
+        descontar). Retorna una lista de ReservaStock, una por línea y en el
+        mismo orden.
+        """
+        try:
+            lineas = [(int(plato_id), int(cantidad)) for plato_id, cantidad in lineas]
+        except (TypeError, ValueError):
+            raise ValidationError("plato_id y cantidad deben ser números válidos")
+        if not lineas:
+            raise ValidationError("Se requiere al menos una línea")
+        if any(cantidad <= 0 for _, cantidad in lineas):
+            raise ValidationError("cantidad debe ser mayor a 0")
+
+        platos, recetas, nombres = self.obtener_recetas([plato_id for plato_id, _ in lineas])
+
+        demanda = {}
+        for plato_id, cantidad in lineas:
+            for ing_id, cant in recetas[plato_id].items():
+                demanda[ing_id] = demanda.get(ing_id, 0) + cant * cantidad
+
+        try:
+            descontado = self.descontar(demanda, nombres, referencia=pedido_id, estricto=estricto)
+        except StockInsuficiente as e:
+            # Detalle por línea para que el mesero sepa qué plato quitar
+            faltan = {f['ingrediente_id'] for f in e.faltantes}
+            e.lineas = [
+                {
+                    'plato_id': plato_id,
+                    'plato': platos[plato_id],
+                    'cantidad': cantidad,
+                    'ok': not faltan.intersection(recetas[plato_id]),
+                    'ingredientes_faltantes': [nombres[i] for i in recetas[plato_id] if i in faltan],
+                }
+                for plato_id, cantidad in lineas
+            ]
+            raise
+
+        return ReservaStock.objects.bulk_create([
+            ReservaStock(
+                plato_id=plato_id, cantidad=cantidad, pedido_id=pedido_id, estado='reservado',
+                consumo={
+                    str(ing_id): str(cant * cantidad)
+                    for ing_id, cant in recetas[plato_id].items() if ing_id in descontado
+                },
+            )
+            for plato_id, cantidad in lineas
+        ])
+
+    def validar_y_reservar_stock(self, plato_id, cantidad, pedido_id, estricto=True):
+        return self.validar_y_reservar_lineas([(plato_id, cantidad)], pedido_id, estricto)[0]
+
+    @transaction.atomic
+    def importar(self, lineas, tipo=movimientos.INGRESO, referencia=''):
+        """
+        Aplica una recepción (`tipo` ingreso: suma) o un conteo de inventario
+        (`tipo` ajuste: la cantidad reemplaza al stock) de muchos ingredientes.
+
+        `lineas` es [(ingrediente_id, cantidad)] ya validadas. Bloquea las filas
+        de Stock existentes, las actualiza con un bulk_update, crea las que
+        faltan con un bulk_create y registra los movimientos en un INSERT.
+        Retorna {ingrediente_id: (anterior, nuevo)}.
+        """
+        objetivo = {}
+        for ing_id, cantidad in lineas:
+            if tipo == movimientos.INGRESO:
+                objetivo[ing_id] = objetivo.get(ing_id, 0) + cantidad
+            else:
+                objetivo[ing_id] = cantidad
+        ids = sorted(objetivo)
+
+        minimos = dict(Ingrediente.objects.filter(pk__in=ids).values_list('pk', 'stock_minimo'))
+        existentes = {
+            ing_id: (pk, cantidad)
+            for pk, ing_id, cantidad in Stock.objects.select_for_update()
+            .filter(ingrediente_id__in=ids).order_by('ingrediente_id')
+            .values_list('pk', 'ingrediente_id', 'cantidad_disponible')
+        }
+
+        cambios, actualizar, crear = {}, [], []
+        for ing_id in ids:
+            pk, anterior = existentes.get(ing_id, (None, None))
+            base = anterior if anterior is not None else 0
+            nuevo = base + objetivo[ing_id] if tipo == movimientos.INGRESO else objetivo[ing_id]
+            cambios[ing_id] = (anterior, nuevo)
+            if pk is None:
+                crear.append(Stock(ingrediente_id=ing_id, cantidad_disponible=nuevo))
+            elif nuevo != anterior:
+                actualizar.append(Stock(pk=pk, ingrediente_id=ing_id, cantidad_disponible=nuevo))
+
+        # bulk_update / bulk_create no disparan señales: libro y alertas se registran aquí
+        Stock.objects.bulk_update(actualizar, ['cantidad_disponible'], batch_size=500)
+        Stock.objects.bulk_create(crear, batch_size=500)
+        movimientos.registrar(
+            {ing_id: nuevo - (anterior or 0) for ing_id, (anterior, nuevo) in cambios.items()},
+            tipo, referencia,
+        )
+        alertas_stock.registrar([
+            (ing_id, alertas_stock.bajo_minimo(anterior, minimos[ing_id]), nuevo, minimos[ing_id])
+            for ing_id, (anterior, nuevo) in cambios.items()
+        ])
+        return cambios
+
+    # ---------- Ciclo de vida de las reservas ----------
+
+    def confirmar_reservas(self, pedido_id):
+        """
+        El pedido se entregó: sus reservas pasan a confirmadas con un UPDATE.
+        El stock ya se descontó al reservar, así que no cambia.
+        """
+        return ReservaStock.objects.filter(
+            pedido_id=str(pedido_id), estado='reservado'
+        ).update(estado='confirmado')
+
+    def liberar_reservas(self, pedido_id):
+        """El pedido se canceló: devuelve al stock lo que tenía reservado"""
+        return self._liberar(
+            ReservaStock.objects.filter(pedido_id=str(pedido_id), estado='reservado'),
+            referencia=pedido_id,
+        )
+
+    def liberar_vencidas(self, antes_de, lote=500):
+        """
+        Libera las reservas creadas antes de `antes_de` que siguen sin
+        confirmar, de a `lote` por transacción. Retorna cuántas liberó.
+        """
+        total = 0
+        while True:
+            liberadas = self._liberar(
+                ReservaStock.objects.filter(estado='reservado', fecha_creacion__lt=antes_de)
+                .order_by('id')[:lote],
+                referencia='reservas vencidas',
+            )
+            total += liberadas
+            if liberadas < lote:
+                return total
+
+    @transaction.atomic
+    def _liberar(self, reservas, referencia):
+        """
+        Marca `reservas` (queryset de ReservaStock en estado reservado) como
+        liberadas y devuelve al stock lo que cada una descontó (su `consumo`)
+        con un único UPDATE, sin importar cuántas reservas o ingredientes sean.
+        """
+        filas = list(reservas.select_for_update().values_list('id', 'plato_id', 'cantidad', 'consumo'))
+        if not filas:
+            return 0
+
+        # Reservas sin `consumo` (anteriores al campo): la demanda sale de las
+        # recetas de la tabla, porque un plato desactivado ya no está en la matriz
+        recetas = {}
+        sin_consumo = {plato_id for _, plato_id, _, consumo in filas if consumo is None}
+        if sin_consumo:
+            for plato_id, ing_id, cantidad in Receta.objects.filter(
+                plato_id__in=sin_consumo
+            ).values_list('plato_id', 'ingrediente_id', 'cantidad'):
+                recetas.setdefault(plato_id, []).append((ing_id, cantidad))
+
+        demanda = {}
+        for _, plato_id, cantidad, consumo in filas:
+            if consumo is None:
+                lineas = [(ing_id, cant * cantidad) for ing_id, cant in recetas.get(plato_id, [])]
+            else:
+                lineas = [(int(ing_id), Decimal(cant)) for ing_id, cant in consumo.items()]
+            for ing_id, cant in lineas:
+                demanda[ing_id] = demanda.get(ing_id, 0) + cant
+
+        ids = [fila[0] for fila in filas]
+        liberadas = ReservaStock.objects.filter(id__in=ids, estado='reservado').update(estado='liberado')
+        # Misma defensa que en descontar para motores sin SELECT ... FOR UPDATE
+        if liberadas != len(ids):
+            raise ValidationError("Las reservas cambiaron durante la liberación")
+
+        self.reponer(demanda, tipo=movimientos.LIBERACION, referencia=referencia)
+        return len(ids)
+
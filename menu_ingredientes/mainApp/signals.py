@@ -0,0 +1,202 @@
+from decimal import Decimal
+
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from cocina.models import PedidoCocina
+from pedidos.models import Pedido
+from pedidos.transiciones import estado_cambiado
+from .models import CategoriaMenu, Plato, Receta, Ingrediente, Stock, Mesa, Reserva
+from .cache_recetas import matriz_recetas
+from .services import StockService
+from . import alertas_stock, cache_menu, contadores, movimientos
+
+
+# ==================== CACHÉ DE RECETAS ====================
+
+@receiver([post_save, post_delete], sender=Receta)
+def invalidar_receta(sender, instance, **kwargs):
+    matriz_recetas.invalidar_plato(instance.plato_id)
+
+
+@receiver([post_save, post_delete], sender=Plato)
+def invalidar_plato(sender, instance, **kwargs):
+    matriz_recetas.invalidar_plato(instance.pk)
+
+
+@receiver(post_save, sender=Ingrediente)
+def actualizar_ingrediente(sender, instance, **kwargs):
+    matriz_recetas.actualizar_ingrediente(instance.pk, instance.nombre)
+
+
+# ==================== CACHÉ DEL MENÚ PÚBLICO ====================
+
+@receiver([post_save, post_delete], sender=Plato)
+@receiver([post_save, post_delete], sender=CategoriaMenu)
+@receiver([post_save, post_delete], sender=Receta)
+@receiver([post_save, post_delete], sender=Ingrediente)
+def invalidar_menu(sender, instance, **kwargs):
+    cache_menu.invalidar_menu()
+
+
+# ==================== CONTADORES DE DASHBOARDS ====================
+
+def _recordar(instance, *campos):
+    # __dict__ para no disparar una query si el campo viene diferido
+    instance._contador_original = tuple(instance.__dict__.get(campo) for campo in campos)
+
+
+@receiver(post_init, sender=PedidoCocina)
+@receiver(post_init, sender=Mesa)
+def recordar_estado_contador(sender, instance, **kwargs):
+    _recordar(instance, 'estado')
+
+
+@receiver(post_init, sender=Reserva)
+def recordar_reserva_contador(sender, instance, **kwargs):
+    _recordar(instance, 'fecha_reserva', 'estado')
+
+
+@receiver(post_init, sender=Stock)
+def recordar_stock_contador(sender, instance, **kwargs):
+    _recordar(instance, 'cantidad_disponible')
+
+
+@receiver(post_init, sender=Ingrediente)
+def recordar_minimo_contador(sender, instance, **kwargs):
+    _recordar(instance, 'stock_minimo')
+
+
+@receiver(post_save, sender=Pedido)
+def contar_pedido(sender, instance, created, **kwargs):
+    # Los cambios de estado los cuenta mover_pedido (estado_cambiado), con el
+    # estado previo que deja pedidos/signals.py
+    if created:
+        contadores.mover('pedido', None, (contadores.dia_local(instance.creado_en), instance.estado))
+
+
+@receiver(estado_cambiado, sender=Pedido)
+def mover_pedido(sender, instance, desde, hacia, **kwargs):
+    dia = contadores.dia_local(instance.creado_en)
+    contadores.mover('pedido', (dia, desde), (dia, hacia))
+
+
+@receiver(post_save, sender=PedidoCocina)
+def contar_pedido_cocina(sender, instance, created, **kwargs):
+    dia = contadores.dia_local(instance.fecha_creacion)
+    (estado,) = instance._contador_original
+    contadores.mover('cocina', None if created else (dia, estado), (dia, instance.estado))
+    _recordar(instance, 'estado')
+
+
+@receiver(post_save, sender=Reserva)
+def contar_reserva(sender, instance, created, **kwargs):
+    antes = instance._contador_original
+    contadores.mover('reserva', None if created else antes, (instance.fecha_reserva, instance.estado))
+    _recordar(instance, 'fecha_reserva', 'estado')
+
+
+@receiver(post_save, sender=Mesa)
+def contar_mesa(sender, instance, created, **kwargs):
+    (estado,) = instance._contador_original
+    contadores.mover('mesa', None if created else (None, estado), (None, instance.estado))
+    _recordar(instance, 'estado')
+
+
+@receiver(post_delete, sender=Pedido)
+def descontar_pedido(sender, instance, **kwargs):
+    contadores.mover('pedido', (contadores.dia_local(instance.creado_en), instance.estado), None)
+
+
+@receiver(post_delete, sender=PedidoCocina)
+def descontar_pedido_cocina(sender, instance, **kwargs):
+    contadores.mover('cocina', (contadores.dia_local(instance.fecha_creacion), instance.estado), None)
+
+
+@receiver(post_delete, sender=Reserva)
+def descontar_reserva(sender, instance, **kwargs):
+    contadores.mover('reserva', (instance.fecha_reserva, instance.estado), None)
+
+
+@receiver(post_delete, sender=Mesa)
+def descontar_mesa(sender, instance, **kwargs):
+    contadores.mover('mesa', (None, instance.estado), None)
+
+
+# Stock bajo el mínimo: cambia con la cantidad disponible o con el mínimo del
+# ingrediente. alertas_stock ajusta StockBajo, el contador y emite la alerta.
+
+@receiver(post_save, sender=Stock)
+def cruce_stock(sender, instance, created, **kwargs):
+    minimo = Ingrediente.objects.values_list('stock_minimo', flat=True).get(pk=instance.ingrediente_id)
+    (cantidad_original,) = instance._contador_original
+    estaba_bajo = not created and alertas_stock.bajo_minimo(cantidad_original, minimo)
+    alertas_stock.registrar([(instance.ingrediente_id, estaba_bajo, instance.cantidad_disponible, minimo)])
+    _recordar(instance, 'cantidad_disponible')
+
+
+@receiver(post_delete, sender=Stock)
+def cruce_stock_eliminado(sender, instance, **kwargs):
+    minimo = Ingrediente.objects.values_list('stock_minimo', flat=True).filter(pk=instance.ingrediente_id).first()
+    estaba_bajo = alertas_stock.bajo_minimo(instance.cantidad_disponible, minimo)
+    alertas_stock.registrar([(instance.ingrediente_id, estaba_bajo, None, minimo)])
+
+
+@receiver(post_save, sender=Ingrediente)
+def cruce_minimo(sender, instance, created, **kwargs):
+    (minimo_original,) = instance._contador_original
+    _recordar(instance, 'stock_minimo')
+    if created or minimo_original == instance.stock_minimo:
+        return
+    cantidad = Stock.objects.values_list('cantidad_disponible', flat=True).filter(
+        ingrediente_id=instance.pk
+    ).first()
+    if cantidad is None:
+        return
+    estaba_bajo = alertas_stock.bajo_minimo(cantidad, minimo_original)
+    alertas_stock.registrar([(instance.pk, estaba_bajo, cantidad, instance.stock_minimo)])
+
+
+# ==================== LIBRO DE MOVIMIENTOS ====================
+
+@receiver(post_init, sender=Stock)
+def recordar_stock_libro(sender, instance, **kwargs):
+    instance._cantidad_libro = instance.__dict__.get('cantidad_disponible')
+
+
+@receiver(post_save, sender=Stock)
+def registrar_movimiento_stock(sender, instance, created, **kwargs):
+    # Los cambios por save() (formularios, admin, API) son el alta o ajustes manuales
+    cantidad = Decimal(str(instance.cantidad_disponible))
+    if created:
+        movimientos.registrar({instance.ingrediente_id: cantidad}, movimientos.INGRESO)
+    else:
+        anterior = Decimal(str(instance._cantidad_libro))
+        movimientos.registrar({instance.ingrediente_id: cantidad - anterior}, movimientos.AJUSTE)
+    instance._cantidad_libro = instance.cantidad_disponible
+
+
+@receiver(post_delete, sender=Stock)
+def registrar_baja_stock(sender, instance, origin=None, **kwargs):
+    # Si se elimina el ingrediente completo su libro se va con él (CASCADE)
+    if isinstance(origin, Ingrediente) or getattr(origin, 'model', None) is Ingrediente:
+        return
+    movimientos.registrar(
+        {instance.ingrediente_id: -Decimal(str(instance.cantidad_disponible))}, movimientos.AJUSTE
+    )
+
+
+# ==================== CICLO DE VIDA DE RESERVAS DE STOCK ====================
+
+@receiver(estado_cambiado, sender=Pedido)
+def ciclo_reservas_stock(sender, instance, hacia, **kwargs):
+    if hacia == Pedido.Estado.ENTREGADO:
+        StockService().confirmar_reservas(instance.pk)
+    elif hacia == Pedido.Estado.CANCELADO:
+        StockService().liberar_reservas(instance.pk)
+
+
+@receiver(post_delete, sender=Pedido)
+def liberar_reservas_pedido_eliminado(sender, instance, **kwargs):
+    StockService().liberar_reservas(instance.pk)
+
@@ -1,13 +1,39 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock
-from .services import StockService
+from .models import (CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock, Mesa, Reserva, Contador,
+                     StockBajo, MovimientoStock, SnapshotStock, ClaveIdempotencia)
+from .services import StockService, porciones_disponibles
+from .cache_recetas import matriz_recetas
+from .cache_utils import obtener_o_calcular
+from . import contadores, idempotencia, movimientos
+from .disponibilidad import AgendaDia, mesas_libres, intervalo_desde, reservas_que_solapan
+from cocina.models import PedidoCocina
+from pedidos.models import Pedido
 
 class PlatoAPITests(APITestCase):
     
     def setUp(self):
+        cache.clear()  # el listado de platos se cachea por versión del menú
         # Crear datos de prueba
         self.categoria = CategoriaMenu.objects.create(
             nombre="Platos Principales",
@@ -167,6 +193,9 @@ class StockServiceTests(TestCase):
     """
     
     def setUp(self):
+        # La matriz de recetas vive en memoria y no se revierte con la transacción del test
+        matriz_recetas.invalidar_todo()
+
         # Configurar datos para pruebas de stock
         self.categoria = CategoriaMenu.objects.create(nombre="Principal")
         
@@ -258,6 +287,224 @@ class StockServiceTests(TestCase):
         
         self.assertIn("no encontrado", str(context.exception).lower())
 
+    def test_ingrediente_sin_stock(self):
+        """
+        Sin fila de Stock la reserva es un error de configuración, salvo que
+        el llamador pida no controlar esos ingredientes
+        """
+        Stock.objects.filter(ingrediente=self.ingrediente2).delete()
+        service = StockService()
+
+        with self.assertRaises(ValidationError) as context:
+            service.validar_y_reservar_stock(plato_id=self.plato.id, cantidad=1, pedido_id="TEST-004")
+        self.assertIn("configuración de stock", str(context.exception))
+
+        reserva = service.validar_y_reservar_stock(
+            plato_id=self.plato.id, cantidad=1, pedido_id="TEST-005", estricto=False
+        )
+        self.assertEqual(list(reserva.consumo), [str(self.ingrediente1.id)])
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente1).cantidad_disponible, 8)
+
+    def test_reserva_usa_cantidad_constante_de_queries(self):
+        """
+        La reserva no debe crecer en queries con la cantidad de ingredientes
+        """
+        service = StockService()
+        service.verificar(self.plato.id)  # carga la matriz de recetas
+
+        # savepoint + select_for_update + update + insert movimientos
+        # + insert reserva + release savepoint
+        with self.assertNumQueries(6):
+            service.validar_y_reservar_stock(
+                plato_id=self.plato.id,
+                cantidad=1,
+                pedido_id="TEST-004"
+            )
+
+    def test_matriz_recetas_se_invalida_al_cambiar_receta(self):
+        """
+        Cambiar una receta debe reflejarse en la siguiente lectura de la matriz
+        """
+        service = StockService()
+        receta, faltantes = service.verificar(self.plato.id, cantidad=3)
+        self.assertEqual(faltantes[0]['ingrediente'], 'Queso')  # 600 de 500
+
+        Receta.objects.filter(plato=self.plato, ingrediente=self.ingrediente2).get().delete()
+
+        receta, faltantes = service.verificar(self.plato.id, cantidad=3)
+        self.assertEqual(list(receta.ingredientes), [self.ingrediente1.id])
+        self.assertEqual(faltantes, [])
+
+    def test_stock_insuficiente_no_descuenta_nada(self):
+        """
+        Si un ingrediente falta, ningún otro ingrediente debe descontarse
+        """
+        service = StockService()
+
+        # Tomate alcanza (2*4=8 de 10), queso no (200*4=800 de 500)
+        with self.assertRaises(ValidationError):
+            service.validar_y_reservar_stock(
+                plato_id=self.plato.id,
+                cantidad=4,
+                pedido_id="TEST-005"
+            )
+
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente1).cantidad_disponible, 10)
+        self.assertEqual(Stock.objects.get(ingrediente=self.ingrediente2).cantidad_disponible, 500)
+        self.assertFalse(ReservaStock.objects.filter(pedido_id="TEST-005").exists())
+
+
+class PorcionesDisponiblesTests(APITestCase):
+    """
+    Tests para el cálculo de porciones disponibles por plato
+    """
+
+    def setUp(self):
+        matriz_recetas.invalidar_todo()
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="gr")
+        self.albahaca = Ingrediente.objects.create(nombre="Albahaca", unidad_medida="gr")
+
+        self.pizza = Plato.objects.create(
+            nombre="Pizza", descripcion="Test", precio=10.00, categoria=self.categoria
+        )
+        self.pesto = Plato.objects.create(
+            nombre="Pesto", descripcion="Test", precio=9.00, categoria=self.categoria
+        )
+        self.agua = Plato.objects.create(
+            nombre="Agua", descripcion="Test", precio=1.00, categoria=self.categoria
+        )
+        Receta.objects.create(plato=self.pizza, ingrediente=self.tomate, cantidad=2)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.queso, cantidad=0.3)
+        Receta.objects.create(plato=self.pesto, ingrediente=self.albahaca, cantidad=50)
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        Stock.objects.create(ingrediente=self.queso, cantidad_disponible=0.9)
+        # Albahaca sin fila de Stock
+
+    def test_porciones_por_plato(self):
+        """
+        El ingrediente más escaso limita, sin stock es 0 y sin receta no hay límite
+        """
+        porciones = porciones_disponibles()
+
+        self.assertEqual(porciones[self.pizza.id], 3)  # min(10/2, 0.9/0.3)
+        self.assertEqual(porciones[self.pesto.id], 0)
+        self.assertIsNone(porciones[self.agua.id])
+
+    def test_endpoint_porciones_disponibles(self):
+        """
+        El endpoint es público y devuelve todo el menú en una respuesta
+        """
+        url = reverse('plato-porciones-disponibles')
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        por_plato = {p['plato_id']: p for p in response.data}
+        self.assertEqual(por_plato[self.pizza.id]['porciones'], 3)
+        self.assertFalse(por_plato[self.pesto.id]['disponible'])
+        self.assertTrue(por_plato[self.agua.id]['disponible'])
+
+
+class MenuQueriesTests(APITestCase):
+    """
+    El listado del menú debe costar las mismas queries sin importar su tamaño
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.ingredientes = [
+            Ingrediente.objects.create(nombre=f"Ingrediente {i}", unidad_medida="gr")
+            for i in range(3)
+        ]
+
+    def crear_platos(self, cantidad):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._crear_platos(cantidad)
+
+    def _crear_platos(self, cantidad):
+        for i in range(cantidad):
+            plato = Plato.objects.create(
+                nombre=f"Plato {Plato.objects.count()}", descripcion="Test",
+                precio=10.00, categoria=self.categoria
+            )
+            for ingrediente in self.ingredientes:
+                Receta.objects.create(plato=plato, ingrediente=ingrediente, cantidad=1)
+
+    def test_listado_api_queries_constantes(self):
+        url = reverse('plato-list')
+        for total in (2, 10):
+            self.crear_platos(total - Plato.objects.count())
+            # count + página de platos con categoría + recetas con ingrediente
+            with self.assertNumQueries(3):
+                response = self.client.get(url)
+            self.assertEqual(response.data['count'], total)
+            self.assertEqual(len(response.data['results'][0]['recetas']), 3)
+
+    def test_listado_legacy_queries_constantes(self):
+        from rest_framework.test import APIRequestFactory
+        from .views import PlatoViewSet
+        vista = PlatoViewSet.as_view({'get': 'list'})
+        for total in (2, 10):
+            self.crear_platos(total - Plato.objects.count())
+            # platos con categoría + recetas con ingrediente
+            with self.assertNumQueries(2):
+                response = vista(APIRequestFactory().get('/'))
+            self.assertEqual(len(response.data), total)
+            self.assertEqual(response.data[0]['recetas'][0]['ingrediente'], 'Ingrediente 0')
+
+
+class MenuCacheTests(APITestCase):
+    """
+    Tests para el caché versionado del menú público
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.plato = Plato.objects.create(
+            nombre="Pizza", descripcion="Test", precio=10.00, categoria=self.categoria
+        )
+
+    def test_api_platos_cacheada_y_304(self):
+        url = reverse('plato-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        # Segunda lectura: sin tocar la base
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data, response.data)
+
+        # Con el ETag vigente el cliente recibe 304
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cambio_en_menu_cambia_version(self):
+        url = reverse('plato-list')
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plato.precio = 12.00
+            self.plato.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['precio'], '12.00')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cliente_menu_anonimo_cacheado(self):
+        url = reverse('cliente_menu')
+        response = self.client.get(url)
+        self.assertContains(response, 'Pizza')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, response.content)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
 
 class StockAPITests(APITestCase):
     """
@@ -266,6 +513,7 @@ class StockAPITests(APITestCase):
     
     def setUp(self):
         # Configuración similar a StockServiceTests
+        matriz_recetas.invalidar_todo()
         self.categoria = CategoriaMenu.objects.create(nombre="Principal")
         self.ingrediente = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
         self.plato = Plato.objects.create(
@@ -310,3 +558,916 @@ class StockAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertFalse(response.data['success'])
         self.assertIn('insuficiente', response.data['message'].lower())
+
+
+class ReservaLoteAPITests(APITestCase):
+    """
+    Tests para la reserva de stock de varias líneas en una llamada
+    """
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_user(username='mesero', password='clave12345')
+        self.client.force_authenticate(user=self.user)
+        matriz_recetas.invalidar_todo()
+
+        self.categoria = CategoriaMenu.objects.create(nombre="Principal")
+        self.tomate = Ingrediente.objects.create(nombre="Tomate", unidad_medida="un")
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="gr")
+        self.pizza = Plato.objects.create(
+            nombre="Pizza", descripcion="Test", precio=10.00, categoria=self.categoria
+        )
+        self.ensalada = Plato.objects.create(
+            nombre="Ensalada", descripcion="Test", precio=8.00, categoria=self.categoria
+        )
+        Receta.objects.create(plato=self.pizza, ingrediente=self.tomate, cantidad=2)
+        Receta.objects.create(plato=self.pizza, ingrediente=self.queso, cantidad=100)
+        Receta.objects.create(plato=self.ensalada, ingrediente=self.tomate, cantidad=3)
+        Stock.objects.create(ingrediente=self.tomate, cantidad_disponible=10)
+        Stock.objects.create(ingrediente=self.queso, cantidad_disponible=1000)
+
+    def test_reserva_lote_exitosa(self):
+        """
+        Todas las líneas se reservan y el stock se descuenta sumado
+        """
+        url = reverse('stock-reservar-lote')
+        data = {
+            'pedido_id': 'MESA-4',
+            'lineas': [
+                {'plato_id': self.pizza.id, 'cantidad': 2},
+                {'plato_id': self.ensalada.id, 'cantidad': 1},
+            ]
+        }
+
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['success'])
+        self.assertEqual(len(response.data['lineas']), 2)
+        self.assertEqual(ReservaStock.objects.filter(pedido_id='MESA-4').count(), 2)
+        self.assertEqual(Stock.objects.get(ingrediente=self.tomate).cantidad_disponible, 3)  # 10 - 4 - 3
+        self.assertEqual(Stock.objects.get(ingrediente=self.queso).cantidad_disponible, 800)
+
+    def test_reserva_lote_valida_demanda_sumada(self):
+        """
+        Cada línea alcanza por sí sola, pero la suma no: no se reserva nada
+        """
+        url = reverse('stock-reservar-lote')
+        data = {
+            'pedido_id': 'MESA-5',
+            'lineas': [
+                {'plato_id': self.pizza.id, 'cantidad': 3},  # 6 tomates
+                {'plato_id': self.ensalada.id, 'cantidad': 2},  # 6 tomates
+            ]
+        }
+
+        response = self.client.post(url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['success'])
+        self.assertEqual(
+            [linea['ingredientes_faltantes'] for linea in response.data['lineas']],
+            [['Tomate'], ['Tomate']]
+        )
+        self.assertFalse(ReservaStock.objects.exists())
+        self.assertEqual(Stock.objects.get(ingrediente=self.tomate).cantidad_disponible, 10)
+
+
+class DisponibilidadMesasTests(APITestCase):
+    """
+    Tests para el motor de disponibilidad de mesas
+    """
+
+    def setUp(self):
+        self.cliente = User.objects.create_user(username='cliente', password='clave12345')
+        self.mesa_1 = Mesa.objects.create(numero=1, capacidad=4)
+        self.mesa_2 = Mesa.objects.create(numero=2, capacidad=2)
+        self.fecha = date(2030, 5, 10)
+        Reserva.objects.create(
+            cliente=self.cliente, mesa=self.mesa_1, fecha_reserva=self.fecha,
+            hora_inicio=time(13, 0), hora_fin=time(15, 0), estado='confirmada'
+        )
+
+    def nueva_reserva(self, inicio, fin, mesa=None):
+        return Reserva(
+            cliente=self.cliente, mesa=mesa or self.mesa_1, fecha_reserva=self.fecha,
+            hora_inicio=inicio, hora_fin=fin
+        )
+
+    def test_clean_rechaza_solapamiento(self):
+        with self.assertRaises(ValidationError):
+            self.nueva_reserva(time(14, 0), time(16, 0)).clean()
+
+    def test_clean_acepta_intervalos_contiguos(self):
+        self.nueva_reserva(time(15, 0), time(17, 0)).clean()
+        self.nueva_reserva(time(12, 0), time(13, 0)).clean()
+
+    def test_mesas_libres_en_una_query(self):
+        with self.assertNumQueries(1):
+            libres = list(mesas_libres(self.fecha, time(14, 30), time(16, 30)))
+        self.assertEqual(libres, [self.mesa_2])
+
+        libres = mesas_libres(self.fecha, time(15, 0), time(17, 0), personas=3)
+        self.assertEqual(list(libres), [self.mesa_1])
+
+    def test_agenda_coincide_con_sql(self):
+        # Datos viejos con reservas superpuestas en la misma mesa
+        Reserva.objects.bulk_create([
+            self.nueva_reserva(time(12, 0), time(18, 0), mesa=self.mesa_2),
+            self.nueva_reserva(time(13, 0), time(14, 0), mesa=self.mesa_2),
+        ])
+        agenda = AgendaDia(self.fecha)
+        mesa_ids = [self.mesa_1.id, self.mesa_2.id]
+
+        for hora in range(11, 21):
+            inicio, fin = intervalo_desde(time(hora, 0))
+            esperado = list(mesas_libres(self.fecha, inicio, fin).values_list('id', flat=True))
+            self.assertEqual(agenda.mesas_libres(mesa_ids, inicio, fin), esperado, hora)
+
+    def test_agenda_agregar(self):
+        agenda = AgendaDia(self.fecha)
+        self.assertTrue(agenda.mesa_libre(self.mesa_2.id, time(19, 0), time(21, 0)))
+
+        agenda.agregar(self.mesa_2.id, time(20, 0), time(22, 0))
+        self.assertFalse(agenda.mesa_libre(self.mesa_2.id, time(19, 0), time(21, 0)))
+        self.assertTrue(agenda.mesa_libre(self.mesa_2.id, time(18, 0), time(20, 0)))
+
+    def test_verificar_disponibilidad_usa_intervalo_de_reserva(self):
+        # A las 12:00 la mesa 1 está libre, pero una reserva de 2 horas chocaría a las 13:00
+        response = self.client.get(
+            reverse('verificar_disponibilidad'),
+            {'fecha': self.fecha.isoformat(), 'hora': '12:00', 'personas': 3}
+        )
+        self.assertEqual(response.data['detalles']['mesas']['disponibles'], 0)
+        self.assertFalse(response.data['disponibilidad'])
+
+    def test_grilla_del_dia_en_dos_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('mesa-grilla'), {'fecha': self.fecha.isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        horarios = response.data['horarios']
+        self.assertEqual((horarios[0], horarios[-1], len(horarios)), ('12:00', '20:30', 18))
+
+        mesa_1, mesa_2 = response.data['mesas']
+        self.assertEqual(mesa_2['libre'], '1' * 18)
+        # La reserva de 13:00 a 15:00 bloquea los turnos desde 12:00 hasta 14:30
+        ocupados = [h for h, bit in zip(horarios, mesa_1['libre']) if bit == '0']
+        self.assertEqual(ocupados, ['12:00', '12:30', '13:00', '13:30', '14:00', '14:30'])
+
+    def test_grilla_filtra_por_personas(self):
+        response = self.client.get(reverse('mesa-grilla'), {'fecha': self.fecha.isoformat(), 'personas': 3})
+        self.assertEqual([m['numero'] for m in response.data['mesas']], [1])
+
+    def test_grilla_requiere_fecha(self):
+        response = self.client.get(reverse('mesa-grilla'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IndicesConsultasTests(TestCase):
+    """
+    Las consultas más frecuentes usan un índice (EXPLAIN en SQLite y PostgreSQL)
+    """
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('EXPLAIN solo se verifica en SQLite y PostgreSQL')
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Con tablas vacías PostgreSQL prefiere un seq scan; se desactiva para ver si el índice sirve
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                return queryset.explain()
+        return queryset.explain()
+
+    def assertUsaIndice(self, queryset, *indices):
+        """El plan usa alguno de `indices` (los parciales solo los aprovecha PostgreSQL)"""
+        plan = self.plan(queryset)
+        self.assertTrue(any(i in plan for i in indices), f'{indices} no aparecen en el plan:\n{plan}')
+
+    def test_pedidos(self):
+        ahora = timezone.now()
+        self.assertUsaIndice(Pedido.objects.activos().filter(mesa='3'), 'pedido_mesa_estado_idx')
+        self.assertUsaIndice(
+            Pedido.objects.activos().order_by('creado_en'), 'pedido_activo_creado_idx', 'pedido_creado_idx'
+        )
+        self.assertUsaIndice(
+            Pedido.objects.finalizados().order_by('-actualizado_en')[:20], 'pedido_estado_creado_idx'
+        )
+        self.assertUsaIndice(
+            Pedido.objects.filter(estado='LISTO').order_by('-creado_en'), 'pedido_estado_creado_idx'
+        )
+        self.assertUsaIndice(
+            Pedido.objects.filter(creado_en__range=[ahora - timedelta(days=1), ahora]), 'pedido_creado_idx'
+        )
+
+    def test_pedidos_cocina(self):
+        self.assertUsaIndice(
+            PedidoCocina.objects.activos().order_by('-fecha_creacion'),
+            'cocina_activo_fecha_idx', 'cocina_fecha_idx'
+        )
+        self.assertUsaIndice(PedidoCocina.objects.filter(estado='LISTO'), 'cocina_estado_fecha_idx')
+        self.assertUsaIndice(PedidoCocina.objects.del_dia(timezone.localdate()), 'cocina_fecha_idx')
+
+    def test_reservas(self):
+        fecha = date(2030, 5, 10)
+        self.assertUsaIndice(
+            reservas_que_solapan(fecha, time(13, 0), time(15, 0), mesa=1), 'reserva_disponibilidad_idx'
+        )
+        self.assertUsaIndice(
+            Reserva.objects.filter(fecha_reserva=fecha, estado__in=['pendiente', 'confirmada']),
+            'reserva_dia_idx'
+        )
+        self.assertUsaIndice(ReservaStock.objects.filter(pedido_id='abc'), 'reservastock_pedido_idx')
+
+
+class DashboardsTests(APITestCase):
+    """
+    Tests para los dashboards integrados (una query por módulo y caché corto)
+    """
+
+    def setUp(self):
+        cache.clear()
+        matriz_recetas.invalidar_todo()
+        self.user = User.objects.create_user(username='admin', password='clave12345')
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        ingrediente = Ingrediente.objects.create(nombre="Arroz", unidad_medida="kg", stock_minimo=5)
+        Stock.objects.create(ingrediente=ingrediente, cantidad_disponible=2)
+        for i in range(3):
+            plato = Plato.objects.create(nombre=f"Plato {i}", descripcion="-", precio=10, categoria=categoria)
+            Receta.objects.create(plato=plato, ingrediente=ingrediente, cantidad=1)
+        Pedido.objects.create(mesa="1", cliente="Ana", plato="1")
+        confirmado = Pedido.objects.create(mesa="2", cliente="Luis", plato="2")
+        confirmado.confirmar()
+        PedidoCocina.objects.create(mesa=1, cliente="Ana", descripcion="Plato 0")
+
+    def test_integracion_una_query_por_modulo(self):
+        matriz_recetas.platos_activos()  # la matriz de recetas se carga aparte
+        # platos, stock, contadores, reservas, pedidos, cocina
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('estado_integrado'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        estado = response.data['estado_general']
+        self.assertEqual(estado['menu']['total_platos'], 3)
+        self.assertEqual(estado['pedidos']['total_activos'], 2)
+        self.assertEqual(estado['pedidos']['por_estado'], {'CREADO': 1, 'EN_PREPARACION': 1})
+        self.assertEqual(estado['cocina']['total_preparando'], 1)
+
+        # Dentro del TTL se reutiliza el resultado
+        with self.assertNumQueries(0):
+            self.client.get(reverse('estado_integrado'))
+
+    def test_restaurante_desde_contadores(self):
+        self.client.force_authenticate(user=self.user)
+        # contadores y próximas reservas
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('dashboard_restaurante'))
+
+        resumen = response.data['resumen']
+        self.assertEqual(resumen['inventario']['ingredientes_bajo_stock'], 1)
+        self.assertEqual(resumen['pedidos']['hoy'], 2)
+        self.assertEqual(resumen['pedidos']['por_estado'], {'CREADO': 1, 'EN_PREPARACION': 1})
+        self.assertEqual(resumen['cocina']['por_estado'], {'CREADO': 1})
+
+    def test_hoy_es_la_fecha_local_en_la_noche(self):
+        self.client.force_authenticate(user=self.user)
+        # 22:30 en Santiago (UTC-3) ya es el día siguiente en UTC
+        noche = datetime(2026, 3, 11, 1, 30, tzinfo=dt_timezone.utc)
+        with patch('django.utils.timezone.now', return_value=noche):
+            Pedido.objects.create(mesa="7", cliente="Eva", plato="1")
+            Reserva.objects.create(
+                cliente=self.user, mesa=Mesa.objects.create(numero=9, capacidad=2),
+                fecha_reserva=date(2026, 3, 10), hora_inicio=time(23, 0), hora_fin=time(23, 45),
+                estado='confirmada',
+            )
+            restaurante = self.client.get(reverse('dashboard_restaurante')).data
+            integracion = self.client.get(reverse('estado_integrado')).data
+
+        self.assertEqual(restaurante['fecha'], '2026-03-10')
+        self.assertEqual(restaurante['hora_actual'], '22:30')
+        self.assertEqual(restaurante['resumen']['pedidos']['hoy'], 1)
+        self.assertEqual(restaurante['resumen']['reservas']['total_hoy'], 1)
+        self.assertEqual(integracion['estado_general']['reservas']['total_hoy'], 1)
+
+    def test_calculo_de_un_solo_vuelo(self):
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            time_module.sleep(0.1)
+            return {'valor': 42}
+
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(obtener_o_calcular('prueba:vuelo', calcular, 5)))
+            for _ in range(8)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(resultados, [{'valor': 42}] * 8)
+
+    def test_contadores_siguen_las_transiciones(self):
+        pedido = Pedido.objects.get(estado='CREADO')
+        pedido.cancelar()
+        Pedido.objects.get(estado='EN_PREPARACION').delete()
+        Mesa.objects.create(numero=7, capacidad=2)
+        StockService().validar_y_reservar_stock(Plato.objects.first().id, 1, 'p-1')
+
+        dia, globales = contadores.leer(timezone.localdate())
+        self.assertEqual(contadores.sin_ceros(dia['pedido']), {'CANCELADO': 1})
+        self.assertEqual(globales['mesa'], {'disponible': 1})
+        self.assertEqual(contadores.bajo_stock(), 1)
+
+        # Reconstruir desde cero da lo mismo que el conteo incremental
+        incremental = sorted(Contador.objects.filter(total__gt=0).values_list('modulo', 'fecha', 'estado', 'total'))
+        contadores.reconstruir()
+        reconstruido = sorted(Contador.objects.filter(total__gt=0).values_list('modulo', 'fecha', 'estado', 'total'))
+        self.assertEqual(incremental, reconstruido)
+
+    def test_stock_cruza_el_minimo(self):
+        stock = Stock.objects.get()
+        stock.cantidad_disponible = 10
+        stock.save()
+        self.assertEqual(contadores.bajo_stock(), 0)
+
+        # El descuento masivo de StockService también ajusta el contador
+        StockService().validar_y_reservar_stock(Plato.objects.first().id, 5, 'p-2')
+        self.assertEqual(contadores.bajo_stock(), 1)
+
+
+# Sink de prueba: acumula las alertas emitidas
+alertas_emitidas = []
+
+
+def capturar_alerta(alerta):
+    alertas_emitidas.append((alerta['tipo'], alerta['ingrediente']))
+
+
+def sink_caido(alerta):
+    raise RuntimeError("webhook caído")
+
+
+@override_settings(ALERTA_STOCK_SINKS=['mainApp.tests.capturar_alerta'], ALERTA_STOCK_DEBOUNCE=60)
+class AlertasStockTests(APITestCase):
+    """
+    Tests para la detección de cruces del stock mínimo (alertas_stock.py)
+    """
+
+    def setUp(self):
+        cache.clear()
+        matriz_recetas.invalidar_todo()
+        alertas_emitidas.clear()
+        self.user = User.objects.create_user(username='admin', password='clave12345')
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        self.ingrediente = Ingrediente.objects.create(nombre="Arroz", unidad_medida="kg", stock_minimo=5)
+        self.stock = Stock.objects.create(ingrediente=self.ingrediente, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Risotto", descripcion="-", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.ingrediente, cantidad=1)
+
+    def fijar_stock(self, cantidad):
+        self.stock.cantidad_disponible = cantidad
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.save()
+
+    def test_descuento_de_pedido_cruza_el_minimo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService().validar_y_reservar_stock(self.plato.id, 4, 'p-1')
+        self.assertEqual(alertas_emitidas, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockService().validar_y_reservar_stock(self.plato.id, 1, 'p-2')
+
+        self.assertEqual(alertas_emitidas, [('bajo', 'Arroz')])
+        self.assertTrue(StockBajo.objects.filter(ingrediente=self.ingrediente).exists())
+        self.assertEqual(contadores.bajo_stock(), 1)
+
+    def test_reposicion_y_debounce(self):
+        self.fijar_stock(3)
+        self.fijar_stock(20)
+        self.assertFalse(StockBajo.objects.exists())
+
+        # El segundo cruce dentro de la ventana actualiza el conjunto pero no avisa
+        self.fijar_stock(1)
+        self.assertTrue(StockBajo.objects.exists())
+        self.assertEqual(alertas_emitidas, [('bajo', 'Arroz'), ('repuesto', 'Arroz')])
+
+        cache.clear()  # vence la ventana
+        self.fijar_stock(20)
+        self.fijar_stock(2)
+        self.assertEqual(alertas_emitidas[-1], ('bajo', 'Arroz'))
+
+    def test_cambio_de_minimo_cruza(self):
+        self.ingrediente.stock_minimo = 15
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingrediente.save()
+
+        self.assertEqual(alertas_emitidas, [('bajo', 'Arroz')])
+        self.assertEqual(contadores.bajo_stock(), 1)
+
+    def test_rollback_no_alerta(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.stock.cantidad_disponible = 1
+                    self.stock.save()
+                    raise ValidationError("cancelado")
+            except ValidationError:
+                pass
+
+        self.assertEqual(alertas_emitidas, [])
+        self.assertFalse(StockBajo.objects.exists())
+
+    @override_settings(ALERTA_STOCK_SINKS=['mainApp.tests.sink_caido', 'mainApp.tests.capturar_alerta'])
+    def test_sink_caido_no_bloquea_a_los_demas(self):
+        with self.assertLogs('mainApp.alertas_stock', level='ERROR'):
+            self.fijar_stock(1)
+
+        self.assertEqual(alertas_emitidas, [('bajo', 'Arroz')])
+
+    def test_endpoint_bajo_stock_lee_el_conjunto(self):
+        self.fijar_stock(1)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('stock-bajo-stock'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([s['ingrediente_nombre'] for s in response.data], ['Arroz'])
+
+
+class MovimientosStockTests(APITestCase):
+    """
+    Tests para el libro de movimientos y el stock en un momento dado
+    """
+
+    def setUp(self):
+        cache.clear()
+        matriz_recetas.invalidar_todo()
+        self.user = User.objects.create_user(username='admin', password='clave12345')
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        self.ingrediente = Ingrediente.objects.create(nombre="Arroz", unidad_medida="kg")
+        self.stock = Stock.objects.create(ingrediente=self.ingrediente, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Risotto", descripcion="-", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.ingrediente, cantidad=1)
+
+    def libro(self):
+        return list(MovimientoStock.objects.order_by('id').values_list('tipo', 'cantidad', 'referencia'))
+
+    def test_cada_cambio_deja_su_movimiento(self):
+        StockService().validar_y_reservar_stock(self.plato.id, 3, 'p-1')
+        StockService().reponer({self.ingrediente.id: 5}, referencia='factura 12')
+        stock = Stock.objects.get(pk=self.stock.pk)
+        stock.cantidad_disponible = 11
+        stock.save()
+
+        self.assertEqual(self.libro(), [
+            ('ingreso', Decimal('10'), ''),
+            ('reserva', Decimal('-3'), 'p-1'),
+            ('ingreso', Decimal('5'), 'factura 12'),
+            ('ajuste', Decimal('-1'), ''),
+        ])
+        self.assertEqual(movimientos.stock_en(self.ingrediente.id), 11)
+        self.assertEqual(movimientos.conciliar(), [])
+
+    def test_stock_en_un_momento_con_snapshot(self):
+        StockService().validar_y_reservar_stock(self.plato.id, 3, 'p-1')
+        antes = MovimientoStock.objects.latest('id').creado_en
+
+        self.assertEqual(movimientos.tomar_snapshots(), 1)
+        StockService().reponer({self.ingrediente.id: 5})
+
+        self.assertEqual(movimientos.stock_en(self.ingrediente.id, antes), 7)
+        # Después del snapshot solo se suma el movimiento posterior
+        with self.assertNumQueries(2):
+            self.assertEqual(movimientos.stock_en(self.ingrediente.id), 12)
+        self.assertEqual(SnapshotStock.objects.get().cantidad, 7)
+        # Sin movimientos nuevos no se repite el snapshot del ingrediente
+        movimientos.tomar_snapshots()
+        self.assertEqual(movimientos.tomar_snapshots(), 0)
+
+    def test_conciliar_detecta_cambios_fuera_del_libro(self):
+        Stock.objects.filter(pk=self.stock.pk).update(cantidad_disponible=4)
+
+        self.assertEqual(movimientos.conciliar(), [
+            {'ingrediente_id': self.ingrediente.id, 'stock': 4, 'libro': 10},
+        ])
+
+    def test_endpoint_movimientos(self):
+        StockService().validar_y_reservar_stock(self.plato.id, 2, 'p-1')
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.get(reverse('stock-movimientos', args=[self.stock.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['cantidad'], 8)
+        self.assertEqual([m['tipo'] for m in response.data['movimientos']], ['reserva', 'ingreso'])
+
+        response = self.client.get(reverse('stock-movimientos', args=[self.stock.pk]), {'hasta': 'ayer'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CicloReservasStockTests(TestCase):
+    """
+    Tests para confirmar y liberar ReservaStock según el pedido
+    """
+
+    def setUp(self):
+        matriz_recetas.invalidar_todo()
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        self.arroz = Ingrediente.objects.create(nombre="Arroz", unidad_medida="kg")
+        self.queso = Ingrediente.objects.create(nombre="Queso", unidad_medida="kg")
+        Stock.objects.create(ingrediente=self.arroz, cantidad_disponible=10)
+        Stock.objects.create(ingrediente=self.queso, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Risotto", descripcion="-", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=self.arroz, cantidad=2)
+        Receta.objects.create(plato=self.plato, ingrediente=self.queso, cantidad=1)
+        self.pedido = Pedido.objects.create(mesa="1", cliente="Ana", plato=str(self.plato.id))
+        StockService().validar_y_reservar_stock(self.plato.id, 2, str(self.pedido.id))
+
+    def disponibles(self):
+        return dict(Stock.objects.values_list('ingrediente__nombre', 'cantidad_disponible'))
+
+    def estados(self):
+        return list(ReservaStock.objects.values_list('estado', flat=True))
+
+    def test_cancelar_devuelve_el_stock(self):
+        self.assertEqual(self.disponibles(), {'Arroz': 6, 'Queso': 8})
+
+        self.plato.activo = False  # las recetas se leen aunque el plato ya no esté en la carta
+        self.plato.save()
+        self.pedido.cancelar()
+
+        self.assertEqual(self.disponibles(), {'Arroz': 10, 'Queso': 10})
+        self.assertEqual(self.estados(), ['liberado'])
+        self.assertEqual(
+            MovimientoStock.objects.filter(tipo='liberacion', referencia=str(self.pedido.id)).count(), 2
+        )
+        # Una segunda liberación no devuelve nada
+        self.assertEqual(StockService().liberar_reservas(self.pedido.id), 0)
+
+    def test_liberar_devuelve_lo_reservado_aunque_cambie_la_receta(self):
+        Receta.objects.filter(ingrediente=self.arroz).update(cantidad=3)
+        Receta.objects.filter(ingrediente=self.queso).delete()
+
+        self.pedido.cancelar()
+
+        self.assertEqual(self.disponibles(), {'Arroz': 10, 'Queso': 10})
+
+    def test_reservas_sin_consumo_usan_la_receta(self):
+        ReservaStock.objects.update(consumo=None)
+
+        self.pedido.cancelar()
+
+        self.assertEqual(self.disponibles(), {'Arroz': 10, 'Queso': 10})
+
+    def test_entregar_confirma_sin_tocar_el_stock(self):
+        self.pedido.confirmar()
+        self.pedido.marcar_listo()
+        with self.assertNumQueries(1):
+            self.assertEqual(StockService().confirmar_reservas(self.pedido.id), 1)
+        ReservaStock.objects.update(estado='reservado')
+
+        self.pedido.entregar()
+
+        self.assertEqual(self.estados(), ['confirmado'])
+        self.assertEqual(self.disponibles(), {'Arroz': 6, 'Queso': 8})
+
+    def test_barrido_de_reservas_vencidas(self):
+        otro = Pedido.objects.create(mesa="2", cliente="Luis", plato=str(self.plato.id))
+        StockService().validar_y_reservar_stock(self.plato.id, 1, str(otro.id))
+        StockService().validar_y_reservar_stock(self.plato.id, 1, str(otro.id))
+        ReservaStock.objects.exclude(pedido_id=str(self.pedido.id)).update(
+            fecha_creacion=timezone.now() - timedelta(days=1)
+        )
+
+        call_command('liberar_reservas_vencidas', '--lote', '1', stdout=StringIO())
+
+        self.assertEqual(
+            dict(ReservaStock.objects.values_list('pedido_id', 'estado').distinct()),
+            {str(self.pedido.id): 'reservado', str(otro.id): 'liberado'},
+        )
+        self.assertEqual(self.disponibles(), {'Arroz': 6, 'Queso': 8})
+
+
+class CrearPedidoIntegradoTests(APITestCase):
+    """
+    Tests para POST /api/crear-pedido-integrado/
+    """
+
+    def setUp(self):
+        matriz_recetas.invalidar_todo()
+        self.user = User.objects.create_user(username='mesero', password='clave12345')
+        self.client.force_authenticate(user=self.user)
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        ingrediente = Ingrediente.objects.create(nombre="Arroz", unidad_medida="kg")
+        Stock.objects.create(ingrediente=ingrediente, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Risotto", descripcion="-", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=ingrediente, cantidad=1)
+
+    def test_mesa_numerica_en_json(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('crear_pedido_integrado'), {'plato_id': self.plato.id, 'mesa': 5}, format='json'
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['pedido']['mesa'], '5')
+        self.assertEqual(PedidoCocina.objects.get().mesa, 5)
+
+    def test_ingrediente_sin_stock_no_se_controla(self):
+        sal = Ingrediente.objects.create(nombre="Sal", unidad_medida="kg")
+        Receta.objects.create(plato=self.plato, ingrediente=sal, cantidad=1)
+        matriz_recetas.invalidar_todo()
+
+        response = self.client.post(
+            reverse('crear_pedido_integrado'), {'plato_id': self.plato.id, 'mesa': '2', 'cantidad': 2},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Stock.objects.get().cantidad_disponible, 8)
+
+
+class IdempotenciaTests(APITestCase):
+    """
+    Tests para los reintentos con Idempotency-Key
+    """
+
+    def setUp(self):
+        cache.clear()
+        matriz_recetas.invalidar_todo()
+        self.user = User.objects.create_user(username='mesero', password='clave12345')
+        self.client.force_authenticate(user=self.user)
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        ingrediente = Ingrediente.objects.create(nombre="Arroz", unidad_medida="kg")
+        self.stock = Stock.objects.create(ingrediente=ingrediente, cantidad_disponible=10)
+        self.plato = Plato.objects.create(nombre="Risotto", descripcion="-", precio=10, categoria=categoria)
+        Receta.objects.create(plato=self.plato, ingrediente=ingrediente, cantidad=1)
+        Mesa.objects.create(numero=4, capacidad=4)
+        self.url = reverse('crear_pedido_integrado')
+        self.datos = {'plato_id': self.plato.id, 'mesa': '4', 'cantidad': 2}
+
+    def crear(self, key, datos=None):
+        return self.client.post(self.url, datos or self.datos, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_reintento_no_descuenta_dos_veces(self):
+        primera = self.crear('tablet-1')
+        self.assertEqual(primera.status_code, status.HTTP_200_OK)
+
+        # El reintento se responde desde la caché sin tocar la base
+        with self.assertNumQueries(0):
+            segunda = self.crear('tablet-1')
+
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.cantidad_disponible, 8)
+
+        # Sin la caché (otro worker) la respuesta sale de la tabla
+        cache.clear()
+        self.assertEqual(self.crear('tablet-1').json(), primera.json())
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_misma_key_con_otro_cuerpo(self):
+        self.crear('tablet-1')
+        response = self.crear('tablet-1', dict(self.datos, cantidad=3))
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_reintento_mientras_se_procesa(self):
+        # Otro worker reclamó la clave y todavía no respondió
+        ClaveIdempotencia.objects.create(
+            clave=idempotencia.clave_de('crear_pedido_integrado', self.user.pk, 'tablet-1'),
+            huella=hashlib.sha256(json.dumps(self.datos, sort_keys=True).encode()).hexdigest(),
+            expira_en=timezone.now() + timedelta(minutes=1),
+        )
+
+        response = self.crear('tablet-1')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(Pedido.objects.count(), 0)
+
+    def test_error_del_request_original_no_se_guarda(self):
+        response = self.crear('tablet-1', {'mesa': '4'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ClaveIdempotencia.objects.get().estado_http, 400)
+
+        self.assertEqual(self.crear('tablet-2').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.crear('tablet-3').status_code, status.HTTP_200_OK)
+        self.assertEqual(Pedido.objects.count(), 2)
+
+    def test_formulario_del_mesero_reenviado(self):
+        datos = {'mesa': '4', 'cliente': 'Ana', 'plato': str(self.plato.id), 'idempotency_key': 'form-1'}
+        for _ in range(2):
+            response = self.client.post(reverse('pedidos_crear'), datos)
+            self.assertRedirects(response, reverse('pedidos_mesero'), fetch_redirect_response=False)
+
+        self.assertEqual(Pedido.objects.count(), 1)
+
+
+
+class ImportacionStockTests(APITestCase):
+    """
+    Tests para la recepción de proveedor y el conteo de inventario masivos
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='bodega', password='clave12345')
+        self.client.force_authenticate(user=self.user)
+        self.arroz = Ingrediente.objects.create(nombre="Arroz", unidad_medida="kg", stock_minimo=5)
+        self.aceite = Ingrediente.objects.create(nombre="Aceite", unidad_medida="l")
+        self.sal = Ingrediente.objects.create(nombre="Sal", unidad_medida="kg")
+        Stock.objects.create(ingrediente=self.arroz, cantidad_disponible=2)
+        Stock.objects.create(ingrediente=self.aceite, cantidad_disponible=10)
+        MovimientoStock.objects.all().delete()
+        self.url = reverse('stock-importar')
+
+    def cantidades(self):
+        return dict(Stock.objects.values_list('ingrediente__nombre', 'cantidad_disponible'))
+
+    def libro(self):
+        return list(MovimientoStock.objects.order_by('ingrediente_id')
+                    .values_list('ingrediente__nombre', 'tipo', 'cantidad', 'referencia'))
+
+    def test_ingreso_suma_y_crea_stock_faltante(self):
+        datos = {'referencia': 'guía 881', 'lineas': [
+            {'ingrediente': 'arroz', 'cantidad': '8'},
+            {'ingrediente_id': self.sal.id, 'cantidad': '1.5'},
+            {'ingrediente': 'Arroz', 'cantidad': 2},
+        ]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, datos, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['aplicado'])
+        self.assertEqual(response.data['lineas'][0]['nuevo'], Decimal('12'))
+        self.assertEqual(self.cantidades(), {'Arroz': 12, 'Aceite': 10, 'Sal': Decimal('1.5')})
+        self.assertEqual(self.libro(), [
+            ('Arroz', 'ingreso', Decimal('10'), 'guía 881'),
+            ('Sal', 'ingreso', Decimal('1.5'), 'guía 881'),
+        ])
+        # El arroz salió de bajo el mínimo
+        self.assertFalse(StockBajo.objects.filter(ingrediente=self.arroz).exists())
+
+    def test_conteo_reemplaza_y_registra_ajustes(self):
+        archivo = SimpleUploadedFile('conteo.csv', 'ingrediente,cantidad\nArroz,2\nAceite,7.25\n'.encode(),
+                                     content_type='text/csv')
+        response = self.client.post(self.url, {'modo': 'conteo', 'archivo': archivo}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.cantidades(), {'Arroz': 2, 'Aceite': Decimal('7.25')})
+        # El arroz no cambió: sin movimiento
+        self.assertEqual(self.libro(), [('Aceite', 'ajuste', Decimal('-2.75'), 'importación bodega')])
+
+    def test_una_linea_invalida_no_aplica_nada(self):
+        datos = {'modo': 'conteo', 'lineas': [
+            {'ingrediente': 'Arroz', 'cantidad': '3'},
+            {'ingrediente': 'Harina', 'cantidad': '1'},
+            {'ingrediente': 'Aceite', 'cantidad': '-1'},
+            {'ingrediente': 'arroz', 'cantidad': '4'},
+        ]}
+        response = self.client.post(self.url, datos, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.data['aplicado'])
+        self.assertEqual(response.data['errores'], 3)
+        self.assertEqual([fila['error'] for fila in response.data['lineas']], [
+            None,
+            "Ingrediente no encontrado",
+            "cantidad debe ser un número mayor o igual a 0",
+            "Ingrediente repetido en el conteo",
+        ])
+        self.assertEqual(self.cantidades(), {'Arroz': 2, 'Aceite': 10})
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_csv_sin_columnas(self):
+        response = self.client.post(self.url, {'csv': 'nombre;kilos\nArroz;3'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('columnas', response.data['error'])
+
+    def test_vista_web_muestra_reporte(self):
+        admin = User.objects.create_user(username='jefe', password='clave12345', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.post(reverse('stock_importar'), {
+            'modo': 'ingreso', 'csv': 'ingrediente,cantidad\nAceite,5\n',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Stock actualizado')
+        self.assertEqual(self.cantidades()['Aceite'], 15)
+
+
+class ExportacionesTests(APITestCase):
+    """
+    Tests para las exportaciones CSV / NDJSON en streaming
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='contador', password='clave12345', is_staff=True)
+        self.client.force_authenticate(user=self.admin)
+        hoy = timezone.localdate()
+        self.hoy = hoy
+        for dias, cliente in ((0, 'Ana'), (1, '=HYPERLINK("x")'), (40, 'Viejo')):
+            pedido = Pedido.objects.create(mesa=str(dias + 1), cliente=cliente, plato='1')
+            momento = timezone.make_aware(datetime.combine(hoy - timedelta(days=dias), time(13, 0)))
+            Pedido.objects.filter(pk=pedido.pk).update(creado_en=momento)
+
+    def descargar(self, recurso, **params):
+        return self.client.get(reverse('exportar', args=[recurso]), params)
+
+    def contenido(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8-sig')
+
+    def test_csv_por_rango_de_fechas(self):
+        desde = (self.hoy - timedelta(days=7)).isoformat()
+        response = self.descargar('pedidos', desde=desde, hasta=self.hoy.isoformat())
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn(f'pedidos_{desde}_{self.hoy.isoformat()}.csv', response['Content-Disposition'])
+        lineas = list(csv.reader(StringIO(self.contenido(response))))
+        self.assertEqual(lineas[0][:3], ['id', 'mesa', 'cliente'])
+        # Ordenado por fecha; el texto con fórmula sale escapado
+        self.assertEqual([linea[2] for linea in lineas[1:]], ["'=HYPERLINK(\"x\")", 'Ana'])
+
+    def test_ndjson_de_reservas_de_stock(self):
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        plato = Plato.objects.create(nombre="Risotto", descripcion="-", precio=10, categoria=categoria)
+        ReservaStock.objects.create(plato=plato, cantidad=2, pedido_id='p-1')
+
+        response = self.descargar('reservas-stock', formato='ndjson')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        fila, = [json.loads(linea) for linea in self.contenido(response).splitlines()]
+        self.assertEqual((fila['plato'], fila['cantidad'], fila['estado']), ('Risotto', 2, 'reservado'))
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.descargar('pedidos', desde='16/10/2026').status_code, 400)
+        self.assertEqual(self.descargar('pedidos', formato='xlsx').status_code, 400)
+        self.assertEqual(self.descargar('facturas').status_code, 400)
+
+    def test_solo_administradores(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='mesero', password='x'))
+        self.assertEqual(self.descargar('pedidos').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class TableroMeseroTests(TestCase):
+    """
+    Tests para el tablero del mesero: activos + historial paginado por keyset
+    """
+
+    def setUp(self):
+        cache.clear()
+        matriz_recetas.invalidar_todo()
+        categoria = CategoriaMenu.objects.create(nombre="Fondos")
+        self.plato = Plato.objects.create(nombre="Risotto", descripcion="-", precio=10, categoria=categoria)
+        self.activo = Pedido.objects.create(mesa="1", cliente="Ana", plato=str(self.plato.id))
+
+    def finalizar(self, cantidad, momento):
+        for i in range(cantidad):
+            Pedido.objects.create(mesa=None, cliente=f"C{i}", plato=str(self.plato.id),
+                                  estado=Pedido.Estado.CERRADO)
+        # Mismo creado_en: el desempate por id no debe repetir ni saltar filas
+        Pedido.objects.finalizados().update(creado_en=momento)
+
+    def test_historial_paginado_sin_repetir(self):
+        self.finalizar(25, timezone.now() - timedelta(hours=1))
+
+        primera = self.client.get(reverse('pedidos_mesero'))
+        self.assertEqual([p['plato_nombre'] for p in primera.context['pedidos_activos_list']], ['Risotto'])
+        self.assertEqual(len(primera.context['pedidos_inactivos_list']), 20)
+        siguiente = primera.context['historial_siguiente']
+        self.assertIsNotNone(siguiente)
+
+        segunda = self.client.get(reverse('pedidos_mesero'), {'antes': siguiente})
+        self.assertEqual(len(segunda.context['pedidos_inactivos_list']), 5)
+        self.assertIsNone(segunda.context['historial_siguiente'])
+
+        vistos = [p['id'] for r in (primera, segunda) for p in r.context['pedidos_inactivos_list']]
+        self.assertEqual(len(set(vistos)), 25)
+        self.assertEqual(primera.context['total_pedidos'], 26)
+
+    def test_costo_no_depende_del_historial(self):
+        self.client.get(reverse('pedidos_mesero'))  # carga la matriz de recetas y las porciones
+
+        self.finalizar(5, timezone.now())
+        with CaptureQueriesContext(connection) as pocas:
+            self.client.get(reverse('pedidos_mesero'))
+        self.finalizar(60, timezone.now())
+        with CaptureQueriesContext(connection) as muchas:
+            self.client.get(reverse('pedidos_mesero'))
+
+        self.assertEqual(len(pocas), len(muchas))
+        self.assertFalse(any('"mainApp_plato"."id" =' in q['sql'] for q in muchas.captured_queries))
+
+    def test_cursor_invalido_muestra_la_primera_pagina(self):
+        self.finalizar(3, timezone.now())
+        response = self.client.get(reverse('pedidos_mesero'), {'antes': 'xyz'})
+        self.assertEqual(len(response.context['pedidos_inactivos_list']), 3)
@@ -2,7 +2,7 @@
 
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from . import views_api
+from . import views_api, views_modulo2
 
 router = DefaultRouter()
 
@@ -11,6 +11,7 @@ router.register(r'categorias', views_api.CategoriaMenuViewSet)
 router.register(r'ingredientes', views_api.IngredienteViewSet)
 router.register(r'platos', views_api.PlatoViewSet)
 router.register(r'stock', views_api.StockViewSet)
+router.register(r'mesas', views_modulo2.MesaViewSet)
 
 # URLs adicionales
 urlpatterns = [
@@ -22,6 +23,8 @@ urlpatterns = [
     path('crear-pedido-integrado/', views_api.crear_pedido_integrado, name='crear_pedido_integrado'),
     path('dashboard-restaurante/', views_api.dashboard_restaurante, name='dashboard_restaurante'),
     path('verificar-disponibilidad/', views_api.verificar_disponibilidad, name='verificar_disponibilidad'),
+    path('consultar-mesas/', views_modulo2.ConsultaMesasView.as_view(), name='consultar_mesas'),
+    path('exportar/<str:recurso>/', views_api.exportar, name='exportar'),
 ]
 
 # Incluir rutas del router
@@ -26,6 +26,8 @@ urlpatterns = [
     path('ingrediente/<int:pk>/edit/', views.ingrediente_update, name='ingrediente_update'),
     path('ingrediente/<int:pk>/delete/', views.ingrediente_delete, name='ingrediente_delete'),
     path('stock/<int:pk>/edit/', views.stock_update, name='stock_update'),
+    path('stock/importar/', views.stock_importar, name='stock_importar'),
+    path('stock/alertas/eventos/', views.stock_alertas_eventos, name='stock_alertas_eventos'),
 
     # ==================== MÓDULO 2: RUTAS WEB ====================
     
@@ -2,17 +2,33 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db import transaction
 from django.core.exceptions import ValidationError
-from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock, Mesa, Reserva
+from .models import CategoriaMenu, Ingrediente, Plato, Receta, Stock, Mesa, Reserva
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.forms import inlineformset_factory
 from .forms import PlatoForm, StockForm, CategoriaForm, IngredienteForm, RecetaInlineForm, MesaForm, ReservaForm
+from .services import StockService
+from . import cache_menu, importacion_stock
+from .idempotencia import idempotente
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 from datetime import timedelta
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required, user_passes_test
 from functools import wraps
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from cocina.eventos import respuesta_sse
+from .alertas_stock import canal_alertas
+
+def es_admin(user):
+    # Permitir acceso a superusers y staff
+    if user.is_superuser or user.is_staff:
+        return True
+    # Verificar si tiene perfil de admin
+    return hasattr(user, 'perfil') and user.perfil.rol == 'admin'
 
 # Decorador personalizado para verificar que el usuario sea administrador
 def admin_required(view_func):
@@ -20,11 +36,7 @@ def admin_required(view_func):
     def wrapper(request, *args, **kwargs):
         if not request.user.is_authenticated:
             return redirect('login')
-        # Permitir acceso a superusers y staff
-        if request.user.is_superuser or request.user.is_staff:
-            return view_func(request, *args, **kwargs)
-        # Verificar si tiene perfil de admin
-        if hasattr(request.user, 'perfil') and request.user.perfil.rol == 'admin':
+        if es_admin(request.user):
             return view_func(request, *args, **kwargs)
         # Si no es admin, redirigir al menú de cliente
         messages.error(request, 'No tienes permisos para acceder a esta página')
@@ -165,47 +177,6 @@ class StockSerializer:
             'cantidad_disponible': str(instance.cantidad_disponible)
         }
 
-# SERVICIO DE STOCK
-class StockService:
-    
-    @transaction.atomic
-    def validar_y_reservar_stock(self, plato_id, cantidad, pedido_id):
-        try:
-            plato = Plato.objects.get(id=plato_id, activo=True)
-            
-            # Verificar stock para cada ingrediente
-            for receta in plato.recetas.all():
-                stock = Stock.objects.get(ingrediente=receta.ingrediente)
-                cantidad_necesaria = receta.cantidad * cantidad
-                
-                if stock.cantidad_disponible < cantidad_necesaria:
-                    raise ValidationError(
-                        f"Stock insuficiente de {receta.ingrediente.nombre}. "
-                        f"Necesario: {cantidad_necesaria}, Disponible: {stock.cantidad_disponible}"
-                    )
-            
-            # Crear reserva
-            reserva = ReservaStock.objects.create(
-                plato=plato,
-                cantidad=cantidad,
-                pedido_id=pedido_id,
-                estado='reservado'
-            )
-            
-            # Bloquear stock reservado
-            for receta in plato.recetas.all():
-                stock = Stock.objects.get(ingrediente=receta.ingrediente)
-                cantidad_necesaria = receta.cantidad * cantidad
-                stock.cantidad_disponible -= cantidad_necesaria
-                stock.save()
-            
-            return reserva
-            
-        except Plato.DoesNotExist:
-            raise ValidationError("Plato no encontrado o inactivo")
-        except Stock.DoesNotExist:
-            raise ValidationError("Error en configuración de stock")
-
 # VIEWSETS
 class PlatoViewSet(viewsets.ViewSet):
 
@@ -265,14 +236,14 @@ class PlatoViewSet(viewsets.ViewSet):
         )
 
     def list(self, request):
-        platos = Plato.objects.filter(activo=True).select_related('categoria')
+        platos = Plato.objects.filter(activo=True).con_recetas()
         serializer = PlatoSerializer()
         data = [serializer.to_representation(plato) for plato in platos]
         return Response(data)
     
     def retrieve(self, request, pk=None):
         try:
-            plato = Plato.objects.get(pk=pk, activo=True)
+            plato = Plato.objects.con_recetas().get(pk=pk, activo=True)
             serializer = PlatoSerializer()
             return Response(serializer.to_representation(plato))
         except Plato.DoesNotExist:
@@ -323,6 +294,7 @@ class StockViewSet(viewsets.ViewSet):
         return Response(data)
     
     @action(detail=False, methods=['post'])
+    @idempotente('validar_reservar')
     def validar_reservar(self, request):
         plato_id = request.data.get('plato_id')
         cantidad = request.data.get('cantidad')
@@ -439,6 +411,45 @@ def stock_update(request, pk):
     return render(request, 'mainApp/stock_form.html', {'form': form, 'title': 'Editar Stock'})
 
 
+@admin_required
+def stock_importar(request):
+    """Recepción o conteo de muchos ingredientes en un solo envío (CSV pegado o subido)"""
+    contexto = {'modo': 'ingreso', 'csv': '', 'referencia': ''}
+    if request.method == 'POST':
+        contexto.update(
+            modo=request.POST.get('modo', 'ingreso'),
+            csv=request.POST.get('csv', ''),
+            referencia=request.POST.get('referencia', ''),
+        )
+        try:
+            filas = importacion_stock.leer_request(request.POST, request.FILES.get('archivo'))
+            aplicado, reporte = importacion_stock.importar(
+                filas, contexto['modo'], contexto['referencia'] or f'importación {request.user.username}'
+            )
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+        else:
+            contexto['reporte'] = reporte
+            if aplicado:
+                messages.success(request, f'Stock actualizado: {len(reporte)} líneas')
+            else:
+                messages.error(request, 'Hay líneas con errores; no se aplicó ningún cambio')
+    return render(request, 'mainApp/stock_importar.html', contexto)
+
+
+async def stock_alertas_eventos(request):
+    """
+    Stream Server-Sent Events con las alertas de stock bajo (ver
+    alertas_stock.py). Igual que el monitor de cocina, requiere ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("El stream de eventos requiere un servidor ASGI", status=503)
+    user = await request.auser()
+    if not user.is_authenticated or not await sync_to_async(es_admin)(user):
+        return HttpResponse(status=403)
+    return respuesta_sse(canal_alertas)
+
+
 @admin_required
 def stock_create(request):
     if request.method == 'POST':
@@ -666,21 +677,56 @@ def custom_logout(request):
     return redirect('cliente_menu')
 
 
+def _menu_cacheable(request):
+    # Solo la página de anónimos sin mensajes pendientes es igual para todos
+    return not request.user.is_authenticated and not len(messages.get_messages(request))
+
+
+def _menu_etag(request):
+    if _menu_cacheable(request):
+        return cache_menu.etag('cliente_menu', request.GET.get('categoria', ''))
+
+
+def _menu_last_modified(request):
+    if _menu_cacheable(request):
+        return cache_menu.ultima_modificacion()
+
+
+@condition(etag_func=_menu_etag, last_modified_func=_menu_last_modified)
 def cliente_menu(request):
     """Vista pública del menú para clientes"""
-    platos = Plato.objects.filter(activo=True).select_related('categoria')
-    categorias = CategoriaMenu.objects.all()
-    
     # Filtro por categoría
     categoria_filtro = request.GET.get('categoria')
-    if categoria_filtro:
-        platos = platos.filter(categoria_id=categoria_filtro)
     
-    return render(request, 'mainApp/cliente_menu.html', {
+    cacheable = _menu_cacheable(request)
+    clave_html = cache_menu.clave('cliente_menu', categoria_filtro or '', 'html')
+    if cacheable:
+        html = cache_menu.leer(clave_html)
+        if html is not None:
+            response = HttpResponse(html)
+            patch_cache_control(response, no_cache=True)
+            return response
+    
+    def construir():
+        platos = Plato.objects.filter(activo=True).select_related('categoria')
+        if categoria_filtro:
+            platos = platos.filter(categoria_id=categoria_filtro)
+        return list(platos), list(CategoriaMenu.objects.all())
+    
+    # La disponibilidad por stock la pide el navegador a /api/platos/porciones-disponibles/
+    platos, categorias = cache_menu.obtener(
+        cache_menu.clave('cliente_menu', categoria_filtro or '', 'datos'), construir
+    )
+    
+    response = render(request, 'mainApp/cliente_menu.html', {
         'platos': platos,
         'categorias': categorias,
         'categoria_filtro': categoria_filtro
     })
+    if cacheable:
+        cache_menu.guardar(clave_html, response.content)
+        patch_cache_control(response, no_cache=True)
+    return response
 
 
 def cliente_register(request):
@@ -775,14 +821,10 @@ def cliente_reservar(request):
                 for error in errors:
                     messages.error(request, error)
     
-    # GET - Mostrar formulario
+    # GET - Mostrar formulario; la disponibilidad por turno la carga la grilla (/api/mesas/grilla/)
+    from .disponibilidad import HORARIOS
     mesas = Mesa.objects.all().order_by('numero')  # Mostrar todas las mesas
-    
-    # Generar horarios disponibles (12:00 - 21:00, cada 30 min)
-    horarios = []
-    for h in range(12, 21):
-        horarios.append(f"{h:02d}:00")
-        horarios.append(f"{h:02d}:30")
+    horarios = [hora.strftime('%H:%M') for hora in HORARIOS]
     
     from datetime import date
     fecha_min = date.today().isoformat()
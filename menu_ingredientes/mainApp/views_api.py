@@ -6,21 +6,33 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Sum, Count, F
+from django.db.models import Count, Window
 from django.utils import timezone
-from datetime import datetime, time as dt_time
+from datetime import datetime
 import datetime as dt
 
 # Importar todos los modelos necesarios
 from .models import (
     CategoriaMenu, Ingrediente, Plato, Receta, Stock, ReservaStock, 
-    Reserva, Mesa
+    Reserva, MovimientoStock
 )
 
 from .serializers import (
     CategoriaMenuSerializer, IngredienteSerializer, 
     PlatoSerializer, StockSerializer
 )
+from .services import StockService, StockInsuficiente, stock_disponible, porciones_disponibles
+from .cache_recetas import matriz_recetas
+from .disponibilidad import mesas_libres, intervalo_desde
+from . import cache_menu, contadores, exportaciones, importacion_stock, movimientos
+from .cache_utils import obtener_o_calcular
+from .idempotencia import idempotente
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.dateparse import parse_datetime
+from django.core.exceptions import ValidationError
+from django.db import transaction
 
 # ==================== VIEWSETS BÁSICOS ====================
 
@@ -61,7 +73,7 @@ class PlatoViewSet(viewsets.ModelViewSet):
     """
     API para gestión de platos del menú
     """
-    queryset = Plato.objects.filter(activo=True)
+    queryset = Plato.objects.filter(activo=True).con_recetas()
     serializer_class = PlatoSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
@@ -69,17 +81,52 @@ class PlatoViewSet(viewsets.ModelViewSet):
     filterset_fields = ['categoria', 'activo']
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'porciones_disponibles']:
             return [AllowAny()]
         return [IsAuthenticated()]
 
+    def list(self, request, *args, **kwargs):
+        """Listado cacheado por versión del menú, con ETag/Last-Modified para 304"""
+        partes = ('api_platos', request.build_absolute_uri(), request.accepted_renderer.format)
+        etag = cache_menu.etag(*partes)
+        ultima_modificacion = cache_menu.ultima_modificacion()
+        no_modificado = get_conditional_response(
+            request, etag=etag, last_modified=int(ultima_modificacion.timestamp())
+        )
+        if no_modificado is not None:
+            return no_modificado
+
+        data = cache_menu.obtener(
+            cache_menu.clave(*partes),
+            lambda: super(PlatoViewSet, self).list(request, *args, **kwargs).data
+        )
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(ultima_modificacion.timestamp())
+        patch_cache_control(response, no_cache=True)
+        return response
+
     @action(detail=False, methods=['get'])
     def disponibles(self, request):
         """Platos activos disponibles"""
-        platos = Plato.objects.filter(activo=True)
+        platos = Plato.objects.filter(activo=True).con_recetas()
         serializer = self.get_serializer(platos, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], url_path='porciones-disponibles')
+    def porciones_disponibles(self, request):
+        """Porciones que se pueden preparar de cada plato activo con el stock actual"""
+        porciones = porciones_disponibles()
+        return Response([
+            {
+                'plato_id': receta.plato_id,
+                'nombre': receta.nombre,
+                'porciones': porciones[receta.plato_id],
+                'disponible': porciones[receta.plato_id] != 0,
+            }
+            for receta in matriz_recetas.platos_activos()
+        ])
+
 
 class StockViewSet(viewsets.ModelViewSet):
     """
@@ -93,13 +140,134 @@ class StockViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def bajo_stock(self, request):
-        """Ingredientes con stock bajo"""
+        """Ingredientes con stock bajo, leídos del conjunto StockBajo (ver alertas_stock.py)"""
         stock_bajo = self.get_queryset().filter(
-            cantidad_disponible__lte=F('ingrediente__stock_minimo')
-        )
+            ingrediente__stock_bajo__isnull=False
+        ).order_by('ingrediente__stock_bajo__desde')
         serializer = self.get_serializer(stock_bajo, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def movimientos(self, request, pk=None):
+        """
+        Saldo del libro y últimos movimientos de un ingrediente hasta un momento
+        GET /api/stock/{id}/movimientos/?hasta=<ISO 8601>&limite=50
+        """
+        stock = self.get_object()
+        hasta = request.query_params.get('hasta')
+        if hasta:
+            hasta = parse_datetime(hasta)
+            if hasta is None:
+                return Response({'error': 'hasta debe ser una fecha y hora ISO 8601'}, status=400)
+            if timezone.is_naive(hasta):
+                hasta = timezone.make_aware(hasta)
+        else:
+            hasta = timezone.now()
+        try:
+            limite = min(max(int(request.query_params.get('limite', 50)), 1), 500)
+        except ValueError:
+            return Response({'error': 'limite debe ser un número entero'}, status=400)
+
+        ultimos = (
+            MovimientoStock.objects
+            .filter(ingrediente_id=stock.ingrediente_id, creado_en__lte=hasta)
+            .order_by('-id')
+            .values('id', 'tipo', 'cantidad', 'referencia', 'creado_en')[:limite]
+        )
+        return Response({
+            'ingrediente_id': stock.ingrediente_id,
+            'hasta': hasta.isoformat(),
+            'cantidad': movimientos.stock_en(stock.ingrediente_id, hasta),
+            'movimientos': list(ultimos),
+        })
+
+    @action(detail=False, methods=['post'])
+    @idempotente('importar_stock')
+    def importar(self, request):
+        """
+        Recepción de proveedor o conteo de inventario de muchos ingredientes
+        POST /api/stock/importar/
+        Body: { modo: ingreso|conteo, referencia, lineas: [{ingrediente, cantidad}, ...] }
+        o multipart con `archivo` CSV (columnas ingrediente,cantidad), modo y referencia
+        """
+        modo = request.data.get('modo', 'ingreso')
+        referencia = request.data.get('referencia') or f'importación {request.user.username}'
+        try:
+            filas = importacion_stock.leer_request(request.data, request.FILES.get('archivo'))
+            aplicado, reporte = importacion_stock.importar(filas, modo, referencia)
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        errores = sum(1 for fila in reporte if fila['error'])
+        return Response({
+            'aplicado': aplicado,
+            'modo': modo,
+            'lineas': reporte,
+            'errores': errores,
+        }, status=status.HTTP_200_OK if aplicado else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='reservar-lote')
+    @idempotente('reservar_lote')
+    def reservar_lote(self, request):
+        """
+        Reserva stock para varias líneas de una comanda en una sola transacción
+        POST /api/stock/reservar-lote/
+        Body: { pedido_id, lineas: [{plato_id, cantidad}, ...] }
+        """
+        pedido_id = request.data.get('pedido_id')
+        lineas = request.data.get('lineas')
+
+        if not pedido_id or not isinstance(lineas, list) or not lineas:
+            return Response(
+                {'error': 'pedido_id y lineas son requeridos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            pares = [(linea['plato_id'], linea.get('cantidad', 1)) for linea in lineas]
+        except (TypeError, KeyError, AttributeError):
+            return Response(
+                {'error': 'Cada línea debe tener plato_id y cantidad'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            reservas = StockService().validar_y_reservar_lineas(pares, str(pedido_id))
+        except StockInsuficiente as e:
+            return Response({
+                'success': False,
+                'message': e.message,
+                'ingredientes_faltantes': [
+                    {
+                        'ingrediente': f['ingrediente'],
+                        'necesario': f['necesario'],
+                        'disponible': f['disponible'],
+                    }
+                    for f in e.faltantes
+                ],
+                'lineas': e.lineas,
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            return Response({
+                'success': False,
+                'message': e.messages[0]
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'success': True,
+            'pedido_id': str(pedido_id),
+            'lineas': [
+                {
+                    'plato_id': reserva.plato_id,
+                    'cantidad': reserva.cantidad,
+                    'ok': True,
+                    'reserva_id': reserva.id,
+                }
+                for reserva in reservas
+            ],
+            'message': 'Stock reservado exitosamente'
+        })
+
 
 # ==================== APIViews SIMPLES ====================
 
@@ -117,9 +285,7 @@ class DashboardAPIView(APIView):
             'platos_por_categoria': Plato.objects.values('categoria__nombre')
                 .annotate(total=Count('id'))
                 .order_by('categoria__nombre'),
-            'ingredientes_bajo_stock': Stock.objects.filter(
-                cantidad_disponible__lte=F('ingrediente__stock_minimo')
-            ).count(),
+            'ingredientes_bajo_stock': contadores.bajo_stock(),
         }
         return Response(stats)
 
@@ -140,27 +306,19 @@ class ValidarStockAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            plato = Plato.objects.get(id=plato_id, activo=True)
-        except Plato.DoesNotExist:
+        receta, faltantes = StockService().verificar(plato_id, cantidad)
+        if receta is None:
             return Response(
                 {'error': 'Plato no encontrado'},
                 status=status.HTTP_404_NOT_FOUND
             )
-
-        # Verificar stock para cada ingrediente
-        faltantes = []
-        for receta in plato.recetas.all():
-            stock = Stock.objects.filter(ingrediente=receta.ingrediente).first()
-            if stock and stock.cantidad_disponible < (receta.cantidad * cantidad):
-                faltantes.append({
-                    'ingrediente': receta.ingrediente.nombre,
-                    'necesario': receta.cantidad * cantidad,
-                    'disponible': stock.cantidad_disponible
-                })
+        faltantes = [
+            {'ingrediente': f['ingrediente'], 'necesario': f['necesario'], 'disponible': f['disponible']}
+            for f in faltantes
+        ]
 
         return Response({
-            'plato': plato.nombre,
+            'plato': receta.nombre,
             'cantidad': cantidad,
             'stock_suficiente': len(faltantes) == 0,
             'ingredientes_faltantes': faltantes
@@ -196,186 +354,202 @@ class ReservaStockViewSet(viewsets.ReadOnlyModelViewSet):
 
 # ==================== APIS DE INTEGRACIÓN ====================
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def dashboard_integracion(request):
+def _muestra_con_conteos(queryset, limite=5):
     """
-    API que integra datos de los 4 módulos del sistema
+    Primeras `limite` filas y el total de todo el queryset en una sola query:
+    el total viaja como COUNT(*) OVER () en cada fila.
     """
-    try:
-        # ========== DATOS DEL MÓDULO 1 ==========
-        # Menú, ingredientes y stock
-        platos_activos = Plato.objects.filter(activo=True)
-        platos_count = platos_activos.count()
+    filas = list(queryset.annotate(conteo_total=Window(Count('pk')))[:limite])
+    return filas, filas[0].conteo_total if filas else 0
+
+
+def _datos_integracion():
+    # ========== DATOS DEL MÓDULO 1 ==========
+    # Menú, ingredientes y stock
+    # Primeros 5 platos para ejemplo y el total de activos en la misma query
+    primeros, platos_count = _muestra_con_conteos(
+        Plato.objects.filter(activo=True).select_related('categoria')
+    )
+    
+    # Recetas desde la matriz en memoria y todo el stock necesario en una query
+    recetas = {plato.id: matriz_recetas.receta(plato.id) for plato in primeros}
+    disponibles = stock_disponible({
+        ing_id for receta in recetas.values() if receta for ing_id in receta.ingredientes
+    })
+    
+    platos_con_stock = []
+    for plato in primeros:
+        receta = recetas[plato.id]
+        stock_suficiente = not receta or all(
+            ing_id not in disponibles or disponibles[ing_id] >= cant
+            for ing_id, cant in zip(receta.ingredientes, receta.cantidades)
+        )
         
-        # Platos con su stock disponible
-        platos_con_stock = []
-        for plato in platos_activos[:5]:  # Primeros 5 para ejemplo
-            stock_suficiente = True
-            for receta in plato.recetas.all():
-                stock = Stock.objects.filter(ingrediente=receta.ingrediente).first()
-                if stock and stock.cantidad_disponible < receta.cantidad:
-                    stock_suficiente = False
-                    break
-            
-            platos_con_stock.append({
-                'id': plato.id,
-                'nombre': plato.nombre,
-                'categoria': plato.categoria.nombre,
-                'precio': float(plato.precio),
-                'stock_suficiente': stock_suficiente
-            })
+        platos_con_stock.append({
+            'id': plato.id,
+            'nombre': plato.nombre,
+            'categoria': plato.categoria.nombre,
+            'precio': float(plato.precio),
+            'stock_suficiente': stock_suficiente
+        })
+    
+    # Totales de reservas, pedidos y cocina desde los contadores materializados
+    # (por fecha local, igual que contadores.dia_local)
+    hoy = timezone.localdate()
+    conteos_dia, conteos_globales = contadores.leer(hoy)
+    
+    # ========== DATOS DEL MÓDULO 2 ==========
+    # Reservas activas para hoy (primeras 5 y el total)
+    reservas_por_estado = conteos_dia.get('reserva', {})
+    reservas_count = reservas_por_estado.get('pendiente', 0) + reservas_por_estado.get('confirmada', 0)
+    reservas_hoy = Reserva.objects.filter(
+        fecha_reserva=hoy,
+        estado__in=['pendiente', 'confirmada']
+    ).select_related('mesa', 'cliente')[:5]
+    
+    reservas_list = []
+    for reserva in reservas_hoy:
+        reservas_list.append({
+            'id': reserva.id,
+            'mesa': reserva.mesa.numero,
+            'cliente': reserva.cliente.username,
+            'hora': reserva.hora_inicio.strftime('%H:%M'),
+            'personas': reserva.num_personas,
+            'estado': reserva.estado
+        })
+    
+    # ========== DATOS DEL MÓDULO 3 ==========
+    pedidos_activos_list = []
+    pedidos_count = 0
+    pedidos_por_estado = {}
+    
+    try:
+        from pedidos.models import Pedido, ESTADOS_FINALES
         
-        # ========== DATOS DEL MÓDULO 2 ==========
-        # Reservas activas para hoy
-        hoy = timezone.now().date()
-        reservas_hoy = Reserva.objects.filter(
-            fecha_reserva=hoy,
-            estado__in=['pendiente', 'confirmada']
-        ).select_related('mesa', 'cliente')[:5]  # Primeras 5 reservas
+        pedidos_por_estado = contadores.sin_ceros({
+            estado: total for estado, total in conteos_globales.get('pedido', {}).items()
+            if estado not in ESTADOS_FINALES
+        })
+        pedidos_count = sum(pedidos_por_estado.values())
+        pedidos_activos = Pedido.objects.activos().order_by('-creado_en')[:5]
         
-        reservas_list = []
-        for reserva in reservas_hoy:
-            reservas_list.append({
-                'id': reserva.id,
-                'mesa': reserva.mesa.numero,
-                'cliente': reserva.cliente.username,
-                'hora': reserva.hora_inicio.strftime('%H:%M'),
-                'personas': reserva.num_personas,
-                'estado': reserva.estado
+        for pedido in pedidos_activos:
+            pedidos_activos_list.append({
+                'id': str(pedido.id),
+                'mesa': pedido.mesa,
+                'cliente': pedido.cliente,
+                'plato': pedido.plato,
+                'estado': pedido.estado,
+                'creado': pedido.creado_en.strftime('%H:%M')
             })
-        
-        # ========== DATOS DEL MÓDULO 3 ==========
-        pedidos_activos_list = []
-        pedidos_count = 0
-        
-        try:
-            from pedidos.models import Pedido
-            
-            pedidos_activos = Pedido.objects.exclude(
-                estado__in=['CERRADO', 'CANCELADO']
-            ).order_by('-creado_en')[:5]
             
-            pedidos_count = Pedido.objects.exclude(
-                estado__in=['CERRADO', 'CANCELADO']
-            ).count()
-            
-            for pedido in pedidos_activos:
-                pedidos_activos_list.append({
-                    'id': str(pedido.id),
-                    'mesa': pedido.mesa,
-                    'cliente': pedido.cliente,
-                    'plato': pedido.plato,
-                    'estado': pedido.estado,
-                    'creado': pedido.creado_en.strftime('%H:%M')
-                })
-                
-        except Exception as e:
-            pedidos_activos_list = [{'error': f'Error módulo pedidos: {str(e)}'}]
+    except Exception as e:
+        pedidos_activos_list = [{'error': f'Error módulo pedidos: {str(e)}'}]
+    
+    # ========== DATOS DEL MÓDULO 4 ==========
+    cocina_pedidos_list = []
+    cocina_count = 0
+    
+    try:
+        from cocina.models import PedidoCocina
         
-        # ========== DATOS DEL MÓDULO 4 ==========
-        cocina_pedidos_list = []
-        cocina_count = 0
+        cocina_count = sum(
+            total for estado, total in conteos_globales.get('cocina', {}).items()
+            if estado != PedidoCocina.EstadoPedido.ENTREGADO
+        )
+        cocina_pedidos = PedidoCocina.objects.activos().order_by('-fecha_creacion')[:5]
         
-        try:
-            from cocina.models import PedidoCocina
-            
-            cocina_pedidos = PedidoCocina.objects.exclude(
-                estado__in=['ENTREGADO']
-            ).order_by('-fecha_creacion')[:5]
-            
-            cocina_count = PedidoCocina.objects.exclude(
-                estado__in=['ENTREGADO']
-            ).count()
+        for pedido in cocina_pedidos:
+            cocina_pedidos_list.append({
+                'id': pedido.id,
+                'mesa': pedido.mesa,
+                'cliente': pedido.cliente,
+                'descripcion': pedido.descripcion,
+                'estado': pedido.estado,
+                'creado': pedido.fecha_creacion.strftime('%H:%M')
+            })
             
-            for pedido in cocina_pedidos:
-                cocina_pedidos_list.append({
-                    'id': pedido.id,
-                    'mesa': pedido.mesa,
-                    'cliente': pedido.cliente,
-                    'descripcion': pedido.descripcion,
-                    'estado': pedido.estado,
-                    'creado': pedido.fecha_creacion.strftime('%H:%M')
-                })
-                
-        except Exception as e:
-            cocina_pedidos_list = [{'error': f'Error módulo cocina: {str(e)}'}]
-        
-        # ========== ESTADO GENERAL DEL SISTEMA ==========
-        estado_sistema = {
-            'menu': {
-                'total_platos': platos_count,
-                'platos_con_stock_insuficiente': len([p for p in platos_con_stock if not p['stock_suficiente']])
-            },
-            'reservas': {
-                'total_hoy': len(reservas_list),
-                'mesas_ocupadas': len(set(r['mesa'] for r in reservas_list))
+    except Exception as e:
+        cocina_pedidos_list = [{'error': f'Error módulo cocina: {str(e)}'}]
+    
+    # ========== ESTADO GENERAL DEL SISTEMA ==========
+    estado_sistema = {
+        'menu': {
+            'total_platos': platos_count,
+            'platos_con_stock_insuficiente': len([p for p in platos_con_stock if not p['stock_suficiente']])
+        },
+        'reservas': {
+            'total_hoy': reservas_count,
+            'mesas_ocupadas': len(set(r['mesa'] for r in reservas_list))
+        },
+        'pedidos': {
+            'total_activos': pedidos_count,
+            'por_estado': pedidos_por_estado
+        },
+        'cocina': {
+            'total_preparando': cocina_count,
+            'sincronizacion_pedidos': 'OK' if pedidos_count == cocina_count else 'PARCIAL'
+        }
+    }
+    
+    return {
+        'sistema': 'Restaurante - Estado Integrado',
+        'timestamp': timezone.now().isoformat(),
+        'datos': {
+            'modulo_menu': {
+                'descripcion': 'Gestión de menú e ingredientes',
+                'platos_activos': platos_con_stock,
+                'resumen': {
+                    'total_platos': platos_count,
+                    'muestra': len(platos_con_stock)
+                }
             },
-            'pedidos': {
-                'total_activos': pedidos_count,
-                'por_estado': {}
+            'modulo_reservas': {
+                'descripcion': 'Clientes, mesas y reservas',
+                'reservas_hoy': reservas_list,
+                'resumen': {
+                    'total_hoy': reservas_count,
+                    'muestra': len(reservas_list)
+                }
             },
-            'cocina': {
-                'total_preparando': cocina_count,
-                'sincronizacion_pedidos': 'OK' if pedidos_count == cocina_count else 'PARCIAL'
-            }
-        }
-        
-        # Contar pedidos por estado (si hay datos)
-        if pedidos_count > 0:
-            try:
-                from pedidos.models import Pedido
-                por_estado = Pedido.objects.exclude(
-                    estado__in=['CERRADO', 'CANCELADO']
-                ).values('estado').annotate(total=Count('id'))
-                estado_sistema['pedidos']['por_estado'] = {item['estado']: item['total'] for item in por_estado}
-            except:
-                pass
-        
-        return Response({
-            'sistema': 'Restaurante - Estado Integrado',
-            'timestamp': timezone.now().isoformat(),
-            'datos': {
-                'modulo_menu': {
-                    'descripcion': 'Gestión de menú e ingredientes',
-                    'platos_activos': platos_con_stock,
-                    'resumen': {
-                        'total_platos': platos_count,
-                        'muestra': len(platos_con_stock)
-                    }
-                },
-                'modulo_reservas': {
-                    'descripcion': 'Clientes, mesas y reservas',
-                    'reservas_hoy': reservas_list,
-                    'resumen': {
-                        'total_hoy': len(reservas_list),
-                        'muestra': len(reservas_list)
-                    }
-                },
-                'modulo_pedidos': {
-                    'descripcion': 'Sistema de pedidos (mesero)',
-                    'pedidos_activos': pedidos_activos_list,
-                    'resumen': {
-                        'total_activos': pedidos_count,
-                        'muestra': len(pedidos_activos_list)
-                    }
-                },
-                'modulo_cocina': {
-                    'descripcion': 'Monitor de cocina en tiempo real',
-                    'pedidos_en_cocina': cocina_pedidos_list,
-                    'resumen': {
-                        'total_preparando': cocina_count,
-                        'muestra': len(cocina_pedidos_list)
-                    }
+            'modulo_pedidos': {
+                'descripcion': 'Sistema de pedidos (mesero)',
+                'pedidos_activos': pedidos_activos_list,
+                'resumen': {
+                    'total_activos': pedidos_count,
+                    'muestra': len(pedidos_activos_list)
                 }
             },
-            'estado_general': estado_sistema,
-            'integracion': {
-                'modulos_conectados': 4,
-                'total_datos': platos_count + len(reservas_list) + pedidos_count + cocina_count,
-                'actualizado': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+            'modulo_cocina': {
+                'descripcion': 'Monitor de cocina en tiempo real',
+                'pedidos_en_cocina': cocina_pedidos_list,
+                'resumen': {
+                    'total_preparando': cocina_count,
+                    'muestra': len(cocina_pedidos_list)
+                }
             }
-        })
+        },
+        'estado_general': estado_sistema,
+        'integracion': {
+            'modulos_conectados': 4,
+            'total_datos': platos_count + reservas_count + pedidos_count + cocina_count,
+            'actualizado': timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+    }
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def dashboard_integracion(request):
+    """
+    API que integra datos de los 4 módulos del sistema.
+    Una query por módulo más una para los contadores; el resultado se
+    reutiliza DASHBOARD_CACHE_TTL segundos.
+    """
+    try:
+        return Response(obtener_o_calcular(
+            'dashboard:integracion', _datos_integracion, settings.DASHBOARD_CACHE_TTL
+        ))
         
     except Exception as e:
         return Response({
@@ -386,6 +560,7 @@ def dashboard_integracion(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotente('crear_pedido_integrado')
 def crear_pedido_integrado(request):
     """
     Crea un pedido integrando múltiples módulos:
@@ -417,66 +592,63 @@ def crear_pedido_integrado(request):
                 status=404
             )
         
-        # 3. Verificar stock (Módulo 1)
-        ingredientes_faltantes = []
-        for receta in plato.recetas.all():
-            stock = Stock.objects.filter(ingrediente=receta.ingrediente).first()
-            if stock and stock.cantidad_disponible < (receta.cantidad * cantidad):
-                ingredientes_faltantes.append({
-                    'ingrediente': receta.ingrediente.nombre,
-                    'necesario': receta.cantidad * cantidad,
-                    'disponible': stock.cantidad_disponible
-                })
+        try:
+            cantidad = int(cantidad)
+            if cantidad <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'cantidad debe ser un número mayor a 0'},
+                status=400
+            )
         
-        if ingredientes_faltantes:
+        # 3. Crear pedido (Módulo 3), reservar stock (Módulo 1) y encolar el alta
+        #    en cocina (Módulo 4) en una sola transacción
+        try:
+            from pedidos.models import Pedido
+            from pedidos.outbox import encolar_alta_cocina
+            
+            with transaction.atomic():
+                pedido = Pedido(
+                    mesa=str(mesa),
+                    cliente=cliente,
+                    plato=plato.nombre,
+                    estado=Pedido.Estado.CREADO
+                )
+                # Como siempre en este endpoint, un ingrediente sin fila de Stock no se controla
+                StockService().validar_y_reservar_stock(plato.id, cantidad, str(pedido.id), estricto=False)
+                pedido.save()
+                # La mesa numérica de cocina sale de pedido.mesa (1 si no es un número)
+                mensaje_cocina = encolar_alta_cocina(pedido, f"{plato.nombre} x{cantidad}")
+                
+        except StockInsuficiente as e:
             return Response({
                 'error': 'Stock insuficiente',
                 'plato': plato.nombre,
-                'ingredientes_faltantes': ingredientes_faltantes
+                'ingredientes_faltantes': [
+                    {
+                        'ingrediente': f['ingrediente'],
+                        'necesario': f['necesario'],
+                        'disponible': f['disponible'],
+                    }
+                    for f in e.faltantes
+                ]
+            }, status=400)
+        except ValidationError as e:
+            return Response({
+                'error': e.messages[0],
+                'plato': plato.nombre
             }, status=400)
-        
-        # 4. Crear pedido (Módulo 3)
-        pedido = None
-        try:
-            from pedidos.models import Pedido
-            
-            pedido = Pedido.objects.create(
-                mesa=mesa,
-                cliente=cliente,
-                plato=plato.nombre,
-                estado=Pedido.Estado.CREADO
-            )
-            
-            # Restar stock (Módulo 1)
-            for receta in plato.recetas.all():
-                stock = Stock.objects.filter(ingrediente=receta.ingrediente).first()
-                if stock:
-                    stock.cantidad_disponible -= receta.cantidad * cantidad
-                    stock.save()
-                    
         except Exception as e:
             return Response({
                 'error': f'Error al crear pedido: {str(e)}'
             }, status=500)
         
-        # 5. Notificar a cocina (Módulo 4)
-        cocina_creado = False
-        try:
-            from cocina.models import PedidoCocina
-            
-            PedidoCocina.objects.create(
-                id_modulo3=str(pedido.id),
-                mesa=int(mesa) if mesa.isdigit() else 1,
-                cliente=cliente,
-                descripcion=f"{plato.nombre} x{cantidad}",
-                estado=PedidoCocina.EstadoPedido.CREADO
-            )
-            cocina_creado = True
-            
-        except Exception as e:
-            cocina_creado = False
+        # 4. El outbox se despacha al confirmar; si falló queda pendiente de reintento
+        mensaje_cocina.refresh_from_db(fields=['procesado_en'])
+        cocina_creado = mensaje_cocina.procesado_en is not None
         
-        # 6. Respuesta integrada
+        # 5. Respuesta integrada
         return Response({
             'mensaje': 'Pedido creado exitosamente',
             'pedido': {
@@ -500,7 +672,7 @@ def crear_pedido_integrado(request):
                 },
                 'modulo_4': {
                     'accion': 'Notificación a cocina',
-                    'resultado': 'OK' if cocina_creado else 'Parcial',
+                    'resultado': 'OK' if cocina_creado else 'Pendiente',
                     'cocina_notificada': cocina_creado
                 }
             },
@@ -516,140 +688,115 @@ def crear_pedido_integrado(request):
         }, status=500)
 
 
+def _datos_restaurante():
+    # Fecha y hora locales: los contadores y las reservas usan la fecha local
+    ahora = timezone.localtime()
+    hoy = ahora.date()
+    
+    # Todos los conteos salen de los contadores materializados (una query)
+    conteos_dia, conteos_globales = contadores.leer(hoy)
+    
+    # ========== MÓDULO 1: INVENTARIO ==========
+    ingredientes_bajo_stock = conteos_globales.get('stock', {}).get(contadores.BAJO_MINIMO, 0)
+    
+    # ========== MÓDULO 2: RESERVAS ==========
+    reservas_por_estado = conteos_dia.get('reserva', {})
+    reservas = {
+        'total': sum(reservas_por_estado.values()),
+        'activas': reservas_por_estado.get('pendiente', 0) + reservas_por_estado.get('confirmada', 0),
+    }
+    
+    # Próximas reservas (en las próximas 2 horas)
+    hora_actual = ahora.time()
+    hora_limite = (datetime.combine(hoy, hora_actual) + dt.timedelta(hours=2)).time()
+    
+    proximas_reservas = Reserva.objects.filter(
+        fecha_reserva=hoy,
+        hora_inicio__gte=hora_actual,
+        hora_inicio__lte=hora_limite,
+        estado__in=['pendiente', 'confirmada']
+    ).select_related('mesa', 'cliente')[:5]
+    
+    # ========== MÓDULO 3: PEDIDOS ==========
+    pedidos_por_estado = contadores.sin_ceros(conteos_dia.get('pedido', {}))
+    pedidos_hoy_count = sum(pedidos_por_estado.values())
+    
+    # ========== MÓDULO 4: COCINA ==========
+    cocina_por_estado = contadores.sin_ceros(conteos_dia.get('cocina', {}))
+    cocina_pedidos_count = sum(cocina_por_estado.values())
+    
+    # ========== MESAS DISPONIBLES ==========
+    mesas_por_estado = conteos_globales.get('mesa', {})
+    mesas_totales = sum(mesas_por_estado.values())
+    mesas_disponibles = mesas_por_estado.get('disponible', 0)
+    
+    # ========== CONSTRUIR RESPUESTA ==========
+    ocupacion_porcentaje = 0
+    if mesas_totales > 0:
+        ocupacion_porcentaje = ((mesas_totales - mesas_disponibles) / mesas_totales) * 100
+    
+    return {
+        'dashboard': 'Estado del Restaurante',
+        'fecha': hoy.isoformat(),
+        'hora_actual': ahora.strftime('%H:%M'),
+        
+        'resumen': {
+            'inventario': {
+                'ingredientes_bajo_stock': ingredientes_bajo_stock,
+                'alerta': ingredientes_bajo_stock > 0
+            },
+            'reservas': {
+                'total_hoy': reservas['total'],
+                'activas': reservas['activas'],
+                'ocupacion_mesas': f'{ocupacion_porcentaje:.1f}%'
+            },
+            'pedidos': {
+                'hoy': pedidos_hoy_count,
+                'por_estado': pedidos_por_estado
+            },
+            'cocina': {
+                'pedidos_hoy': cocina_pedidos_count,
+                'por_estado': cocina_por_estado
+            },
+            'mesas': {
+                'totales': mesas_totales,
+                'disponibles': mesas_disponibles,
+                'ocupadas': mesas_totales - mesas_disponibles
+            }
+        },
+        
+        'proximas_reservas': [
+            {
+                'id': r.id,
+                'mesa': r.mesa.numero,
+                'cliente': r.cliente.username,
+                'hora': r.hora_inicio.strftime('%H:%M'),
+                'personas': r.num_personas
+            }
+            for r in proximas_reservas
+        ],
+        
+        'modulos': {
+            'modulo_1': 'Menú e Inventario',
+            'modulo_2': 'Reservas y Mesas',
+            'modulo_3': 'Sistema de Pedidos',
+            'modulo_4': 'Monitor de Cocina'
+        }
+    }
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def dashboard_restaurante(request):
     """
-    Dashboard completo del restaurante con datos de todos los módulos
+    Dashboard completo del restaurante con datos de todos los módulos.
+    Conteos desde los contadores materializados; el resultado se reutiliza
+    DASHBOARD_CACHE_TTL segundos.
     """
     try:
-        hoy = timezone.now().date()
-        ahora = timezone.now()
-        
-        # ========== MÓDULO 1: INVENTARIO ==========
-        ingredientes_bajo_stock = Stock.objects.filter(
-            cantidad_disponible__lte=F('ingrediente__stock_minimo')
-        ).count()
-        
-        # ========== MÓDULO 2: RESERVAS ==========
-        reservas_hoy = Reserva.objects.filter(fecha_reserva=hoy).count()
-        reservas_activas = Reserva.objects.filter(
-            fecha_reserva=hoy,
-            estado__in=['pendiente', 'confirmada']
-        ).count()
-        
-        # Próximas reservas (en las próximas 2 horas)
-        hora_actual = ahora.time()
-        hora_limite = (datetime.combine(hoy, hora_actual) + dt.timedelta(hours=2)).time()
-        
-        proximas_reservas = Reserva.objects.filter(
-            fecha_reserva=hoy,
-            hora_inicio__gte=hora_actual,
-            hora_inicio__lte=hora_limite,
-            estado__in=['pendiente', 'confirmada']
-        ).select_related('mesa', 'cliente')[:5]
-        
-        # ========== MÓDULO 3: PEDIDOS ==========
-        pedidos_hoy_count = 0
-        pedidos_por_estado = {}
-        
-        try:
-            from pedidos.models import Pedido
-            # Pedidos de hoy
-            inicio_hoy = timezone.make_aware(datetime.combine(hoy, dt_time.min))
-            fin_hoy = timezone.make_aware(datetime.combine(hoy, dt_time.max))
-            
-            pedidos_hoy = Pedido.objects.filter(
-                creado_en__range=[inicio_hoy, fin_hoy]
-            )
-            pedidos_hoy_count = pedidos_hoy.count()
-            
-            # Agrupar por estado
-            pedidos_por_estado_list = pedidos_hoy.values('estado').annotate(
-                total=Count('id')
-            )
-            pedidos_por_estado = {item['estado']: item['total'] for item in pedidos_por_estado_list}
-            
-        except Exception as e:
-            pedidos_por_estado = {'error': str(e)}
-        
-        # ========== MÓDULO 4: COCINA ==========
-        cocina_pedidos_count = 0
-        cocina_por_estado = {}
-        
-        try:
-            from cocina.models import PedidoCocina
-            
-            cocina_pedidos = PedidoCocina.objects.filter(
-                fecha_creacion__date=hoy
-            )
-            cocina_pedidos_count = cocina_pedidos.count()
-            
-            cocina_por_estado_list = cocina_pedidos.values('estado').annotate(
-                total=Count('id')
-            )
-            cocina_por_estado = {item['estado']: item['total'] for item in cocina_por_estado_list}
-            
-        except Exception as e:
-            cocina_por_estado = {'error': str(e)}
-        
-        # ========== MESAS DISPONIBLES ==========
-        mesas_totales = Mesa.objects.count()
-        mesas_disponibles = Mesa.objects.filter(estado='disponible').count()
-        
-        # ========== CONSTRUIR RESPUESTA ==========
-        ocupacion_porcentaje = 0
-        if mesas_totales > 0:
-            ocupacion_porcentaje = ((mesas_totales - mesas_disponibles) / mesas_totales) * 100
-        
-        return Response({
-            'dashboard': 'Estado del Restaurante',
-            'fecha': hoy.isoformat(),
-            'hora_actual': ahora.strftime('%H:%M'),
-            
-            'resumen': {
-                'inventario': {
-                    'ingredientes_bajo_stock': ingredientes_bajo_stock,
-                    'alerta': ingredientes_bajo_stock > 0
-                },
-                'reservas': {
-                    'total_hoy': reservas_hoy,
-                    'activas': reservas_activas,
-                    'ocupacion_mesas': f'{ocupacion_porcentaje:.1f}%'
-                },
-                'pedidos': {
-                    'hoy': pedidos_hoy_count,
-                    'por_estado': pedidos_por_estado
-                },
-                'cocina': {
-                    'pedidos_hoy': cocina_pedidos_count,
-                    'por_estado': cocina_por_estado
-                },
-                'mesas': {
-                    'totales': mesas_totales,
-                    'disponibles': mesas_disponibles,
-                    'ocupadas': mesas_totales - mesas_disponibles
-                }
-            },
-            
-            'proximas_reservas': [
-                {
-                    'id': r.id,
-                    'mesa': r.mesa.numero,
-                    'cliente': r.cliente.username,
-                    'hora': r.hora_inicio.strftime('%H:%M'),
-                    'personas': r.num_personas
-                }
-                for r in proximas_reservas
-            ] if proximas_reservas else [],
-            
-            'modulos': {
-                'modulo_1': 'Menú e Inventario',
-                'modulo_2': 'Reservas y Mesas',
-                'modulo_3': 'Sistema de Pedidos',
-                'modulo_4': 'Monitor de Cocina'
-            }
-        })
+        return Response(obtener_o_calcular(
+            'dashboard:restaurante', _datos_restaurante, settings.DASHBOARD_CACHE_TTL
+        ))
         
     except Exception as e:
         return Response({
@@ -686,26 +833,17 @@ def verificar_disponibilidad(request):
                 fecha_date = datetime.strptime(fecha, '%Y-%m-%d').date()
                 hora_time = datetime.strptime(hora, '%H:%M').time()
                 
-                # Mesas con capacidad suficiente
-                mesas_capacidad = Mesa.objects.filter(capacidad__gte=personas, estado='disponible')
-                
-                # Filtrar mesas con reservas en ese horario
-                mesas_ocupadas = Reserva.objects.filter(
-                    fecha_reserva=fecha_date,
-                    estado__in=['pendiente', 'confirmada'],
-                    hora_inicio__lt=hora_time
-                ).filter(
-                    hora_fin__gt=hora_time
-                ).values_list('mesa_id', flat=True)
-                
-                mesas_disponibles = mesas_capacidad.exclude(id__in=mesas_ocupadas)
+                # Mesas con capacidad suficiente y sin reservas que choquen
+                disponibles = mesas_libres(
+                    fecha_date, *intervalo_desde(hora_time), personas=personas
+                ).count()
                 
                 resultado['detalles']['mesas'] = {
-                    'disponibles': mesas_disponibles.count(),
-                    'suficiente': mesas_disponibles.count() > 0
+                    'disponibles': disponibles,
+                    'suficiente': disponibles > 0
                 }
                 
-                if mesas_disponibles.count() == 0:
+                if disponibles == 0:
                     resultado['disponibilidad'] = False
                     resultado['alertas'].append('No hay mesas disponibles en ese horario')
                     
@@ -714,17 +852,12 @@ def verificar_disponibilidad(request):
         
         # 2. Verificar stock para plato (Módulo 1)
         if plato_id:
-            try:
-                plato = Plato.objects.get(id=plato_id, activo=True)
-                
-                ingredientes_faltantes = []
-                for receta in plato.recetas.all():
-                    stock = Stock.objects.filter(ingrediente=receta.ingrediente).first()
-                    if stock and stock.cantidad_disponible < receta.cantidad:
-                        ingredientes_faltantes.append(receta.ingrediente.nombre)
+            receta, faltantes = StockService().verificar(plato_id)
+            if receta is not None:
+                ingredientes_faltantes = [f['ingrediente'] for f in faltantes]
                 
                 resultado['detalles']['stock'] = {
-                    'plato': plato.nombre,
+                    'plato': receta.nombre,
                     'ingredientes_faltantes': ingredientes_faltantes,
                     'suficiente': len(ingredientes_faltantes) == 0
                 }
@@ -732,8 +865,7 @@ def verificar_disponibilidad(request):
                 if len(ingredientes_faltantes) > 0:
                     resultado['disponibilidad'] = False
                     resultado['alertas'].append(f'Faltan ingredientes: {", ".join(ingredientes_faltantes)}')
-                    
-            except Plato.DoesNotExist:
+            else:
                 resultado['detalles']['stock'] = {'error': 'Plato no encontrado'}
         
         return Response(resultado)
@@ -741,4 +873,21 @@ def verificar_disponibilidad(request):
     except Exception as e:
         return Response({
             'error': f'Error verificando disponibilidad: {str(e)}'
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def exportar(request, recurso):
+    """
+    Exportación en streaming para contabilidad (ver exportaciones.py)
+    GET /api/exportar/<pedidos|cocina|reservas|reservas-stock>/?formato=csv|ndjson&desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+    """
+    try:
+        return exportaciones.respuesta(
+            recurso,
+            formato=request.query_params.get('formato', 'csv'),
+            desde=exportaciones.leer_fecha(request.query_params.get('desde'), 'desde'),
+            hasta=exportaciones.leer_fecha(request.query_params.get('hasta'), 'hasta'),
+        )
+    except ValidationError as e:
+        return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
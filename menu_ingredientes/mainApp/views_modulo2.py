@@ -23,6 +23,7 @@ from .serializers import (
     RegisterSerializer
 )
 from .permissions import IsAdministrador, IsCliente, IsAdminOrCliente
+from .disponibilidad import mesas_libres, intervalo_desde, grilla_dia, HORARIOS, DURACION_RESERVA
 
 
 # ============ ENDPOINTS DE AUTENTICACIÓN ============
@@ -170,22 +171,40 @@ class MesaViewSet(viewsets.ModelViewSet):
                 fecha = date.fromisoformat(fecha_str)
                 hora = time.fromisoformat(hora_str)
                 
-                # Excluir mesas con reservas activas en ese horario
-                reservas_activas = Reserva.objects.filter(
-                    fecha_reserva=fecha,
-                    estado__in=['pendiente', 'confirmada'],
-                    hora_inicio__lte=hora,
-                    hora_fin__gte=hora
-                )
-                
-                mesas_reservadas = reservas_activas.values_list('mesa_id', flat=True)
-                mesas = mesas.exclude(id__in=mesas_reservadas)
+                # Excluir mesas con reservas que choquen con una reserva desde esa hora
+                mesas = mesas_libres(fecha, *intervalo_desde(hora), mesas=mesas)
             except (ValueError, TypeError):
                 pass
 
         serializer = self.get_serializer(mesas, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def grilla(self, request):
+        """
+        Disponibilidad de todas las mesas en todos los turnos del día
+        GET /api/mesas/grilla/?fecha=2025-12-25&personas=4
+        Cada mesa trae `libre`: un carácter por turno de `horarios`,
+        '1' si una reserva de 2 horas desde ese turno entra libre.
+        """
+        try:
+            fecha = date.fromisoformat(request.query_params.get('fecha', ''))
+            personas = int(request.query_params.get('personas') or 0)
+        except (ValueError, TypeError):
+            return Response({
+                'error': 'Debe indicar una fecha válida (AAAA-MM-DD) y personas numérico'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'fecha': fecha.isoformat(),
+            'horarios': [hora.strftime('%H:%M') for hora in HORARIOS],
+            'duracion_minutos': int(DURACION_RESERVA.total_seconds() // 60),
+            'mesas': [
+                {'id': mesa.id, 'numero': mesa.numero, 'capacidad': mesa.capacidad, 'libre': bits}
+                for mesa, bits in grilla_dia(fecha, personas=personas)
+            ],
+        })
+
 
 # ============ VIEWSET DE RESERVAS ============
 
@@ -327,15 +346,7 @@ class ConsultaMesasView(views.APIView):
                 fecha = date.fromisoformat(fecha_str)
                 hora = time.fromisoformat(hora_str)
                 
-                reservas_activas = Reserva.objects.filter(
-                    fecha_reserva=fecha,
-                    estado__in=['pendiente', 'confirmada'],
-                    hora_inicio__lte=hora,
-                    hora_fin__gte=hora
-                )
-                
-                mesas_reservadas = reservas_activas.values_list('mesa_id', flat=True)
-                mesas = mesas.exclude(id__in=mesas_reservadas)
+                mesas = mesas_libres(fecha, *intervalo_desde(hora), mesas=mesas)
             except (ValueError, TypeError):
                 return Response({
                     'error': 'Formato de fecha u hora inválido'
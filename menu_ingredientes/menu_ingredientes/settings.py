@@ -164,3 +164,42 @@ REST_FRAMEWORK = {
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/menu/'
+
+# Segundos antes de reconstruir la matriz de recetas en memoria (mainApp/cache_recetas.py)
+RECETAS_CACHE_TTL = int(os.environ.get('RECETAS_CACHE_TTL', 300))
+
+# Caché: Redis si hay REDIS_URL (compartido entre workers), si no memoria local por proceso
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Redis pub/sub para repartir los eventos SSE entre workers (cocina/eventos.py)
+EVENTOS_REDIS_URL = os.environ.get('EVENTOS_REDIS_URL', os.environ.get('REDIS_URL', ''))
+
+# Segundos de validez de la versión del menú público (mainApp/cache_menu.py)
+MENU_CACHE_TTL = int(os.environ.get('MENU_CACHE_TTL', 300))
+
+# Segundos que se reutiliza el resultado de los dashboards (mainApp/cache_utils.py)
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 5))
+
+# Alertas de stock bajo (mainApp/alertas_stock.py): segundos en que se calla un
+# cruce repetido del mismo ingrediente y webhook opcional que recibe cada alerta
+ALERTA_STOCK_DEBOUNCE = int(os.environ.get('ALERTA_STOCK_DEBOUNCE', 300))
+ALERTA_STOCK_WEBHOOK_URL = os.environ.get('ALERTA_STOCK_WEBHOOK_URL', '')
+
+# Segundos tras los cuales una reserva de stock sin confirmar se considera
+# abandonada y la libera `python manage.py liberar_reservas_vencidas`
+RESERVA_STOCK_TTL = int(os.environ.get('RESERVA_STOCK_TTL', 6 * 3600))
+
+# Segundos que se conserva la respuesta de un POST con Idempotency-Key (mainApp/idempotencia.py)
+IDEMPOTENCIA_TTL = int(os.environ.get('IDEMPOTENCIA_TTL', 24 * 3600))
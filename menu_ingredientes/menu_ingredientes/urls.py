@@ -22,6 +22,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     
     # ========== APIS REST ==========
+    path('api/pedidos/', include('pedidos.urls')),  # Módulo 3 - Pedidos
     path('api/', include('mainApp.urls_api')),  # Todas las APIs del sistema
     
     # ========== DOCUMENTACIÓN ==========
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Pedido
+from .models import Pedido, TransicionPedido
 
 
 @admin.register(Pedido)
@@ -8,3 +8,20 @@ class PedidoAdmin(admin.ModelAdmin):
     list_filter = ("estado", "creado_en")
     search_fields = ("mesa", "cliente", "id")
     ordering = ("-creado_en",)
+
+
+@admin.register(TransicionPedido)
+class TransicionPedidoAdmin(admin.ModelAdmin):
+    list_display = ("modelo", "objeto_id", "desde", "hacia", "creado_en")
+    list_filter = ("modelo", "hacia", "creado_en")
+    search_fields = ("objeto_id",)
+
+    # Registro append-only: solo lo escriben las señales
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pedidos.models import OutboxPedido
+from pedidos.outbox import despachar, MAX_INTENTOS
+
+
+class Command(BaseCommand):
+    help = "Aplica los mensajes pendientes del outbox entre pedidos y cocina"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=int, default=100, help="Mensajes por lote")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            procesados = despachar(limite=options["limite"])
+            if not procesados:
+                break
+            total += procesados
+        pendientes = OutboxPedido.objects.filter(procesado_en__isnull=True)
+        self.stdout.write(f"Mensajes procesados: {total}")
+        agotados = pendientes.filter(intentos__gte=MAX_INTENTOS).count()
+        if pendientes.exists():
+            self.stdout.write(self.style.WARNING(
+                f"Pendientes: {pendientes.count()} ({agotados} superaron {MAX_INTENTOS} intentos)"
+            ))
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pedidos.models import CambioPedido
+
+
+class Command(BaseCommand):
+    help = "Elimina el registro de cambios (sincronización ?since=) más antiguo que N días"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=2)
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options["dias"])
+        ultimo = CambioPedido.objects.order_by("-seq").values_list("seq", flat=True).first()
+        # Se conserva siempre el último cambio: así un cursor viejo se detecta y recibe el listado completo
+        borrados, _ = CambioPedido.objects.filter(creado_en__lt=limite).exclude(seq=ultimo).delete()
+        self.stdout.write(f"Cambios eliminados: {borrados}")
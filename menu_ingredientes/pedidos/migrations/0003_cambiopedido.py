@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-16 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0002_alter_pedido_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioPedido',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('modelo', models.CharField(choices=[('pedido', 'Pedido'), ('cocina', 'Pedido cocina')], max_length=10)),
+                ('objeto_id', models.CharField(max_length=64)),
+                ('accion', models.CharField(choices=[('upsert', 'Creado/actualizado'), ('delete', 'Eliminado')], default='upsert', max_length=10)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['seq'],
+                'indexes': [models.Index(fields=['modelo', 'seq'], name='pedidos_cam_modelo_75db5e_idx')],
+            },
+        ),
+    ]
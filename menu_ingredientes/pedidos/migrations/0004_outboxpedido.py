@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0003_cambiopedido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('destino', models.CharField(choices=[('pedido', 'Pedido'), ('cocina', 'Pedido cocina')], max_length=10)),
+                ('pedido_id', models.CharField(max_length=64)),
+                ('accion', models.CharField(choices=[('crear', 'Crear'), ('estado', 'Cambiar estado')], max_length=10)),
+                ('datos', models.JSONField(default=dict)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('procesado_en', models.DateTimeField(blank=True, null=True)),
+                ('intentos', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['procesado_en', 'id'], name='pedidos_out_procesa_e71e2e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0004_outboxpedido'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['mesa', 'estado'], name='pedido_mesa_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', '-creado_en'], name='pedido_estado_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['creado_en'], name='pedido_creado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('estado__in', ['CERRADO', 'CANCELADO']), _negated=True), fields=['creado_en'], name='pedido_activo_creado_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0005_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(condition=models.Q(('estado__in', ['CERRADO', 'CANCELADO'])), fields=['-creado_en', '-id'], name='pedido_final_creado_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0006_pedido_historial_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransicionPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('pedido', 'Pedido'), ('cocina', 'Pedido cocina')], max_length=10)),
+                ('objeto_id', models.CharField(max_length=64)),
+                ('desde', models.CharField(blank=True, default='', max_length=20)),
+                ('hacia', models.CharField(max_length=20)),
+                ('creado_en', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['modelo', 'objeto_id', 'id'], name='transicion_objeto_idx'), models.Index(fields=['modelo', 'creado_en'], name='transicion_fecha_idx')],
+            },
+        ),
+    ]
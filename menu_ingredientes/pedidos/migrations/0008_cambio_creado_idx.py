@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pedidos', '0007_transicion_pedido'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cambiopedido',
+            index=models.Index(fields=['creado_en'], name='cambio_creado_idx'),
+        ),
+    ]
@@ -1,9 +1,25 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 
+# Un pedido en estos estados ya no ocupa la mesa ni aparece en cocina
+ESTADOS_FINALES = ["CERRADO", "CANCELADO"]
+
+
+class ConflictoEstado(ValidationError):
+    """Otra operación cambió el estado del pedido desde que se leyó"""
+
+
+class PedidoQuerySet(models.QuerySet):
+    def activos(self):
+        return self.exclude(estado__in=ESTADOS_FINALES)
+
+    def finalizados(self):
+        return self.filter(estado__in=ESTADOS_FINALES)
+
+
 class Pedido(models.Model):
     class Estado(models.TextChoices):
         CREADO = "CREADO", "Creado"
@@ -26,159 +42,195 @@ class Pedido(models.Model):
     actualizado_en = models.DateTimeField(auto_now=True)
     entregado_en = models.DateTimeField(null=True, blank=True)
 
+    objects = PedidoQuerySet.as_manager()
+
     def puede_modificarse(self):
         return self.estado == Pedido.Estado.CREADO
 
     def clean(self):
         if self.mesa:
-            activos = Pedido.objects.exclude(estado__in=[self.Estado.CERRADO, self.Estado.CANCELADO])
+            activos = Pedido.objects.activos()
             if self.pk:
                 activos = activos.exclude(pk=self.pk)
             if activos.filter(mesa=self.mesa).exists():
                 raise ValidationError("La mesa ya tiene un pedido activo.")
 
     def save(self, *args, **kwargs):
-        if self.pk:
-            prev = Pedido.objects.filter(pk=self.pk).values_list("estado", flat=True).first()
-        else:
-            prev = None
-
-        super_set_entregado = False
+        # El estado anterior lo conservan las señales (_estado_previo) sin
+        # volver a leer la fila; cada cambio queda en TransicionPedido
         if self.estado == self.Estado.ENTREGADO and self.entregado_en is None:
             self.entregado_en = timezone.now()
-            super_set_entregado = True
 
-        super().save(*args, **kwargs)
+        # Atómico junto con las señales: el registro de cambios y el outbox
+        # hacia cocina se confirman o se revierten con el pedido
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def _transicionar(self, permitidos, hacia, mensaje):
+        """
+        Cambia el estado con un UPDATE ... WHERE id=? AND estado=<leído>
+        (compare-and-set). Si otra operación ya lo cambió no se actualiza
+        ninguna fila y se lanza ConflictoEstado. No se repite full_clean: un
+        cambio de estado no toca la mesa que valida clean().
+        """
+        if self.estado not in permitidos:
+            raise ValidationError(mensaje)
+        desde = self.estado
+        if not self.cambiar_estado(hacia):
+            raise ConflictoEstado(f"El pedido ya no está {desde}: otra operación cambió su estado.")
+
+    def cambiar_estado(self, hacia):
+        """
+        Compare-and-set de `estado` contra el valor de esta instancia, con sus
+        efectos (receptores de transiciones.estado_cambiado). Retorna False,
+        sin tocar nada, si la fila ya no está en ese estado.
+        """
+        desde = self.estado
+        campos = {"estado": hacia, "actualizado_en": timezone.now()}
+        if hacia == self.Estado.ENTREGADO and self.entregado_en is None:
+            campos["entregado_en"] = campos["actualizado_en"]
+
+        using = self._state.db or "default"
+        with transaction.atomic(using=using):
+            if not Pedido.objects.using(using).filter(pk=self.pk, estado=desde).update(**campos):
+                return False
+            for campo, valor in campos.items():
+                setattr(self, campo, valor)
+            # Mismo estado que deja preparar_cambio_estado (signals.py) tras un save()
+            self._estado_previo, self._estado_original = desde, hacia
+            # update() no envía post_save: los efectos del cambio se disparan con
+            # estado_cambiado, igual que desde un save()
+            from .transiciones import aplicar_efectos  # Importar aquí para evitar circular imports
+            aplicar_efectos(self, desde, hacia)
+        return True
 
     def confirmar(self):
-        if self.estado != self.Estado.CREADO:
-            raise ValidationError("Solo se puede confirmar un pedido en estado CREADO.")
-        self.estado = self.Estado.EN_PREPARACION
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        self._transicionar([self.Estado.CREADO], self.Estado.EN_PREPARACION,
+                           "Solo se puede confirmar un pedido en estado CREADO.")
 
     def marcar_listo(self):
-        if self.estado not in [self.Estado.EN_PREPARACION]:
-            raise ValidationError("Solo se puede marcar LISTO desde EN_PREPARACION.")
-        self.estado = self.Estado.LISTO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        self._transicionar([self.Estado.EN_PREPARACION], self.Estado.LISTO,
+                           "Solo se puede marcar LISTO desde EN_PREPARACION.")
 
     def entregar(self):
-        if self.estado != self.Estado.LISTO:
-            raise ValidationError("Solo se puede ENTREGAR un pedido LISTO.")
-        self.estado = self.Estado.ENTREGADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en", "entregado_en"])
+        self._transicionar([self.Estado.LISTO], self.Estado.ENTREGADO,
+                           "Solo se puede ENTREGAR un pedido LISTO.")
 
     def cerrar(self):
-        if self.estado != self.Estado.ENTREGADO:
-            raise ValidationError("Solo se puede CERRAR un pedido ENTREGADO.")
-        self.estado = self.Estado.CERRADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        self._transicionar([self.Estado.ENTREGADO], self.Estado.CERRADO,
+                           "Solo se puede CERRAR un pedido ENTREGADO.")
 
     def cancelar(self):
-        if self.estado in [self.Estado.CERRADO, self.Estado.CANCELADO]:
-            raise ValidationError("El pedido ya está finalizado.")
-        self.estado = self.Estado.CANCELADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+        activos = [e for e in self.Estado.values if e not in ESTADOS_FINALES]
+        self._transicionar(activos, self.Estado.CANCELADO, "El pedido ya está finalizado.")
 
     class Meta:
         ordering = ["-creado_en"]
+        indexes = [
+            # Pedido activo de una mesa (clean, alta desde el mesero)
+            models.Index(fields=["mesa", "estado"], name="pedido_mesa_estado_idx"),
+            # Activos y finalizados en la vista del mesero
+            models.Index(fields=["estado", "-creado_en"], name="pedido_estado_creado_idx"),
+            # Pedidos del día en los dashboards
+            models.Index(fields=["creado_en"], name="pedido_creado_idx"),
+            # Tablero de cocina: solo los activos. Es parcial, así que solo lo
+            # aprovecha PostgreSQL (SQLite no lo usa con parámetros)
+            models.Index(fields=["creado_en"], condition=~models.Q(estado__in=ESTADOS_FINALES),
+                         name="pedido_activo_creado_idx"),
+            # Historial del mesero: finalizados paginados por (creado_en, id)
+            # (parcial, igual que el anterior: lo aprovecha PostgreSQL)
+            models.Index(fields=["-creado_en", "-id"], condition=models.Q(estado__in=ESTADOS_FINALES),
+                         name="pedido_final_creado_idx"),
+        ]
 
     def __str__(self):
         return f"Pedido {self.id} (mesa={self.mesa or '-'}, estado={self.estado})"
-import uuid
-from django.db import models
-from django.core.exceptions import ValidationError
-from django.utils import timezone
 
 
-class Pedido(models.Model):
-    class Estado(models.TextChoices):
-        CREADO = "CREADO", "Creado"
-        EN_PREPARACION = "EN_PREPARACION", "En preparación"
-        LISTO = "LISTO", "Listo"
-        ENTREGADO = "ENTREGADO", "Entregado"
-        CERRADO = "CERRADO", "Cerrado"
-        CANCELADO = "CANCELADO", "Cancelado"
-
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+class CambioPedido(models.Model):
+    """
+    Registro de cambios de Pedido y PedidoCocina para la sincronización
+    incremental (?since=<cursor>). `seq` es monotónico y sirve de cursor.
+    """
+    class Modelo(models.TextChoices):
+        PEDIDO = "pedido", "Pedido"
+        COCINA = "cocina", "Pedido cocina"
 
-    mesa = models.CharField(max_length=20, null=True, blank=True)
-    cliente = models.CharField(max_length=100, null=True, blank=True)
-    plato = models.CharField(max_length=60, blank=True, default="")
+    class Accion(models.TextChoices):
+        UPSERT = "upsert", "Creado/actualizado"
+        DELETE = "delete", "Eliminado"
 
-    estado = models.CharField(
-        max_length=20, choices=Estado.choices, default=Estado.CREADO
-    )
+    seq = models.BigAutoField(primary_key=True)
+    modelo = models.CharField(max_length=10, choices=Modelo.choices)
+    objeto_id = models.CharField(max_length=64)
+    accion = models.CharField(max_length=10, choices=Accion.choices, default=Accion.UPSERT)
     creado_en = models.DateTimeField(auto_now_add=True)
-    actualizado_en = models.DateTimeField(auto_now=True)
-    entregado_en = models.DateTimeField(null=True, blank=True)
 
-    def puede_modificarse(self):
-        return self.estado == Pedido.Estado.CREADO
-
-    def clean(self):
-        if self.mesa:
-            activos = Pedido.objects.exclude(estado__in=[self.Estado.CERRADO, self.Estado.CANCELADO])
-            if self.pk:
-                activos = activos.exclude(pk=self.pk)
-            if activos.filter(mesa=self.mesa).exists():
-                raise ValidationError("La mesa ya tiene un pedido activo.")
-
-    def save(self, *args, **kwargs):
-        if self.pk:
-            prev = Pedido.objects.filter(pk=self.pk).values_list("estado", flat=True).first()
-        else:
-            prev = None
-
-        super_set_entregado = False
-        if self.estado == self.Estado.ENTREGADO and self.entregado_en is None:
-            self.entregado_en = timezone.now()
-            super_set_entregado = True
-
-        super().save(*args, **kwargs)
-
-    def confirmar(self):
-        if self.estado != self.Estado.CREADO:
-            raise ValidationError("Solo se puede confirmar un pedido en estado CREADO.")
-        self.estado = self.Estado.EN_PREPARACION
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
-
-    def marcar_listo(self):
-        if self.estado not in [self.Estado.EN_PREPARACION]:
-            raise ValidationError("Solo se puede marcar LISTO desde EN_PREPARACION.")
-        self.estado = self.Estado.LISTO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+    class Meta:
+        ordering = ["seq"]
+        indexes = [
+            models.Index(fields=["modelo", "seq"]),
+            # Ventana de relectura del cursor (sincronizacion.py) y purgar_cambios
+            models.Index(fields=["creado_en"], name="cambio_creado_idx"),
+        ]
 
-    def entregar(self):
-        if self.estado != self.Estado.LISTO:
-            raise ValidationError("Solo se puede ENTREGAR un pedido LISTO.")
-        self.estado = self.Estado.ENTREGADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en", "entregado_en"])
+    def __str__(self):
+        return f"#{self.seq} {self.modelo} {self.objeto_id} {self.accion}"
+
+
+class TransicionPedido(models.Model):
+    """
+    Registro append-only de cambios de estado de Pedido y PedidoCocina: una
+    fila por (pedido, desde, hacia, momento). `desde` vacío es el alta. Para
+    PedidoCocina `objeto_id` es la referencia del pedido del Módulo 3 cuando
+    existe, así las dos líneas de tiempo de un pedido se cruzan por el mismo
+    id. Ver pedidos/transiciones.py.
+    """
+    modelo = models.CharField(max_length=10, choices=CambioPedido.Modelo.choices)
+    objeto_id = models.CharField(max_length=64)
+    desde = models.CharField(max_length=20, blank=True, default="")
+    hacia = models.CharField(max_length=20)
+    creado_en = models.DateTimeField(default=timezone.now)
 
-    def cerrar(self):
-        if self.estado != self.Estado.ENTREGADO:
-            raise ValidationError("Solo se puede CERRAR un pedido ENTREGADO.")
-        self.estado = self.Estado.CERRADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            # Línea de tiempo de un pedido
+            models.Index(fields=["modelo", "objeto_id", "id"], name="transicion_objeto_idx"),
+            # Tiempos por etapa en un rango de fechas
+            models.Index(fields=["modelo", "creado_en"], name="transicion_fecha_idx"),
+        ]
 
-    def cancelar(self):
-        if self.estado in [self.Estado.CERRADO, self.Estado.CANCELADO]:
-            raise ValidationError("El pedido ya está finalizado.")
-        self.estado = self.Estado.CANCELADO
-        self.full_clean()
-        self.save(update_fields=["estado", "actualizado_en"])
+    def __str__(self):
+        return f"{self.modelo} {self.objeto_id}: {self.desde or '-'} -> {self.hacia}"
+
+
+class OutboxPedido(models.Model):
+    """
+    Cambios pendientes de reflejar entre Pedido (Módulo 3) y PedidoCocina
+    (Módulo 4). Se escriben en la misma transacción que el cambio de estado y
+    los aplica pedidos/outbox.py.
+    """
+    class Destino(models.TextChoices):
+        PEDIDO = "pedido", "Pedido"
+        COCINA = "cocina", "Pedido cocina"
+
+    class Accion(models.TextChoices):
+        CREAR = "crear", "Crear"
+        ESTADO = "estado", "Cambiar estado"
+
+    destino = models.CharField(max_length=10, choices=Destino.choices)
+    pedido_id = models.CharField(max_length=64)  # UUID del pedido del Módulo 3
+    accion = models.CharField(max_length=10, choices=Accion.choices)
+    datos = models.JSONField(default=dict)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    procesado_en = models.DateTimeField(null=True, blank=True)
+    intentos = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
 
     class Meta:
-        ordering = ["-creado_en"]
+        ordering = ["id"]
+        indexes = [models.Index(fields=["procesado_en", "id"])]
 
     def __str__(self):
-        return f"Pedido {self.id} (mesa={self.mesa or '-'}, estado={self.estado})"
+        return f"{self.destino} {self.accion} {self.pedido_id}"
@@ -0,0 +1,184 @@
+"""
+Outbox transaccional entre Pedido (Módulo 3) y PedidoCocina (Módulo 4).
+
+Los cambios de estado de un lado no tocan directamente el otro: las señales
+(y las altas de pedido) agregan una fila a OutboxPedido dentro de la misma
+transacción, y `despachar()` las aplica por lotes al confirmar. Si el
+despacho falla la fila queda pendiente con su error y se reintenta con
+`python manage.py despachar_outbox`, así que ambos tableros siempre
+convergen.
+
+Las reglas son idempotentes y solo avanzan: un pedido nunca retrocede de
+estado por un mensaje repetido o fuera de orden.
+"""
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Pedido, OutboxPedido
+
+
+logger = logging.getLogger(__name__)
+
+# Un mensaje que falla esta cantidad de veces queda para revisión manual
+MAX_INTENTOS = 5
+
+# Orden de avance compartido por ambos módulos
+ORDEN_ESTADOS = {
+    "CREADO": 0,
+    "URGENTE": 0,
+    "EN_PREPARACION": 1,
+    "LISTO": 2,
+    "ENTREGADO": 3,
+    "CERRADO": 4,
+}
+
+# Estados de PedidoCocina que se reflejan en el Pedido
+ESTADOS_HACIA_PEDIDO = {"EN_PREPARACION", "LISTO", "ENTREGADO"}
+
+# Estados de Pedido que se reflejan en cocina (CANCELADO la quita del monitor)
+ESTADOS_HACIA_COCINA = {"EN_PREPARACION", "LISTO", "ENTREGADO", "CANCELADO"}
+
+
+def encolar(destino, pedido_id, accion, datos):
+    """Agrega un mensaje al outbox; se despacha al confirmar la transacción en curso"""
+    mensaje = OutboxPedido.objects.create(
+        destino=destino, pedido_id=str(pedido_id), accion=accion, datos=datos
+    )
+    if not _despacho_pendiente(transaction.get_connection()):
+        # robust: si el despacho falla el request ya se confirmó; los
+        # mensajes quedan pendientes para despachar_outbox
+        transaction.on_commit(despachar, robust=True)
+    return mensaje
+
+
+def _despacho_pendiente(conexion):
+    """
+    Hay un despacho registrado que corre si se confirma el mensaje recién
+    creado: uno solo por transacción, por muchos mensajes que se encolen.
+    Sirve uno registrado en este bloque atómico o en uno que lo contiene; el
+    de un bloque ya cerrado se descarta sin este mensaje si se revierte su
+    savepoint, así que se registra otro.
+    """
+    actuales = set(conexion.savepoint_ids)
+    return any(
+        callback is despachar and savepoints <= actuales
+        for savepoints, callback, _ in conexion.run_on_commit
+    )
+
+
+def encolar_alta_cocina(pedido, descripcion, mesa=None):
+    """Alta del pedido en el monitor de cocina"""
+    if mesa is None:
+        mesa = int(pedido.mesa) if str(pedido.mesa or "").isdigit() else 1
+    return encolar(
+        OutboxPedido.Destino.COCINA, pedido.pk, OutboxPedido.Accion.CREAR,
+        {"mesa": mesa, "cliente": pedido.cliente or "", "descripcion": descripcion},
+    )
+
+
+def encolar_estado(destino, pedido_id, estado):
+    return encolar(destino, pedido_id, OutboxPedido.Accion.ESTADO, {"estado": estado})
+
+
+def _avanza(actual, nuevo):
+    return ORDEN_ESTADOS.get(nuevo, -1) > ORDEN_ESTADOS.get(actual, -1)
+
+
+def _aplicar_en_cocina(mensaje, en_cocina):
+    from cocina.models import PedidoCocina  # Importar aquí para evitar circular imports
+
+    actual = en_cocina.get(mensaje.pedido_id)
+
+    if mensaje.accion == OutboxPedido.Accion.CREAR:
+        if actual is None:
+            actual = PedidoCocina(id_modulo3=mensaje.pedido_id, **mensaje.datos)
+            actual._sincronizando = True
+            actual.save()
+            en_cocina[mensaje.pedido_id] = actual
+        return
+
+    estado = mensaje.datos["estado"]
+    if actual is None:
+        return
+    if estado == "CANCELADO":
+        actual.delete()
+        en_cocina.pop(mensaje.pedido_id)
+    elif _avanza(actual.estado, estado):
+        actual.estado = estado
+        if estado == "LISTO" and actual.hora_listo is None:
+            actual.hora_listo = timezone.now()
+        actual._sincronizando = True
+        actual.save()
+
+
+def _aplicar_en_pedido(mensaje, pedidos):
+    pedido = pedidos.get(mensaje.pedido_id)
+    estado = mensaje.datos["estado"]
+    # Compare-and-set contra el estado leído en el lote: si otra operación lo
+    # cambió entretanto (p. ej. cancelar) se relee y se decide de nuevo
+    while pedido is not None and pedido.estado != Pedido.Estado.CANCELADO \
+            and _avanza(pedido.estado, estado):
+        pedido._sincronizando = True
+        if pedido.cambiar_estado(estado):
+            return
+        pedido = Pedido.objects.filter(pk=pedido.pk).first()
+        pedidos[mensaje.pedido_id] = pedido
+
+
+def despachar(limite=100):
+    """
+    Aplica hasta `limite` mensajes pendientes. Los destinos de todo el lote se
+    cargan con una query por tabla; en cocina cada mensaje se aplica con save()
+    para que sigan corriendo las señales (eventos SSE y registro de cambios) y
+    en Pedido con Pedido.cambiar_estado, que no pisa un estado que cambió
+    después de la carga.
+    Retorna la cantidad de mensajes procesados.
+    """
+    from cocina.models import PedidoCocina  # Importar aquí para evitar circular imports
+
+    with transaction.atomic():
+        mensajes = list(
+            OutboxPedido.objects.select_for_update(skip_locked=True)
+            .filter(procesado_en__isnull=True, intentos__lt=MAX_INTENTOS)
+            .order_by("id")[:limite]
+        )
+        if not mensajes:
+            return 0
+
+        ids_cocina = {m.pedido_id for m in mensajes if m.destino == OutboxPedido.Destino.COCINA}
+        ids_pedido = {m.pedido_id for m in mensajes if m.destino == OutboxPedido.Destino.PEDIDO}
+        en_cocina = {
+            p.id_modulo3: p for p in PedidoCocina.objects.filter(id_modulo3__in=ids_cocina)
+        } if ids_cocina else {}
+        pedidos = {
+            str(pk): p for pk, p in Pedido.objects.in_bulk(list(ids_pedido)).items()
+        } if ids_pedido else {}
+
+        procesados, fallidos = [], []
+        bloqueados = set()  # pedidos con un mensaje fallido: el resto espera para no desordenarse
+        for mensaje in mensajes:
+            clave = (mensaje.destino, mensaje.pedido_id)
+            if clave in bloqueados:
+                continue
+            try:
+                with transaction.atomic():
+                    if mensaje.destino == OutboxPedido.Destino.COCINA:
+                        _aplicar_en_cocina(mensaje, en_cocina)
+                    else:
+                        _aplicar_en_pedido(mensaje, pedidos)
+                procesados.append(mensaje.id)
+            except Exception as e:
+                logger.exception("No se pudo aplicar el mensaje %s del outbox", mensaje.id)
+                mensaje.intentos += 1
+                mensaje.error = str(e)
+                fallidos.append(mensaje)
+                bloqueados.add(clave)
+
+        if procesados:
+            OutboxPedido.objects.filter(id__in=procesados).update(procesado_en=timezone.now())
+        if fallidos:
+            OutboxPedido.objects.bulk_update(fallidos, ["intentos", "error"])
+
+    return len(procesados)
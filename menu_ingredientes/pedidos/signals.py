@@ -0,0 +1,73 @@
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Pedido, CambioPedido, OutboxPedido
+from .sincronizacion import registrar_cambio
+from . import transiciones
+from .outbox import encolar_estado, ESTADOS_HACIA_COCINA
+
+
+# ==================== ESTADO ANTERIOR ====================
+
+@receiver(post_init, sender=Pedido)
+def recordar_estado(sender, instance, **kwargs):
+    # __dict__ para no disparar una query si el campo viene diferido
+    instance._estado_original = instance.__dict__.get('estado')
+
+
+@receiver(pre_save, sender=Pedido)
+def preparar_cambio_estado(sender, instance, **kwargs):
+    # Los receptores de post_save leen el estado previo desde _estado_previo
+    instance._estado_previo = instance._estado_original
+    instance._estado_original = instance.estado
+
+
+# ==================== CAMBIOS DE ESTADO ====================
+
+@receiver(post_save, sender=Pedido)
+def anunciar_cambio_estado(sender, instance, created, **kwargs):
+    # Los efectos del cambio son receptores de estado_cambiado, la misma señal
+    # que envía Pedido.cambiar_estado
+    if not created and instance.estado != instance._estado_previo:
+        transiciones.aplicar_efectos(instance, instance._estado_previo, instance.estado)
+
+
+# ==================== REGISTRO DE CAMBIOS (?since=) ====================
+
+@receiver(post_save, sender=Pedido)
+def pedido_guardado(sender, instance, created, **kwargs):
+    # Los cambios de estado los registra cambio_registrado
+    if created or instance.estado == instance._estado_previo:
+        registrar_cambio(CambioPedido.Modelo.PEDIDO, instance.pk)
+
+
+@receiver(transiciones.estado_cambiado, sender=Pedido)
+def cambio_registrado(sender, instance, **kwargs):
+    registrar_cambio(CambioPedido.Modelo.PEDIDO, instance.pk)
+
+
+@receiver(post_delete, sender=Pedido)
+def pedido_eliminado(sender, instance, **kwargs):
+    registrar_cambio(CambioPedido.Modelo.PEDIDO, instance.pk, CambioPedido.Accion.DELETE)
+
+
+# ==================== TRANSICIONES DE ESTADO ====================
+
+@receiver(post_save, sender=Pedido)
+def registrar_alta(sender, instance, created, **kwargs):
+    if created:
+        transiciones.registrar(CambioPedido.Modelo.PEDIDO, instance.pk, None, instance.estado)
+
+
+@receiver(transiciones.estado_cambiado, sender=Pedido)
+def registrar_transicion(sender, instance, desde, hacia, **kwargs):
+    transiciones.registrar(CambioPedido.Modelo.PEDIDO, instance.pk, desde, hacia)
+
+
+# ==================== OUTBOX HACIA COCINA ====================
+
+@receiver(transiciones.estado_cambiado, sender=Pedido)
+def reflejar_estado_en_cocina(sender, instance, hacia, **kwargs):
+    # Cambios que vienen del propio outbox no se devuelven a cocina
+    if hacia in ESTADOS_HACIA_COCINA and not getattr(instance, '_sincronizando', False):
+        encolar_estado(OutboxPedido.Destino.COCINA, instance.pk, hacia)
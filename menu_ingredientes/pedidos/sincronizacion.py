@@ -0,0 +1,127 @@
+"""
+Sincronización incremental para clientes de cocina y meseros (?since=<cursor>).
+
+Cada vez que un Pedido o PedidoCocina se guarda o elimina, las señales
+agregan una fila a CambioPedido dentro de la misma transacción. El cursor es
+el `seq` de esa tabla: un listado completo devuelve el cursor vigente en el
+header X-Sync-Cursor, y con ?since=<cursor> solo se devuelven las filas que
+cambiaron desde entonces más los ids eliminados (tombstones). Una fila que
+dejó de cumplir el filtro del listado (por ejemplo un pedido CANCELADO en la
+lista de cocina) también se informa como eliminada.
+
+`seq` se asigna al insertar, no al confirmar: una transacción lenta puede
+tomar el seq N y confirmar después de otra que tomó N+1. Un cursor N+1
+entregado entre ambas saltaría N para siempre, así que el cursor se detiene
+antes del primer hueco de seq reciente (ver cursor_actual). Un hueco con más
+de VENTANA_CURSOR segundos es una transacción revertida y deja de frenarlo.
+
+Los clientes deben aplicar los cambios de forma idempotente: mientras el
+cursor está frenado, las filas posteriores al hueco se repiten entre
+respuestas consecutivas.
+"""
+from datetime import timedelta
+
+from django.db.models import BigIntegerField, ExpressionWrapper, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import CambioPedido
+
+
+HEADER_CURSOR = "X-Sync-Cursor"
+
+# Segundos que una transacción puede tardar entre registrar su cambio (tomar
+# su seq) y confirmar
+VENTANA_CURSOR = 60
+
+
+def registrar_cambio(modelo, objeto_id, accion=CambioPedido.Accion.UPSERT):
+    CambioPedido.objects.create(modelo=modelo, objeto_id=str(objeto_id), accion=accion)
+
+
+def cursor_actual():
+    """
+    Último seq tal que no falta ningún seq anterior que pueda confirmarse
+    todavía: se recorren, en una query, los cambios de los últimos
+    VENTANA_CURSOR segundos (más el anterior a ellos) y el cursor queda antes
+    del primer hueco.
+    """
+    limite = timezone.now() - timedelta(seconds=VENTANA_CURSOR)
+    primero_reciente = CambioPedido.objects.filter(creado_en__gte=limite).order_by("seq").values("seq")[:1]
+    ultimo = CambioPedido.objects.order_by("-seq").values("seq")[:1]
+    # Sin cambios recientes solo se lee el último
+    desde = Coalesce(
+        ExpressionWrapper(Subquery(primero_reciente) - 1, output_field=BigIntegerField()),
+        Subquery(ultimo),
+    )
+    filas = list(
+        CambioPedido.objects.filter(seq__gte=desde).order_by("seq").values_list("seq", "creado_en")
+    )
+    if not filas:
+        return 0
+
+    seq, creado_en = filas[0]
+    # Si falta el seq anterior al primer reciente, ese hueco también puede
+    # ser una transacción en curso
+    previo = seq - 1 if creado_en >= limite else seq
+    for seq, _ in filas:
+        if seq > previo + 1:
+            break
+        previo = seq
+    return previo
+
+
+def leer_since(request):
+    """Cursor recibido en ?since= o None si el cliente pide el listado completo"""
+    since = request.query_params.get("since")
+    if since in (None, ""):
+        return None
+    try:
+        since = int(since)
+    except (TypeError, ValueError):
+        raise ValidationError({"since": "Debe ser un número entero."})
+    if since < 0:
+        raise ValidationError({"since": "Debe ser mayor o igual a 0."})
+    return since
+
+
+def con_cursor(response, cursor):
+    response[HEADER_CURSOR] = str(cursor)
+    return response
+
+
+def respuesta_delta(queryset, modelo, since, serializer_class, context=None):
+    """
+    Filas de `queryset` cambiadas desde `since` y tombstones de las que ya no
+    están. Si el cursor es más viejo que el registro retenido (ver el comando
+    purgar_cambios) se responde `completo: true` con todas las filas.
+    """
+    # Un cursor nunca retrocede: el del cliente ya se entregó con este mismo criterio
+    cursor = max(cursor_actual(), since)
+    primero = CambioPedido.objects.order_by("seq").values_list("seq", flat=True).first()
+
+    if primero is not None and since < primero - 1:
+        filas = list(queryset)
+        return con_cursor(Response({
+            "cursor": cursor,
+            "completo": True,
+            "cambios": serializer_class(filas, many=True, context=context).data,
+            "eliminados": [],
+        }), cursor)
+
+    ids = set(
+        CambioPedido.objects.filter(modelo=modelo, seq__gt=since, seq__lte=cursor)
+        .values_list("objeto_id", flat=True)
+    )
+    filas = list(queryset.filter(pk__in=ids)) if ids else []
+    presentes = {str(fila.pk) for fila in filas}
+    campo_pk = queryset.model._meta.pk
+
+    return con_cursor(Response({
+        "cursor": cursor,
+        "completo": False,
+        "cambios": serializer_class(filas, many=True, context=context).data,
+        "eliminados": [campo_pk.to_python(i) for i in sorted(ids - presentes)],
+    }), cursor)
@@ -0,0 +1,390 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from cocina.models import PedidoCocina
+from mainApp import contadores
+from .models import Pedido, CambioPedido, OutboxPedido, TransicionPedido, ConflictoEstado
+from . import transiciones
+from .outbox import _aplicar_en_pedido, despachar, encolar_alta_cocina, encolar_estado
+from .sincronizacion import cursor_actual
+
+
+class SincronizacionIncrementalTests(APITestCase):
+    """
+    Tests para los listados con ?since=<cursor>
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='mesero', password='clave12345')
+        self.client.force_authenticate(user=self.user)
+        self.pedido_a = Pedido.objects.create(mesa="1", cliente="Ana", plato="1")
+        self.pedido_b = Pedido.objects.create(mesa="2", cliente="Luis", plato="2")
+
+    def test_listado_completo_devuelve_cursor(self):
+        response = self.client.get(reverse('pedido-list'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('X-Sync-Cursor', response)
+
+    def test_since_devuelve_solo_cambios(self):
+        cursor = self.client.get(reverse('pedido-list'))['X-Sync-Cursor']
+
+        self.pedido_a.cliente = "Ana María"
+        self.pedido_a.save()
+
+        response = self.client.get(reverse('pedido-list'), {'since': cursor})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['cliente'] for p in response.data['cambios']], ["Ana María"])
+        self.assertEqual(response.data['eliminados'], [])
+        self.assertGreater(response.data['cursor'], int(cursor))
+
+        # Sin cambios nuevos la respuesta queda vacía
+        response = self.client.get(reverse('pedido-list'), {'since': response.data['cursor']})
+        self.assertEqual(response.data['cambios'], [])
+
+    def test_cancelado_es_tombstone_en_lista_de_cocina(self):
+        cursor = self.client.get(reverse('cocina-lista'))['X-Sync-Cursor']
+
+        eliminado_id = str(self.pedido_a.id)
+        self.pedido_b.cancelar()
+        self.pedido_a.delete()
+
+        response = self.client.get(reverse('cocina-lista'), {'since': cursor})
+
+        self.assertEqual(response.data['cambios'], [])
+        self.assertEqual(
+            sorted(str(i) for i in response.data['eliminados']),
+            sorted([eliminado_id, str(self.pedido_b.id)])
+        )
+
+    def test_since_en_pedidos_de_cocina(self):
+        cursor = self.client.get(reverse('pedido-cocina-list'))['X-Sync-Cursor']
+        nuevo = PedidoCocina.objects.create(mesa=5, cliente="Eva", descripcion="Sopa")
+        self.pedido_a.cliente = "Otra"
+        self.pedido_a.save()  # cambio de otro modelo: no debe aparecer
+
+        response = self.client.get(reverse('pedido-cocina-list'), {'since': cursor})
+
+        self.assertEqual([p['id'] for p in response.data['cambios']], [nuevo.id])
+
+    def test_cursor_no_salta_cambios_confirmados_tarde(self):
+        cursor = self.client.get(reverse('pedido-list'))['X-Sync-Cursor']
+        self.pedido_a.cliente = "Ana María"
+        self.pedido_a.save()
+        self.pedido_b.cliente = "Luis Alberto"
+        self.pedido_b.save()
+
+        # El cambio de pedido_a "todavía no confirmó": su seq queda como hueco
+        tarde = CambioPedido.objects.filter(objeto_id=str(self.pedido_a.pk)).last()
+        seq = tarde.seq
+        tarde.delete()
+        response = self.client.get(reverse('pedido-list'), {'since': cursor})
+        self.assertEqual(response.data['cursor'], seq - 1)
+
+        # Al confirmar, la siguiente lectura lo recibe (y repite pedido_b)
+        CambioPedido.objects.create(seq=seq, modelo=tarde.modelo, objeto_id=tarde.objeto_id)
+        response = self.client.get(reverse('pedido-list'), {'since': response.data['cursor']})
+        self.assertEqual(
+            sorted(p['cliente'] for p in response.data['cambios']), ["Ana María", "Luis Alberto"]
+        )
+        self.assertEqual(response.data['cursor'], seq + 1)
+
+    def test_hueco_viejo_no_frena_el_cursor(self):
+        self.pedido_a.save()
+        self.pedido_b.save()
+        hueco = CambioPedido.objects.filter(objeto_id=str(self.pedido_a.pk)).last().seq
+        CambioPedido.objects.filter(seq=hueco).delete()  # transacción revertida hace rato
+        CambioPedido.objects.update(creado_en=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(cursor_actual(), hueco + 1)
+
+    def test_since_invalido(self):
+        response = self.client.get(reverse('pedido-list'), {'since': 'ayer'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class OutboxPedidoTests(TestCase):
+    """
+    Tests para la sincronización Pedido <-> PedidoCocina vía outbox
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.pedido = Pedido.objects.create(mesa="3", cliente="Ana", plato="1")
+                encolar_alta_cocina(self.pedido, "Pizza")
+
+    def en_cocina(self):
+        return PedidoCocina.objects.filter(id_modulo3=str(self.pedido.id)).first()
+
+    def test_alta_crea_pedido_en_cocina(self):
+        p_cocina = self.en_cocina()
+        self.assertEqual((p_cocina.mesa, p_cocina.descripcion, p_cocina.estado), (3, "Pizza", "CREADO"))
+        self.assertFalse(OutboxPedido.objects.filter(procesado_en__isnull=True).exists())
+
+    def test_confirmar_pedido_se_refleja_en_cocina(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pedido.confirmar()
+
+        self.assertEqual(self.en_cocina().estado, "EN_PREPARACION")
+
+    def test_listo_en_cocina_se_refleja_en_pedido(self):
+        p_cocina = self.en_cocina()
+        for estado in ("EN_PREPARACION", "LISTO"):
+            p_cocina.estado = estado
+            with self.captureOnCommitCallbacks(execute=True):
+                p_cocina.save()
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, Pedido.Estado.LISTO)
+
+    def test_cancelar_quita_de_cocina(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pedido.cancelar()
+
+        self.assertIsNone(self.en_cocina())
+
+    def test_cambios_sincronizados_no_generan_eco(self):
+        antes = OutboxPedido.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pedido.confirmar()
+
+        # Solo el mensaje hacia cocina: aplicar el cambio no encola uno de vuelta
+        self.assertEqual(OutboxPedido.objects.count(), antes + 1)
+
+    def test_fallo_deja_mensaje_pendiente(self):
+        with patch('pedidos.outbox._aplicar_en_cocina', side_effect=RuntimeError("cocina caída")):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.pedido.confirmar()
+
+        mensaje = OutboxPedido.objects.get(procesado_en__isnull=True)
+        self.assertEqual((mensaje.intentos, mensaje.error), (1, "cocina caída"))
+        self.assertEqual(self.en_cocina().estado, "CREADO")
+
+        # El reintento converge
+        self.assertEqual(despachar(), 1)
+        self.assertEqual(self.en_cocina().estado, "EN_PREPARACION")
+
+    def mensaje_hacia_pedido(self, estado):
+        return OutboxPedido(destino=OutboxPedido.Destino.PEDIDO, pedido_id=str(self.pedido.pk),
+                            accion=OutboxPedido.Accion.ESTADO, datos={"estado": estado})
+
+    def test_mensaje_no_revive_un_pedido_cancelado_despues_de_cargarlo(self):
+        leido = Pedido.objects.get(pk=self.pedido.pk)
+        self.pedido.cancelar()
+
+        _aplicar_en_pedido(self.mensaje_hacia_pedido("LISTO"), {str(self.pedido.pk): leido})
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, Pedido.Estado.CANCELADO)
+
+    def test_mensaje_se_aplica_sobre_el_estado_vigente(self):
+        leido = Pedido.objects.get(pk=self.pedido.pk)
+        self.pedido.confirmar()
+
+        _aplicar_en_pedido(self.mensaje_hacia_pedido("LISTO"), {str(self.pedido.pk): leido})
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, Pedido.Estado.LISTO)
+        self.assertEqual(
+            list(TransicionPedido.objects.filter(objeto_id=str(self.pedido.pk), modelo="pedido")
+                 .values_list("hacia", flat=True)),
+            ["CREADO", "EN_PREPARACION", "LISTO"],
+        )
+
+    def test_un_despacho_por_transaccion(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                for estado in ("EN_PREPARACION", "LISTO", "ENTREGADO"):
+                    encolar_estado(OutboxPedido.Destino.COCINA, self.pedido.pk, estado)
+
+        self.assertEqual(callbacks, [despachar])
+
+    def test_fallo_del_despacho_no_afecta_la_transaccion_confirmada(self):
+        with patch('pedidos.outbox.OutboxPedido.objects.select_for_update',
+                   side_effect=RuntimeError("base caída")):
+            with self.assertLogs(level='ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.pedido.confirmar()
+
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.estado, Pedido.Estado.EN_PREPARACION)
+        self.assertTrue(OutboxPedido.objects.filter(procesado_en__isnull=True).exists())
+
+
+class TransicionPedidoTests(APITestCase):
+    """
+    Tests para el registro de transiciones y los tiempos por etapa
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='mesero', password='clave12345')
+        self.client.force_authenticate(user=self.user)
+
+    def recorrer(self, pedido):
+        for paso in ("confirmar", "marcar_listo", "entregar", "cerrar"):
+            getattr(pedido, paso)()
+
+    def mover(self, pedido, minutos):
+        """Reubica las transiciones del pedido a `minutos` desde hace una hora"""
+        inicio = timezone.now() - timedelta(hours=1)
+        filas = TransicionPedido.objects.filter(modelo="pedido", objeto_id=str(pedido.pk)).order_by("id")
+        for fila, minuto in zip(filas, minutos):
+            TransicionPedido.objects.filter(pk=fila.pk).update(creado_en=inicio + timedelta(minutes=minuto))
+
+    def test_ciclo_completo_registra_cada_transicion(self):
+        pedido = Pedido.objects.create(mesa="1", cliente="Ana", plato="1")
+        self.recorrer(pedido)
+        pedido.cliente = "Ana María"
+        pedido.save()  # sin cambio de estado: no registra
+
+        filas = TransicionPedido.objects.filter(modelo="pedido", objeto_id=str(pedido.pk))
+        self.assertEqual(
+            list(filas.values_list("desde", "hacia")),
+            [("", "CREADO"), ("CREADO", "EN_PREPARACION"), ("EN_PREPARACION", "LISTO"),
+             ("LISTO", "ENTREGADO"), ("ENTREGADO", "CERRADO")],
+        )
+
+    def test_transiciones_de_cocina(self):
+        p_cocina = PedidoCocina.objects.create(mesa=2, cliente="Eva", descripcion="Sopa", id_modulo3="abc")
+        for estado in ("EN_PREPARACION", "LISTO"):
+            p_cocina.estado = estado
+            p_cocina.save()
+
+        self.assertEqual(
+            [(t["desde"], t["hacia"]) for t in transiciones.historial("cocina", "abc")],
+            [(None, "CREADO"), ("CREADO", "EN_PREPARACION"), ("EN_PREPARACION", "LISTO")],
+        )
+
+    def test_tiempos_por_etapa_y_lead_time(self):
+        rapido = Pedido.objects.create(mesa="1", cliente="Ana", plato="1")
+        lento = Pedido.objects.create(mesa="2", cliente="Luis", plato="1")
+        self.recorrer(rapido)
+        self.recorrer(lento)
+        self.mover(rapido, [0, 2, 12, 14, 20])
+        self.mover(lento, [0, 4, 34, 36, 50])
+
+        ahora = timezone.now()
+        inicio, fin = ahora - timedelta(days=1), ahora + timedelta(days=1)
+        etapas = transiciones.tiempos_por_etapa("pedido", inicio, fin)
+        self.assertEqual(etapas["EN_PREPARACION"]["cantidad"], 2)
+        self.assertEqual(etapas["EN_PREPARACION"]["promedio_minutos"], 20)
+        self.assertEqual(etapas["EN_PREPARACION"]["maximo_minutos"], 30)
+        self.assertNotIn("CERRADO", etapas)  # etapa final: no termina
+
+        entre = transiciones.tiempo_entre("pedido", "CREADO", "LISTO", inicio, fin)
+        self.assertEqual((entre["cantidad"], entre["promedio_minutos"]), (2, 23))
+
+        historial = transiciones.historial("pedido", rapido.pk)
+        self.assertEqual([t["minutos"] for t in historial], [2, 10, 2, 6, None])
+
+    def test_endpoints(self):
+        pedido = Pedido.objects.create(mesa="1", cliente="Ana", plato="1")
+        pedido.confirmar()
+
+        response = self.client.get(reverse('pedido-transiciones', args=[pedido.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([t["hacia"] for t in response.data["pedido"]], ["CREADO", "EN_PREPARACION"])
+        self.assertEqual(response.data["cocina"], [])
+
+        response = self.client.get(reverse('pedidos-tiempos'), {"inicio": "CREADO", "fin": "EN_PREPARACION"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["etapas"]["CREADO"]["cantidad"], 1)
+        self.assertEqual(response.data["entre"]["cantidad"], 1)
+
+        for parametros in ({"modelo": "mesa"}, {"desde": "ayer"}):
+            response = self.client.get(reverse('pedidos-tiempos'), parametros)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TransicionCompareAndSetTests(APITestCase):
+    """
+    Tests para las transiciones con UPDATE ... WHERE estado=<leído>
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='mesero', password='clave12345')
+        self.client.force_authenticate(user=self.user)
+        self.pedido = Pedido.objects.create(mesa="4", cliente="Ana", plato="1")
+
+    def test_receptor_de_estado_cambiado_corre_en_ambos_caminos(self):
+        recibidos = []
+
+        def receptor(sender, instance, desde, hacia, **kwargs):
+            recibidos.append((desde, hacia))
+
+        transiciones.estado_cambiado.connect(receptor, sender=Pedido)
+        self.addCleanup(transiciones.estado_cambiado.disconnect, receptor, sender=Pedido)
+
+        self.pedido.confirmar()  # compare-and-set, sin save()
+        self.pedido.estado = Pedido.Estado.LISTO
+        self.pedido.save()
+        self.pedido.cliente = "Ana María"
+        self.pedido.save()  # sin cambio de estado
+
+        self.assertEqual(recibidos, [("CREADO", "EN_PREPARACION"), ("EN_PREPARACION", "LISTO")])
+
+    def test_transicion_sin_lecturas_y_con_sus_efectos(self):
+        # Un primer pedido crea las filas de Contador de EN_PREPARACION
+        Pedido.objects.create(mesa="5", cliente="Luis", plato="1").confirmar()
+        pedido = Pedido.objects.get(pk=self.pedido.pk)
+
+        # SAVEPOINT, UPDATE del pedido, CambioPedido, TransicionPedido, outbox,
+        # 4 contadores (día y global, estado anterior y nuevo) y RELEASE
+        with CaptureQueriesContext(connection) as consultas:
+            pedido.confirmar()
+        self.assertEqual(len(consultas.captured_queries), 10)
+        sentencias = [q["sql"].split()[0] for q in consultas.captured_queries]
+        self.assertNotIn("SELECT", sentencias)
+
+        self.assertEqual(Pedido.objects.get(pk=pedido.pk).estado, Pedido.Estado.EN_PREPARACION)
+        self.assertEqual(
+            TransicionPedido.objects.filter(objeto_id=str(pedido.pk)).last().hacia,
+            Pedido.Estado.EN_PREPARACION,
+        )
+        self.assertEqual(OutboxPedido.objects.filter(pedido_id=str(pedido.pk)).last().datos["estado"],
+                         Pedido.Estado.EN_PREPARACION)
+        _, globales = contadores.leer(timezone.localdate())
+        self.assertEqual(globales["pedido"]["EN_PREPARACION"], 2)
+        self.assertEqual(globales["pedido"]["CREADO"], 0)
+
+        # Un save() posterior de la misma instancia no vuelve a mover los contadores
+        pedido.cliente = "Ana María"
+        pedido.save()
+        _, globales = contadores.leer(timezone.localdate())
+        self.assertEqual(globales["pedido"]["EN_PREPARACION"], 2)
+        self.assertEqual(TransicionPedido.objects.filter(objeto_id=str(pedido.pk)).count(), 2)
+
+    def test_instancia_vieja_recibe_conflicto(self):
+        vieja = Pedido.objects.get(pk=self.pedido.pk)
+        self.pedido.confirmar()
+
+        with self.assertRaises(ConflictoEstado):
+            vieja.cancelar()
+        self.assertEqual(Pedido.objects.get(pk=self.pedido.pk).estado, Pedido.Estado.EN_PREPARACION)
+        self.assertEqual(vieja.estado, Pedido.Estado.CREADO)
+
+    def test_entregar_guarda_entregado_en(self):
+        for paso in ("confirmar", "marcar_listo", "entregar"):
+            getattr(self.pedido, paso)()
+
+        self.assertIsNotNone(Pedido.objects.get(pk=self.pedido.pk).entregado_en)
+
+    def test_api_responde_409_en_conflicto(self):
+        vieja = Pedido.objects.get(pk=self.pedido.pk)
+        self.pedido.cancelar()
+
+        with patch('pedidos.views.PedidoViewSet.get_object', return_value=vieja):
+            response = self.client.post(reverse('pedido-cancelar', args=[self.pedido.pk]))
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
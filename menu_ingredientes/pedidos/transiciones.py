@@ -0,0 +1,124 @@
+"""
+Registro de transiciones de estado y tiempos por etapa.
+
+Las señales post_save de Pedido y PedidoCocina agregan una fila a
+TransicionPedido por cada alta y cada cambio de estado (confirmar,
+marcar_listo, entregar, cerrar, cancelar, PedidoCocinaViewSet.update, el
+outbox...), en la misma transacción que el cambio. Las filas no se modifican.
+
+Los efectos de un cambio de estado de Pedido (registro de cambios,
+transición, outbox hacia cocina, evento SSE, contadores, reservas de stock)
+son receptores de la señal `estado_cambiado`, que se envía tanto desde
+post_save como desde Pedido.cambiar_estado (confirmar, entregar... hacen un
+UPDATE compare-and-set y no pasan por save()). Un efecto nuevo se conecta a
+esa señal y corre en los dos caminos.
+
+El tiempo que un pedido pasó en una etapa es la distancia entre la
+transición que lo llevó a ese estado y la siguiente del mismo pedido: se
+calcula en SQL con LEAD(creado_en) OVER (PARTITION BY objeto_id ORDER BY id),
+sin reconstruir la historia desde actualizado_en.
+"""
+from django.db.models import F, Min, Q, Window
+from django.db.models.functions import Lead
+from django.dispatch import Signal
+
+from .models import Pedido, TransicionPedido
+
+
+def registrar(modelo, objeto_id, desde, hacia):
+    TransicionPedido.objects.create(modelo=modelo, objeto_id=str(objeto_id), desde=desde or "", hacia=hacia)
+
+
+# Enviada con instance, desde y hacia dentro de la transacción del cambio
+estado_cambiado = Signal()
+
+
+def aplicar_efectos(pedido, desde, hacia):
+    """Corre los efectos del cambio de estado de `pedido` (receptores de estado_cambiado)"""
+    estado_cambiado.send(sender=Pedido, instance=pedido, desde=desde, hacia=hacia)
+
+
+def _con_siguiente(queryset):
+    return queryset.annotate(
+        siguiente_en=Window(
+            Lead("creado_en"), partition_by=[F("objeto_id")], order_by=F("id").asc()
+        )
+    )
+
+
+def historial(modelo, objeto_id):
+    """Transiciones de un pedido con los minutos que duró cada etapa (None si sigue en ella)"""
+    filas = _con_siguiente(
+        TransicionPedido.objects.filter(modelo=modelo, objeto_id=str(objeto_id))
+    ).values_list("desde", "hacia", "creado_en", "siguiente_en")
+    return [
+        {
+            "desde": desde or None,
+            "hacia": hacia,
+            "momento": momento,
+            "minutos": _minutos(siguiente - momento) if siguiente else None,
+        }
+        for desde, hacia, momento, siguiente in filas
+    ]
+
+
+def _minutos(delta):
+    return round(delta.total_seconds() / 60, 2)
+
+
+def _resumen(duraciones):
+    duraciones = sorted(duraciones)
+    if not duraciones:
+        return {"cantidad": 0, "promedio_minutos": None, "p50_minutos": None, "p90_minutos": None,
+                "maximo_minutos": None}
+    percentil = lambda p: duraciones[min(len(duraciones) - 1, int(len(duraciones) * p / 100))]
+    return {
+        "cantidad": len(duraciones),
+        "promedio_minutos": round(sum(duraciones) / len(duraciones), 2),
+        "p50_minutos": percentil(50),
+        "p90_minutos": percentil(90),
+        "maximo_minutos": duraciones[-1],
+    }
+
+
+def tiempos_por_etapa(modelo, inicio, fin):
+    """
+    Minutos en cada estado para las etapas que empezaron en [inicio, fin):
+    {estado: {cantidad, promedio_minutos, p50_minutos, p90_minutos, maximo_minutos}}.
+    Las etapas que no terminaron (o los estados finales) no cuentan.
+    """
+    # Sin tope superior en la ventana: la etapa que empieza antes de `fin`
+    # puede terminar después
+    filas = (
+        _con_siguiente(TransicionPedido.objects.filter(modelo=modelo, creado_en__gte=inicio))
+        .order_by("id")
+        .values_list("hacia", "creado_en", "siguiente_en")
+    )
+    duraciones = {}
+    for hacia, momento, siguiente in filas.iterator():
+        if momento < fin and siguiente is not None:
+            duraciones.setdefault(hacia, []).append(_minutos(siguiente - momento))
+    return {estado: _resumen(valores) for estado, valores in duraciones.items()}
+
+
+def tiempo_entre(modelo, estado_inicio, estado_fin, inicio, fin):
+    """
+    Lead time de `estado_inicio` a `estado_fin` (primera llegada a cada uno)
+    de los pedidos que llegaron a `estado_inicio` en [inicio, fin)
+    """
+    # Solo los pedidos que empezaron en el rango (índice modelo + creado_en)
+    empezados = TransicionPedido.objects.filter(
+        modelo=modelo, hacia=estado_inicio, creado_en__gte=inicio, creado_en__lt=fin
+    ).values("objeto_id")
+    pedidos = (
+        TransicionPedido.objects.filter(modelo=modelo, objeto_id__in=empezados)
+        .values("objeto_id")
+        .annotate(
+            t0=Min("creado_en", filter=Q(hacia=estado_inicio)),
+            t1=Min("creado_en", filter=Q(hacia=estado_fin)),
+        )
+        .filter(t0__gte=inicio, t0__lt=fin, t1__isnull=False)
+        .values_list("t0", "t1")
+        .order_by()
+    )
+    return _resumen([_minutos(t1 - t0) for t0, t1 in pedidos if t1 >= t0])
@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import PedidoViewSet, cocina_estado, cocina_list
+from .views import PedidoViewSet, cocina_estado, cocina_list, tiempos_etapas
 
 router = DefaultRouter()
 router.register(r'', PedidoViewSet, basename='pedido')
@@ -8,5 +8,6 @@ router.register(r'', PedidoViewSet, basename='pedido')
 urlpatterns = [
     path("cocina/estado/", cocina_estado, name="cocina-estado"),
     path("cocina/lista/", cocina_list, name="cocina-lista"),
+    path("tiempos/", tiempos_etapas, name="pedidos-tiempos"),
 ]
 urlpatterns += router.urls
@@ -1,80 +1,97 @@
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from .models import Pedido
+from .models import Pedido, CambioPedido, ConflictoEstado
 from .serializers import PedidoSerializer
+from .sincronizacion import leer_since, respuesta_delta, cursor_actual, con_cursor
+from . import transiciones
 
 
 class PedidoViewSet(ModelViewSet):
     queryset = Pedido.objects.all()
     serializer_class = PedidoSerializer
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request, *args, **kwargs):
+        """Listado completo, o solo lo cambiado desde ?since=<cursor> (ver sincronizacion.py)"""
+        since = leer_since(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if since is not None:
+            return respuesta_delta(
+                queryset, CambioPedido.Modelo.PEDIDO, since,
+                self.get_serializer_class(), self.get_serializer_context()
+            )
+        cursor = cursor_actual()
+        return con_cursor(super().list(request, *args, **kwargs), cursor)
+
+    def _transicion(self, pedido, aplicar):
+        """Aplica la transición; 409 si otra operación cambió el estado antes"""
+        try:
+            aplicar()
+        except ConflictoEstado as e:
+            return Response({"detail": e.message}, status=status.HTTP_409_CONFLICT)
+        except Exception as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(pedido)
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["post"])
     def confirmar(self, request, pk=None):
         pedido = self.get_object()
         try:
-            from django.core.exceptions import ValidationError
-            try:
-                from mainApp.views import StockService
-            except Exception:
-                StockService = None
-            # validar y reservar stock: suponemos cantidad 1
-            if StockService:
-                svc = StockService()
-                try:
-                    svc.validar_y_reservar_stock(int(pedido.plato), 1, str(pedido.id))
-                except ValidationError as e:
-                    return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-            pedido.confirmar()
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            from mainApp.views import StockService
+        except Exception:
+            StockService = None
+
+        def reservar_y_confirmar():
+            # La reserva se revierte si la transición pierde la carrera
+            with transaction.atomic():
+                # validar y reservar stock: suponemos cantidad 1
+                if StockService:
+                    StockService().validar_y_reservar_stock(int(pedido.plato), 1, str(pedido.id))
+                pedido.confirmar()
+
+        return self._transicion(pedido, reservar_y_confirmar)
 
     @action(detail=True, methods=["post"])
     def cancelar(self, request, pk=None):
         pedido = self.get_object()
-        try:
-            pedido.cancelar()
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transicion(pedido, pedido.cancelar)
 
     @action(detail=True, methods=["patch"])
     def listo(self, request, pk=None):
         pedido = self.get_object()
-        try:
-            pedido.marcar_listo()
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transicion(pedido, pedido.marcar_listo)
 
     @action(detail=True, methods=["patch"])
     def entregar(self, request, pk=None):
         pedido = self.get_object()
-        try:
-            pedido.entregar()
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transicion(pedido, pedido.entregar)
+
+    @action(detail=True, methods=["get"])
+    def transiciones(self, request, pk=None):
+        """Línea de tiempo del pedido y de su ticket de cocina, con la duración de cada etapa"""
+        pedido = self.get_object()
+        return Response({
+            "pedido": transiciones.historial(CambioPedido.Modelo.PEDIDO, pedido.pk),
+            "cocina": transiciones.historial(CambioPedido.Modelo.COCINA, pedido.pk),
+        })
 
     @action(detail=True, methods=["patch"])
     def cerrar(self, request, pk=None):
         pedido = self.get_object()
-        try:
-            pedido.cerrar()
-            serializer = self.get_serializer(pedido)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._transicion(pedido, pedido.cerrar)
 
 
 @api_view(["POST"])
+@permission_classes([IsAuthenticated])
 def cocina_estado(request):
     pid = request.data.get("pedido_id")
     estado = request.data.get("estado")
@@ -92,9 +109,7 @@ def cocina_estado(request):
                     {"detail": "Solo desde CREADO."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            p.estado = Pedido.Estado.EN_PREPARACION
-            p.full_clean()
-            p.save(update_fields=["estado", "actualizado_en"])
+            p.confirmar()
         elif estado == "LISTO":
             p.marcar_listo()
         elif estado == "CANCELADO":
@@ -105,13 +120,58 @@ def cocina_estado(request):
         return Response(PedidoSerializer(p).data)
     except Pedido.DoesNotExist:
         return Response({"detail": "Pedido no existe."}, status=status.HTTP_404_NOT_FOUND)
+    except ConflictoEstado as e:
+        return Response({"detail": e.message}, status=status.HTTP_409_CONFLICT)
     except Exception as e:
         return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(["GET"])
+@permission_classes([IsAuthenticated])
 def cocina_list(request):
-    activos = Pedido.objects.exclude(
-        estado__in=[Pedido.Estado.CANCELADO, Pedido.Estado.CERRADO]
-    ).order_by("creado_en")
-    return Response(PedidoSerializer(activos, many=True).data)
+    activos = Pedido.objects.activos().order_by("creado_en")
+    # Con ?since= los pedidos cancelados/cerrados llegan como eliminados
+    since = leer_since(request)
+    if since is not None:
+        return respuesta_delta(activos, CambioPedido.Modelo.PEDIDO, since, PedidoSerializer)
+    cursor = cursor_actual()
+    return con_cursor(Response(PedidoSerializer(activos, many=True).data), cursor)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def tiempos_etapas(request):
+    """
+    Minutos por etapa de los pedidos (o tickets de cocina con ?modelo=cocina)
+    cuyas etapas empezaron entre ?desde y ?hasta (YYYY-MM-DD, por defecto hoy).
+    Con ?inicio=<estado>&fin=<estado> agrega el lead time entre ambos estados.
+    """
+    modelo = request.query_params.get("modelo", CambioPedido.Modelo.PEDIDO)
+    if modelo not in CambioPedido.Modelo.values:
+        return Response({"detail": "modelo debe ser pedido o cocina."}, status=status.HTTP_400_BAD_REQUEST)
+
+    hoy = timezone.localdate()
+    fechas = {}
+    for nombre in ("desde", "hasta"):
+        valor = request.query_params.get(nombre)
+        fechas[nombre] = parse_date(valor) if valor else hoy
+        if fechas[nombre] is None:
+            return Response({"detail": f"{nombre} debe tener formato YYYY-MM-DD."},
+                            status=status.HTTP_400_BAD_REQUEST)
+    inicio = timezone.make_aware(datetime.combine(fechas["desde"], time.min))
+    fin = timezone.make_aware(datetime.combine(fechas["hasta"] + timedelta(days=1), time.min))
+
+    datos = {
+        "modelo": modelo,
+        "desde": fechas["desde"],
+        "hasta": fechas["hasta"],
+        "etapas": transiciones.tiempos_por_etapa(modelo, inicio, fin),
+    }
+    estado_inicio, estado_fin = request.query_params.get("inicio"), request.query_params.get("fin")
+    if estado_inicio and estado_fin:
+        datos["entre"] = {
+            "inicio": estado_inicio,
+            "fin": estado_fin,
+            **transiciones.tiempo_entre(modelo, estado_inicio, estado_fin, inicio, fin),
+        }
+    return Response(datos)
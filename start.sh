@@ -3,4 +3,5 @@ set -e
 cd menu_ingredientes
 python manage.py collectstatic --noinput
 python manage.py migrate --noinput
-gunicorn menu_ingredientes.wsgi --log-file -
+# ASGI: el monitor de cocina y las alertas de stock usan Server-Sent Events
+gunicorn menu_ingredientes.asgi -k uvicorn_worker.UvicornWorker --log-file -